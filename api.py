@@ -1,42 +1,261 @@
-from fastapi import FastAPI, Query, HTTPException
-from typing import List, Dict, Any
+from fastapi import FastAPI, Query, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Dict, Any, Optional
 import asyncio
+import json
+import orjson
 import sys
 import os
+import threading
 import time
+from contextlib import asynccontextmanager, nullcontext
 
 # Add current directory to path
 sys.path.append(os.path.abspath('.'))
 
-from fetcher import arxiv_scraper, wikipedia, openalex, crossref, wikidata, websearch, image_scraper
+from fetcher import websearch, image_scraper, doi_resolver
+from fetcher import (
+    admission, batch, browser_pool, content_store, crawl, fanout, jobs, pdf_text, projection, resilience, singleflight, logs,
+    memory, tracing, warmup
+)
+from fetcher.budget import Deadline, COMPLETE, PARTIAL
+from fetcher.compression import CompressionMiddleware
+from fetcher.metrics import ENDPOINT_LATENCY, REQUEST_PEAK_RSS
+from fetcher.singleflight import AsyncSingleFlight
 
-app = FastAPI(title="Deep Research API", version="1.0.0")
+logs.configure()
+log = logs.get_logger('api')
+
+# orjson serialises the large result lists several times faster than json
+app = FastAPI(title="Deep Research API", version="1.0.0", default_response_class=ORJSONResponse)
+app.add_middleware(CompressionMiddleware)
+
+# Identical requests arriving while one is in flight share its response
+_endpoint_flights = {
+    name: AsyncSingleFlight(f"endpoint.{name}") for name in ("deepsearch", "deepresearch", "imagesearch")
+}
+
+BUDGET_QUERY = Query(
+    None, ge=100, le=300000,
+    description="Time budget in milliseconds; work still running when it expires is cancelled and partial results are returned"
+)
+
+DEBUG_QUERY = Query(
+    None,
+    description="Comma-separated debug options: 'timings' attaches the request's span tree, "
+                "'profile' also attaches a sampled profile in collapsed-stack (flame graph) format, "
+                "'memory' attaches the worker's and Chromium's peak memory while the request ran"
+)
+DEBUG_OPTIONS = {"timings", "profile", "memory"}
+# Debug output the caller asked for is kept whatever ``fields`` selects
+DEBUG_KEYS = ("timings", "profile", "memory")
+
+FIELDS_QUERY = Query(
+    None,
+    description="Comma-separated fields to return, dotted for nested ones, e.g. 'query,results.title,results.url'"
+)
+COMPACT_QUERY = Query(
+    False,
+    description="Drop duplicated structures: summaries that repeat the content, null fields, nested price dicts "
+                "and (for images) all_images"
+)
+
+FULL_TEXT_QUERY = Query(
+    False,
+    description="Replace the abstracts of up to five papers with their open-access PDF text, focused on the query"
+)
+
+def _shape(response, fields, compact):
+    return projection.shape(response, fields, compact, keep=DEBUG_KEYS)
+
+# Admission pool for each endpoint. /deepresearch only needs a browser for
+# its web source, which is admitted to the browser pool on its own.
+ENDPOINT_POOLS = {
+    "deepsearch": admission.BROWSER,
+    "imagesearch": admission.BROWSER,
+    "deepresearch": admission.API,
+}
+
+# Requests for this few results are cheap enough to skip ahead of the queue
+CHEAP_NUM_RESULTS = 1
+
+# Hosts without a policy listed by /upstreams, most recently used first
+UPSTREAMS_LISTED_OTHERS = 50
+
+def _lane(num_results):
+    return admission.PRIORITY if num_results <= CHEAP_NUM_RESULTS else admission.NORMAL
+
+def _overloaded(e):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+@asynccontextmanager
+async def _admitted(pool, lane, budget_ms):
+    """
+    Holds an admission slot for the request, answering 503 with Retry-After
+    when it is shed. Yields the request's budget less the time spent queued.
+    """
+    start = time.monotonic()
+    try:
+        admitted_at = await pool.acquire(lane, timeout=budget_ms / 1000 if budget_ms else None)
+    except admission.Overloaded as e:
+        raise _overloaded(e)
+    try:
+        if budget_ms:
+            budget_ms = max(1, budget_ms - int((admitted_at - start) * 1000))
+        yield budget_ms
+    finally:
+        pool.release(admitted_at, lane)
+
+async def _coalesce(endpoint, handler, query, num_results, budget_ms, *params, debug=None):
+    """
+    Runs handler(query, num_results, budget_ms, *params) once for all
+    concurrent identical requests, once the request has been admitted.
+
+    A request that joins one already in flight is not admitted again, as it
+    adds no work. Requests with ``debug`` options run on their own so that
+    their timings and profile describe only that request.
+    """
+    pool, lane = ENDPOINT_POOLS[endpoint], _lane(num_results)
+    if debug:
+        options = _debug_options(debug)
+        async with _admitted(pool, lane, budget_ms) as budget_ms:
+            return await _debug_run(endpoint, handler, query, num_results, budget_ms, *params, options=options)
+
+    query_key = ' '.join(query.split()).casefold()
+    flight = _endpoint_flights[endpoint]
+    key = (query_key, num_results, budget_ms, *params)
+    if flight.in_flight(key):
+        response = await flight.do(key, handler, query, num_results, budget_ms, *params)
+    else:
+        async with _admitted(pool, lane, budget_ms) as remaining_ms:
+            response = await flight.do(key, handler, query, num_results, remaining_ms, *params)
+    response["query"] = query
+    return response
+
+def _debug_options(debug):
+    options = {option.strip() for option in debug.split(",") if option.strip()}
+    unknown = options - DEBUG_OPTIONS
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown debug options: {', '.join(sorted(unknown))}")
+    return options
+
+async def _debug_run(endpoint, handler, query, *params, options):
+    with tracing.trace(endpoint, request_id=logs.request_id.get()) as root, memory.track() as usage:
+        with (tracing.profile() if "profile" in options else nullcontext()) as profiler:
+            response = await handler(query, *params)
+    if "memory" in options:
+        response["memory"] = usage.as_dict()
+    if "timings" in options or "profile" in options:
+        response["timings"] = tracing.timings(root)
+    if "profile" in options:
+        if profiler is None:
+            response["profile"] = {"error": "another request is being profiled"}
+        else:
+            response["profile"] = {
+                "format": "collapsed",
+                "interval_ms": profiler.interval * 1000,
+                "samples": profiler.sample_count,
+                "stacks": profiler.collapsed()
+            }
+    return response
+
+def _overall_status(statuses):
+    return COMPLETE if all(status == COMPLETE for status in statuses) else PARTIAL
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    with memory.track() as usage:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Label by route template so unmatched paths do not create new series
+            route = request.scope.get("route")
+            endpoint = route.path if route is not None else "unmatched"
+            elapsed = time.perf_counter() - start
+            ENDPOINT_LATENCY.labels(endpoint, str(status)).observe(elapsed)
+            peak = usage.as_dict()
+            if peak["peak_rss_mb"] is not None:
+                REQUEST_PEAK_RSS.labels(endpoint, "app").observe(peak["peak_rss_mb"] * 1024 * 1024)
+            if peak["peak_chromium_rss_mb"]:
+                REQUEST_PEAK_RSS.labels(endpoint, "chromium").observe(peak["peak_chromium_rss_mb"] * 1024 * 1024)
+            log.info(
+                "request finished", endpoint=endpoint, status=status, duration_ms=round(elapsed * 1000, 1),
+                peak_rss_mb=peak["peak_rss_mb"], peak_chromium_rss_mb=peak["peak_chromium_rss_mb"]
+            )
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    # Registered last so it runs first and every log line of the request carries the ID
+    request_id = request.headers.get("x-request-id") or logs.new_request_id()
+    logs.request_id.set(request_id)
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.on_event("startup")
+async def startup():
+    await job_queue.start()
+    warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await warmup.stop()
+    await job_queue.stop()
+    await browser_pool.close_pool()
+    pdf_text.shutdown()
 
 @app.get("/deepsearch")
 async def deepsearch(
     query: str = Query(..., description="Search query for web crawling"),
-    num_results: int = Query(3, ge=1, le=20, description="Number of web pages to scrape")
+    num_results: int = Query(3, ge=1, le=20, description="Number of web pages to scrape"),
+    budget_ms: Optional[int] = BUDGET_QUERY,
+    depth: int = Query(
+        0, ge=0, le=5,
+        description="Follow same-site links this many levels from each result page, most relevant first (0: no crawl)"
+    ),
+    max_pages: int = Query(crawl.MAX_PAGES, ge=1, le=200, description="Most pages a crawl loads in total"),
+    debug: Optional[str] = DEBUG_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    compact: bool = COMPACT_QUERY
 ):
     """
     Web-only deep search with vast data collection and price extraction
     """
+    response = await _coalesce("deepsearch", _deepsearch, query, num_results, budget_ms, depth, max_pages, debug=debug)
+    return _shape(response, fields, compact)
+
+async def _deepsearch(query, num_results, budget_ms, depth=0, max_pages=crawl.MAX_PAGES):
     start_time = time.time()
     
     try:
-        results = await websearch.search_and_scrape_web_async(query, num_results)
+        if depth:
+            report = await crawl.crawl_web(query, num_results, Deadline(budget_ms), depth, max_pages)
+        else:
+            report = await websearch.scrape_web(query, num_results, Deadline(budget_ms))
+        results = report['results']
         execution_time = time.time() - start_time
         
         # Calculate stats
-        total_content_length = sum(len(result.get('content', '')) for result in results)
+        total_content_length = sum(result.get('content_length', 0) for result in results)
         total_prices_found = sum(len(result.get('prices', {}).get('all_prices', [])) for result in results)
         
         return {
             "query": query,
+            "status": _overall_status(report['pages'].values()),
             "total_results": len(results),
             "execution_time": round(execution_time, 2),
             "total_content_length": total_content_length,
             "total_prices_found": total_prices_found,
+            "duplicates_removed": len(report['duplicates']),
             "results": results,
+            "pages": report['pages'],
+            "duplicates": report['duplicates'],
             "sources_used": ["Web Search"]
         }
     
@@ -46,97 +265,418 @@ async def deepsearch(
 @app.get("/deepresearch")
 async def deepresearch(
     query: str = Query(..., description="Search query"),
-    num_results: int = Query(3, ge=1, le=10, description="Number of results per source")
+    num_results: int = Query(3, ge=1, le=10, description="Number of results per source"),
+    budget_ms: Optional[int] = BUDGET_QUERY,
+    enrich: bool = Query(False, description="Fetch missing abstracts from DOI landing pages"),
+    full_text: bool = FULL_TEXT_QUERY,
+    debug: Optional[str] = DEBUG_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    compact: bool = COMPACT_QUERY
 ):
     """
     Comprehensive search across academic databases + web with price extraction
     """
+    response = await _coalesce(
+        "deepresearch", _deepresearch, query, num_results, budget_ms, enrich, full_text, debug=debug
+    )
+    return _shape(response, fields, compact)
+
+async def _deepresearch(query, num_results, budget_ms, enrich, full_text=False, web_lane=None):
     start_time = time.time()
-    all_results = []
-    sources_used = []
-    
-    # Academic sources
-    try:
-        arxiv_results = arxiv_scraper.search_arxiv(query, num_results)
-        if arxiv_results:
-            all_results.extend(arxiv_results)
-            sources_used.append("arXiv")
-    except: pass
-    
-    try:
-        openalex_results = openalex.search_openalex(query, num_results)
-        if openalex_results:
-            all_results.extend(openalex_results)
-            sources_used.append("OpenAlex")
-    except: pass
-    
-    try:
-        crossref_results = crossref.search_crossref(query, num_results)
-        if crossref_results:
-            all_results.extend(crossref_results)
-            sources_used.append("CrossRef")
-    except: pass
-    
-    try:
-        wiki_results = wikipedia.get_wikipedia_articles([query])
-        if wiki_results:
-            all_results.extend(wiki_results)
-            sources_used.append("Wikipedia")
-    except: pass
+    deadline = Deadline(budget_ms)
+    web_lane = web_lane or _lane(num_results)
+
+    def web_admission():
+        # The web source waits for a browser slot alongside the API sources;
+        # if it is shed, the response carries the API results alone
+        return admission.BROWSER.admit(web_lane, timeout=deadline.remaining())
     
-    try:
-        wikidata_results = wikidata.search_wikidata(query, num_results)
-        if wikidata_results:
-            all_results.extend(wikidata_results)
-            sources_used.append("Wikidata")
-    except: pass
+    with tracing.span('sources'):
+        report = await fanout.run_sources(query, num_results, deadline, web_admission=web_admission)
+    all_results = report['results']
     
-    # Web search with price extraction
-    try:
-        web_results = await websearch.search_and_scrape_web_async(query, num_results)
-        if web_results:
-            all_results.extend(web_results)
-            sources_used.append("Web Search")
-    except Exception as e:
-        print(f"Web search error: {e}")
+    if enrich and not deadline.expired():
+        with tracing.span('enrich'):
+            all_results = await asyncio.get_running_loop().run_in_executor(
+                None, tracing.bind(doi_resolver.enhance_results_with_abstracts), all_results, deadline
+            )
+
+    if full_text and not deadline.expired():
+        with tracing.span('full_text'):
+            all_results = await asyncio.get_running_loop().run_in_executor(
+                None, tracing.bind(pdf_text.enhance_results_with_full_text), all_results, query, deadline
+            )
     
     execution_time = time.time() - start_time
     
+    return _research_response(query, all_results, report, execution_time)
+
+def _research_response(query, results, report, execution_time):
     return {
         "query": query,
-        "total_results": len(all_results),
+        "status": _overall_status(report['source_status'].values()),
+        "total_results": len(results),
         "execution_time": round(execution_time, 2),
-        "results": all_results,
-        "sources_used": sources_used
+        "results": results,
+        "sources_used": report['sources_used'],
+        "sources_skipped": report['sources_skipped'],
+        "source_status": report['source_status'],
+        "pages": report['pages']
+    }
+
+MAX_BATCH_QUERIES = 500
+
+class BatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES, description="Search queries")
+    num_results: int = Field(3, ge=1, le=10, description="Number of results per source and query")
+    budget_ms: Optional[int] = Field(
+        None, ge=100, le=3600000, description="Time budget in milliseconds for the whole batch"
+    )
+    enrich: bool = Field(False, description="Fetch missing abstracts from DOI landing pages")
+    full_text: bool = Field(False, description="Replace paper abstracts with the text of their open-access PDFs")
+    fields: Optional[str] = Field(None, description="Fields to return per query line, as for /deepresearch")
+    compact: bool = Field(False, description="Drop duplicated structures from each query line")
+
+@app.post("/deepresearch/batch")
+async def deepresearch_batch(request: BatchRequest):
+    """
+    Comprehensive research for many queries at once, streamed as NDJSON
+
+    One line per query is written as soon as it finishes, in completion order
+    and tagged with its ``index`` in ``queries``; each has the same fields as a
+    /deepresearch response. A final ``{"done": true, ...}`` line closes the stream.
+    """
+    try:
+        # Turned away up front when the queue is already full; the slot itself
+        # is taken by the stream, which always runs to release it
+        admission.BROWSER.check()
+    except admission.Overloaded as e:
+        raise _overloaded(e)
+    return StreamingResponse(_batch_lines(request), media_type="application/x-ndjson")
+
+async def _batch_lines(request):
+    timeout = request.budget_ms / 1000 if request.budget_ms else None
+    try:
+        async with admission.BROWSER.admit(timeout=timeout):
+            async for line in _batch_events(request):
+                yield orjson.dumps(line) + b"\n"
+    except admission.Overloaded as e:
+        yield orjson.dumps({"done": True, "error": str(e), "retry_after": e.retry_after}) + b"\n"
+
+async def _batch_events(request):
+    start_time = time.time()
+    deadline = Deadline(request.budget_ms)
+    statuses = []
+    failed = 0
+    async for index, query, report in batch.run_batch(
+        request.queries, request.num_results, deadline, request.enrich, request.full_text
+    ):
+        if "error" in report:
+            failed += 1
+            line = {"index": index, "query": query, "error": report["error"]}
+        else:
+            line = {"index": index, **_research_response(query, report['results'], report, report['execution_time'])}
+            statuses.append(line["status"])
+            line = projection.shape(line, request.fields, request.compact, keep=("index",))
+        yield line
+    yield {
+        "done": True,
+        "status": _overall_status(statuses) if not failed else PARTIAL,
+        "total_queries": len(request.queries),
+        "failed_queries": failed,
+        "execution_time": round(time.time() - start_time, 2)
     }
 
 @app.get("/imagesearch")
 async def imagesearch(
     query: str = Query(..., description="Search query for images"),
-    num_results: int = Query(3, ge=1, le=10, description="Number of web pages to scrape for images")
+    num_results: int = Query(3, ge=1, le=10, description="Number of web pages to scrape for images"),
+    budget_ms: Optional[int] = BUDGET_QUERY,
+    debug: Optional[str] = DEBUG_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    compact: bool = COMPACT_QUERY
 ):
     """
     Search and extract image URLs from web pages
     """
+    response = await _coalesce("imagesearch", _imagesearch, query, num_results, budget_ms, debug=debug)
+    return _shape(response, fields, compact)
+
+async def _imagesearch(query, num_results, budget_ms):
     start_time = time.time()
     
     try:
-        results = await image_scraper.search_and_scrape_images(query, num_results)
+        results = await image_scraper.search_and_scrape_images(query, num_results, Deadline(budget_ms))
         execution_time = time.time() - start_time
         
         return {
             "query": query,
+            "status": _overall_status(results['pages'].values()),
             "total_images": results['total_images'],
             "pages_scraped": results['pages_scraped'],
             "execution_time": round(execution_time, 2),
             "page_results": results['page_results'],
             "all_images": results['all_images'],
+            "pages": results['pages'],
             "sources_used": ["Image Search"]
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image search failed: {str(e)}")
 
+class DeepSearchJob(BaseModel):
+    query: str
+    num_results: int = Field(3, ge=1, le=20)
+    budget_ms: Optional[int] = Field(None, ge=100, le=3600000)
+    depth: int = Field(0, ge=0, le=5)
+    max_pages: int = Field(crawl.MAX_PAGES, ge=1, le=1000)
+
+class DeepResearchJob(BaseModel):
+    query: str
+    num_results: int = Field(3, ge=1, le=10)
+    budget_ms: Optional[int] = Field(None, ge=100, le=3600000)
+    enrich: bool = False
+    full_text: bool = False
+
+class FetchAllJob(BaseModel):
+    topic: str
+    timeout: int = Field(20, ge=1, le=3600, description="Total budget in seconds")
+
+# Jobs are already queued by the job queue, so they wait for admission in the
+# background lane: without a time limit and behind interactive requests
+
+async def _deepsearch_job(params, progress):
+    async with admission.BROWSER.admit(admission.BACKGROUND):
+        return await _deepsearch(
+            params["query"], params["num_results"], params["budget_ms"], params.get("depth", 0),
+            params.get("max_pages", crawl.MAX_PAGES)
+        )
+
+async def _deepresearch_job(params, progress):
+    async with admission.API.admit(admission.BACKGROUND):
+        return await _deepresearch(
+            params["query"], params["num_results"], params["budget_ms"], params["enrich"], params.get("full_text", False),
+            admission.BACKGROUND
+        )
+
+async def _batch_job(params, progress):
+    request = BatchRequest(**params)
+    lines = []
+    async with admission.BROWSER.admit(admission.BACKGROUND):
+        async for line in _batch_events(request):
+            if line.get("done"):
+                summary = line
+            else:
+                lines.append(line)
+                progress({"completed": len(lines), "total": len(request.queries)})
+    lines.sort(key=lambda line: line["index"])
+    return {**summary, "results": lines}
+
+async def _fetch_all_job(params, progress):
+    # Imported here: the cleaner pipeline is only needed by this job type
+    from cleaner import cleaner
+    start_time = time.time()
+    source_status = {}
+    # Cancelling the job only abandons the await; the flag stops the
+    # cleaner's thread and terminates its web search process and browser
+    stop = threading.Event()
+    # The cleaner's web search launches its own Chromium
+    async with admission.BROWSER.admit(admission.BACKGROUND):
+        try:
+            results = await asyncio.to_thread(
+                cleaner.run_all_fetchers_with_timeout, params["topic"], None, params["timeout"], source_status, stop
+            )
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+    return {
+        "topic": params["topic"],
+        "status": _overall_status(source_status.values()),
+        "total_results": len(results),
+        "execution_time": round(time.time() - start_time, 2),
+        "results": results,
+        "source_status": source_status
+    }
+
+# Job type -> (parameter model, handler)
+JOB_TYPES = {
+    "deepsearch": (DeepSearchJob, _deepsearch_job),
+    "deepresearch": (DeepResearchJob, _deepresearch_job),
+    "batch": (BatchRequest, _batch_job),
+    "fetch_all": (FetchAllJob, _fetch_all_job),
+}
+
+job_queue = jobs.JobQueue()
+for job_type, (_, handler) in JOB_TYPES.items():
+    job_queue.register(job_type, handler)
+
+SSE_HEARTBEAT_SECONDS = 15
+
+class JobRequest(BaseModel):
+    type: str = Field(..., description=f"One of: {', '.join(JOB_TYPES)}")
+    params: Dict[str, Any] = Field(default_factory=dict, description="Parameters of the job type")
+    priority: int = Field(0, ge=0, le=9, description="Higher priorities run first")
+
+def _job_view(job):
+    view = {key: job[key] for key in ("id", "type", "status", "priority", "params", "error") if key in job}
+    for key in ("created_at", "started_at", "finished_at"):
+        view[key] = job.get(key)
+    if job.get("started_at"):
+        view["wait_seconds"] = round(job["started_at"] - job["created_at"], 3)
+    if job.get("finished_at"):
+        view["total_seconds"] = round(job["finished_at"] - job["created_at"], 3)
+    if "result" in job:
+        view["result"] = job["result"]
+    view["links"] = {"self": f"/jobs/{job['id']}", "events": f"/jobs/{job['id']}/events"}
+    return view
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Queues a long-running search and returns its job ID at once
+
+    Poll ``/jobs/{id}`` or subscribe to ``/jobs/{id}/events`` for its status and result.
+    """
+    spec = JOB_TYPES.get(request.type)
+    if spec is None:
+        raise HTTPException(status_code=422, detail=f"Unknown job type '{request.type}'; expected one of: {', '.join(JOB_TYPES)}")
+    model, _ = spec
+    try:
+        params = model(**request.params).model_dump()
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    try:
+        job = await job_queue.submit(request.type, params, request.priority)
+    except jobs.QueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Job queue is full: {e}", headers={"Retry-After": "30"})
+    return _job_view(job)
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    include_result: bool = Query(True, description="Include the result once the job has finished"),
+    fields: Optional[str] = FIELDS_QUERY,
+    compact: bool = COMPACT_QUERY
+):
+    """
+    Status, timings and (once finished) the result of a job; ``fields`` and ``compact`` apply to the result
+    """
+    job = await job_queue.get(job_id, with_result=include_result)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (it may have expired)")
+    if job.get("result") is not None:
+        job["result"] = _shape(job["result"], fields, compact)
+    return _job_view(job)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events for a job: its state changes and progress, ending with the finished job and its result
+    """
+    if await job_queue.get(job_id, with_result=False) is None:
+        raise HTTPException(status_code=404, detail="Job not found (it may have expired)")
+    return StreamingResponse(_job_event_stream(job_id), media_type="text/event-stream")
+
+async def _job_event_stream(job_id):
+    async for event in job_queue.subscribe(job_id, heartbeat=SSE_HEARTBEAT_SECONDS):
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+        if event["status"] in jobs.FINISHED:
+            job = await job_queue.get(job_id)
+            event = _job_view(job) if job is not None else event
+        yield f"event: {event['status']}\ndata: {orjson.dumps(event).decode()}\n\n"
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancels a queued or running job
+    """
+    job = await job_queue.get(job_id, with_result=False)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (it may have expired)")
+    if not await job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return {"id": job_id, "status": jobs.CANCELLED}
+
+@app.get("/content/{handle}")
+async def get_content(
+    handle: str,
+    request: Request,
+    offset: int = Query(0, ge=0, description="Character offset of the page"),
+    limit: Optional[int] = Query(
+        None, ge=1, le=content_store.MAX_PAGE_CHARS, description="Characters per page (default and maximum 100000)"
+    )
+):
+    """
+    Full text behind a result's content_handle, paged by character offset.
+
+    With a ``Range: bytes=...`` header the UTF-8 text is returned as
+    text/plain instead, as a standard 206 partial response.
+    """
+    try:
+        text = await asyncio.to_thread(content_store.load, handle)
+    except Exception as e:
+        log.warning("content load failed", handle=handle, error=repr(e))
+        raise HTTPException(status_code=502, detail="Content could not be loaded from its source")
+    if text is None:
+        raise HTTPException(status_code=404, detail="Content not found (it may have expired)")
+
+    range_header = request.headers.get("range")
+    if range_header is None:
+        return content_store.read_text(handle, text, offset, limit)
+
+    body = text.encode("utf-8")
+    try:
+        start, end = content_store.parse_range(range_header, len(body))
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{len(body)}"})
+    return Response(
+        body[start:end + 1],
+        status_code=206,
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Range": f"bytes {start}-{end}/{len(body)}", "Accept-Ranges": "bytes"}
+    )
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness for load balancers and autoscalers: 503 until the background
+    warm-up steps chosen with PREWARM have finished
+    """
+    status = warmup.status()
+    return ORJSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/upstreams")
+async def upstreams():
+    """
+    Circuit breaker and rate limiter state for every API host with a policy and
+    the most recently contacted other hosts
+    """
+    return {
+        "hosts": resilience.upstream_states(others=UPSTREAMS_LISTED_OTHERS),
+        "other_hosts_tracked": resilience.other_host_count(),
+    }
+
+@app.get("/stats")
+async def stats():
+    """
+    Request coalescing counters, shared browser pool occupancy, admission pools and job queue depth
+    """
+    return {
+        "coalescing": singleflight.stats(),
+        "browser_pool": browser_pool.pool_stats(),
+        "admission": admission.stats(),
+        "jobs": job_queue.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: per-source, per-stage and per-endpoint latency, errors, cache and pool state
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""
+Micro-benchmark for the per-page extraction hot paths.
+
+Runs HTML parsing plus each extractor over the versioned corpus in
+bench/corpus. The extractors are ``AdvancedWebScraper.extract_prices``,
+``extract_vast_content`` and ``clean_text``,
+``ImageScraper.extract_images_from_soup``, and the two main-content
+extractors in fetcher/extraction.py, ``extract_main_content`` and the
+selector-based ``extract_by_selectors`` it replaced. For each page and
+function it reports:
+
+- median and best wall time
+- peak traced allocation
+- a digest of the output, so behaviour changes show up next to speed changes
+
+Usage (from the repository root):
+
+    python -m bench.extraction --update-baseline     # record bench/corpus/baseline.json
+    python -m bench.extraction --check               # fail on regressions or output changes
+    python -m bench.extraction --page wide-dom --function extract_prices
+    python -m bench.extraction --quality             # main-content accuracy against gold text
+
+``--quality`` runs both main-content extractors over every page in
+bench/fixtures/pages that has a hand-written ``.txt`` of its main text
+beside it, and reports word-level precision, recall and F1.
+"""
+import argparse
+import collections
+import glob
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from bench import pagegen
+from fetcher import extraction
+from fetcher.image_scraper import ImageScraper
+from fetcher.websearch import AdvancedWebScraper
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+MANIFEST_PATH = os.path.join(CORPUS_DIR, 'manifest.json')
+BASELINE_PATH = os.path.join(CORPUS_DIR, 'baseline.json')
+GOLD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pages')
+
+# A function counts as regressed when its median time grows by more than this
+DEFAULT_THRESHOLD = 0.20
+
+# Medians under this are dominated by timer noise and never flagged
+NOISE_FLOOR_MS = 0.5
+
+def load_corpus():
+    """
+    Loads every page in the manifest, rebuilding generated pages from their
+    seeds, and checks each against its recorded SHA-256.
+    """
+    with open(MANIFEST_PATH, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    pages = []
+    for entry in manifest['pages']:
+        if 'file' in entry:
+            with open(os.path.join(CORPUS_DIR, entry['file']), 'rb') as f:
+                html = f.read()
+        else:
+            html = pagegen.GENERATORS[entry['generator']](**entry['params']).encode('utf-8')
+        digest = hashlib.sha256(html).hexdigest()
+        if digest != entry['sha256']:
+            raise SystemExit(
+                f"Corpus page {entry['name']} does not match the manifest (sha256 {digest[:12]}); "
+                f"bump the manifest version and re-record the baseline if the change is intended"
+            )
+        pages.append(dict(entry, html=html.decode('utf-8')))
+    return manifest['version'], pages
+
+def _digest(output):
+    return hashlib.sha256(json.dumps(output, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+def _parse(html):
+    BeautifulSoup(html, 'html.parser')
+
+def _run_sync(coroutine):
+    # extract_vast_content is async but never awaits, so drive it directly
+    # rather than paying for an event loop on every call
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("coroutine suspended; it cannot be benchmarked synchronously")
+
+def _cases(page, web_scraper, image_scraper):
+    """
+    Yields (function name, setup, run) for one page.
+
+    ``setup`` builds fresh input outside the timed region, since
+    extract_vast_content strips elements from the soup it is given.
+    """
+    html, url = page['html'], page['url']
+
+    def fresh_soup():
+        return BeautifulSoup(html, 'html.parser')
+
+    yield 'parse', lambda: html, _parse
+    yield 'extract_prices', fresh_soup, lambda soup: web_scraper.extract_prices(soup, url)
+    yield 'extract_vast_content', fresh_soup, lambda soup: _run_sync(web_scraper.extract_vast_content(soup))
+    yield 'clean_text', lambda: fresh_soup().get_text(), web_scraper.clean_text
+    yield 'extract_images_from_soup', fresh_soup, lambda soup: image_scraper.extract_images_from_soup(soup, url)
+    yield 'extract_main_content', fresh_soup, extraction.extract_main_content
+    yield 'extract_by_selectors', fresh_soup, extraction.extract_by_selectors
+
+def measure(setup, run, repeat):
+    """
+    Times ``run`` over ``repeat`` fresh inputs, then runs it once more under
+    tracemalloc for its peak allocation.
+    """
+    timings = []
+    output = None
+    for _ in range(repeat):
+        value = setup()
+        start = time.perf_counter()
+        output = run(value)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    value = setup()
+    tracemalloc.start()
+    try:
+        run(value)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'best_ms': round(min(timings), 3),
+        'peak_alloc_kb': round(peak / 1024, 1),
+        'output_digest': _digest(output),
+    }
+
+def run_benchmarks(pages, functions=None, repeat=5):
+    web_scraper = AdvancedWebScraper()
+    image_scraper = ImageScraper()
+    results = {}
+    for page in pages:
+        for name, setup, run in _cases(page, web_scraper, image_scraper):
+            if functions and name not in functions:
+                continue
+            try:
+                row = measure(setup, run, repeat)
+            except Exception as e:
+                row = {'error': repr(e)}
+            results[f"{page['name']}/{name}"] = row
+            print(f"{page['name']:<22} {name:<26} " + (
+                f"{row['median_ms']:>10.3f} ms  {row['peak_alloc_kb']:>10.1f} KB  {row['output_digest']}"
+                if 'error' not in row else row['error']
+            ), flush=True)
+    return results
+
+_WORD = re.compile(r'\w+')
+
+def overlap_scores(extracted, gold):
+    """
+    Word-level precision, recall and F1 of extracted text against the gold
+    text, counting repeated words as often as they occur in both.
+    """
+    got = collections.Counter(_WORD.findall(extracted.lower()))
+    want = collections.Counter(_WORD.findall(gold.lower()))
+    common = sum((got & want).values())
+    precision = common / sum(got.values()) if got else 0.0
+    recall = common / sum(want.values()) if want else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if common else 0.0
+    return {'precision': round(precision, 3), 'recall': round(recall, 3), 'f1': round(f1, 3)}
+
+def run_quality():
+    """Scores both main-content extractors on every page with gold text."""
+    extractors = {
+        'extract_main_content': extraction.extract_main_content,
+        'extract_by_selectors': extraction.extract_by_selectors,
+    }
+    totals = collections.defaultdict(list)
+    print(f"{'page':<22} {'function':<26} {'precision':>9} {'recall':>9} {'f1':>9}")
+    for gold_path in sorted(glob.glob(os.path.join(GOLD_DIR, '*.txt'))):
+        html_path = gold_path[:-4] + '.html'
+        if not os.path.exists(html_path):
+            continue
+        with open(html_path, encoding='utf-8') as f:
+            html = f.read()
+        with open(gold_path, encoding='utf-8') as f:
+            gold = f.read()
+        name = os.path.basename(html_path)[:-5]
+        for function, extract in extractors.items():
+            row = overlap_scores(extract(BeautifulSoup(html, 'html.parser')), gold)
+            totals[function].append(row['f1'])
+            print(f"{name:<22} {function:<26} {row['precision']:>9.3f} {row['recall']:>9.3f} {row['f1']:>9.3f}")
+    print()
+    for function, scores in totals.items():
+        print(f"{function:<26} mean F1 {statistics.mean(scores):.3f} over {len(scores)} pages")
+
+def check(results, baseline, threshold):
+    """
+    Returns the regressions and output changes against a baseline, as
+    human-readable lines.
+    """
+    problems = []
+    for key, row in results.items():
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+        if 'error' in row or 'error' in before:
+            if row.get('error') != before.get('error'):
+                problems.append(f"{key}: error changed from {before.get('error')} to {row.get('error')}")
+            continue
+        if row['output_digest'] != before['output_digest']:
+            problems.append(f"{key}: output changed ({before['output_digest']} -> {row['output_digest']})")
+        if row['median_ms'] > NOISE_FLOOR_MS and row['median_ms'] > before['median_ms'] * (1 + threshold):
+            change = (row['median_ms'] / before['median_ms'] - 1) * 100
+            problems.append(f"{key}: {before['median_ms']} ms -> {row['median_ms']} ms ({change:+.0f}%)")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--page', action='append', help="Only run this corpus page (repeatable)")
+    parser.add_argument('--function', action='append', help="Only run this function (repeatable)")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per page and function")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="Allowed median slowdown, as a fraction")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--check', action='store_true', help="Exit non-zero on regressions or changed output")
+    parser.add_argument('--update-baseline', action='store_true', help="Record this run as the new baseline")
+    parser.add_argument('--quality', action='store_true', help="Score main-content extraction against gold text instead")
+    args = parser.parse_args()
+
+    if args.quality:
+        run_quality()
+        return
+
+    version, pages = load_corpus()
+    if args.page:
+        pages = [page for page in pages if page['name'] in args.page]
+    results = run_benchmarks(pages, args.function, args.repeat)
+
+    if args.update_baseline:
+        recorded = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                previous = json.load(f)
+            # A filtered run only replaces the entries it measured
+            if previous.get('corpus_version') == version:
+                recorded = previous['results']
+        recorded.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'corpus_version': version, 'python': sys.version.split()[0], 'results': recorded}, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline yet; run with --update-baseline to record one")
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('corpus_version') != version:
+        print(f"\nBaseline is for corpus version {baseline.get('corpus_version')}, not {version}; re-record it")
+        sys.exit(1 if args.check else 0)
+
+    problems = check(results, baseline, args.threshold)
+    print("\nNo regressions against the baseline" if not problems else "\nChanges against the baseline:")
+    for problem in problems:
+        print(f"  {problem}")
+    if problems and args.check:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
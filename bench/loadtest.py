@@ -0,0 +1,310 @@
+"""
+Offline load test for api.py.
+
+Starts the stand-in upstreams from stubs.py and runs the app in a
+subprocess that points at them. It then drives the endpoints at each
+concurrency level and reports:
+
+- throughput
+- latency percentiles
+- peak memory of the app and its Chromium children
+- Chromium process counts
+
+Usage (from the repository root):
+
+    python -m bench.loadtest --concurrency 1,4,16 --requests 40 --save bench/baseline.json
+    python -m bench.loadtest --concurrency 1,4,16 --requests 40 --compare bench/baseline.json
+
+Memory and process counts are read from /proc, so they are only reported on
+Linux; the stubs also rely on the whole 127.0.0.0/8 range being loopback.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from bench.stubs import Faults, StubCluster
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+ENDPOINTS = {
+    'deepsearch': {'num_results': 3},
+    'deepresearch': {'num_results': 3},
+    'imagesearch': {'num_results': 3},
+}
+
+# Chromium's process names vary by build and platform
+CHROMIUM_NAMES = ('chrome', 'chromium', 'headless_shell')
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _children(pid):
+    """All descendant PIDs of a process, from /proc."""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, so split after its closing paren
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+def _rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def _comm(pid):
+    try:
+        with open(f'/proc/{pid}/comm') as f:
+            return f.read().strip().lower()
+    except OSError:
+        return ''
+
+class ResourceSampler:
+    """Polls the app's memory and Chromium process count while a run is going."""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.enabled = platform.system() == 'Linux'
+        self.peak_app_rss_mb = 0.0
+        self.peak_total_rss_mb = 0.0
+        self.peak_chromium_processes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            app_rss = _rss_mb(self.pid)
+            children = _children(self.pid)
+            chromium = [child for child in children if any(name in _comm(child) for name in CHROMIUM_NAMES)]
+            total_rss = app_rss + sum(_rss_mb(child) for child in children)
+            self.peak_app_rss_mb = max(self.peak_app_rss_mb, app_rss)
+            self.peak_total_rss_mb = max(self.peak_total_rss_mb, total_rss)
+            self.peak_chromium_processes = max(self.peak_chromium_processes, len(chromium))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self.enabled:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self.enabled:
+            self._thread.join()
+
+    def report(self):
+        if not self.enabled:
+            return {}
+        return {
+            'peak_app_rss_mb': round(self.peak_app_rss_mb, 1),
+            'peak_total_rss_mb': round(self.peak_total_rss_mb, 1),
+            'peak_chromium_processes': self.peak_chromium_processes,
+        }
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def start_app(stubs, port, unthrottled):
+    env = dict(os.environ, **stubs.env())
+    command = [
+        sys.executable, os.path.join(ROOT, 'bench', 'serve_app.py'),
+        '--port', str(port), '--host-map', json.dumps(stubs.host_map()),
+    ]
+    if unthrottled:
+        command.append('--unthrottled')
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited during startup with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/upstreams", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("App did not become ready within 60 s")
+
+def run_level(base_url, endpoint, concurrency, total_requests, params, repeat_query, run_id):
+    """
+    Sends ``total_requests`` requests to one endpoint from ``concurrency``
+    client threads.
+    """
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_maxsize=concurrency))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            # Distinct queries by default, so caches and coalescing do not hide upstream work
+            query = "protein structure prediction" if repeat_query else f"protein structure prediction {run_id}-{index}"
+            start = time.perf_counter()
+            try:
+                response = session.get(f"{base_url}/{endpoint}", params=dict(params, query=query), timeout=120)
+                outcome = None if response.ok else str(response.status_code)
+            except requests.RequestException as e:
+                outcome = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if outcome:
+                    errors[outcome] = errors.get(outcome, 0) + 1
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    latency_ms = {}
+    if latencies:
+        for name, pct in (('p50', 50), ('p90', 90), ('p95', 95), ('p99', 99)):
+            latency_ms[name] = round(percentile(latencies, pct) * 1000, 1)
+        latency_ms['max'] = round(latencies[-1] * 1000, 1)
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'wall_seconds': round(wall, 2),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'latency_ms': latency_ms,
+    }
+
+def compare(results, baseline):
+    """Prints throughput and p95 changes against a saved baseline run."""
+    previous = {(row['endpoint'], row['concurrency']): row for row in baseline['results']}
+    print("\nChange vs baseline:")
+    for row in results:
+        before = previous.get((row['endpoint'], row['concurrency']))
+        if not before or not before['latency_ms'] or not row['latency_ms']:
+            continue
+        rps_change = (row['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] * 100
+        p95_change = (row['latency_ms']['p95'] - before['latency_ms']['p95']) / before['latency_ms']['p95'] * 100
+        print(f"  {row['endpoint']:<13} c={row['concurrency']:<3} throughput {rps_change:+6.1f}%   p95 {p95_change:+6.1f}%")
+
+def print_table(results):
+    print(f"\n{'endpoint':<13} {'conc':>4} {'reqs':>5} {'err':>4} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'rss MB':>8} {'chrome':>6}")
+    for row in results:
+        latency = row['latency_ms']
+        print(
+            f"{row['endpoint']:<13} {row['concurrency']:>4} {row['requests']:>5} {sum(row['errors'].values()):>4} "
+            f"{row['throughput_rps'] or 0:>7} {latency.get('p50', '-'):>8} {latency.get('p95', '-'):>8} "
+            f"{latency.get('p99', '-'):>8} {row.get('peak_total_rss_mb', '-'):>8} {row.get('peak_chromium_processes', '-'):>6}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help="Comma-separated endpoints to drive")
+    parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated client concurrency levels")
+    parser.add_argument('--requests', type=int, default=40, help="Requests per endpoint and concurrency level")
+    parser.add_argument('--latency-ms', type=float, default=50, help="Injected upstream latency")
+    parser.add_argument('--jitter-ms', type=float, default=15, help="Standard deviation of the injected latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of upstream requests answered with 503")
+    parser.add_argument(
+        '--upstream', action='append', default=[], metavar='NAME=LATENCY_MS[:ERROR_RATE]',
+        help="Per-upstream override, e.g. crossref=400:0.05 (repeatable)"
+    )
+    parser.add_argument('--repeat-query', action='store_true', help="Send the same query every time (measures caching and coalescing)")
+    parser.add_argument('--unthrottled', action='store_true', help="Lift the per-host and per-API rate limits")
+    parser.add_argument('--budget-ms', type=int, help="Pass budget_ms to every request")
+    parser.add_argument('--save', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="Baseline JSON file from an earlier --save to compare against")
+    args = parser.parse_args()
+
+    default_faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate)
+    faults = {}
+    for override in args.upstream:
+        name, _, spec = override.partition('=')
+        latency, _, error_rate = spec.partition(':')
+        faults[name] = Faults(float(latency), args.jitter_ms, float(error_rate or args.error_rate))
+
+    stubs = StubCluster(default_faults, faults).start()
+    app, base_url = start_app(stubs, _free_port(), args.unthrottled)
+    results = []
+    try:
+        for endpoint in args.endpoints.split(','):
+            params = dict(ENDPOINTS[endpoint])
+            if args.budget_ms:
+                params['budget_ms'] = args.budget_ms
+            # One untimed request launches Chromium and fills connection pools
+            requests.get(f"{base_url}/{endpoint}", params=dict(params, query="warm up"), timeout=120)
+            for concurrency in (int(level) for level in args.concurrency.split(',')):
+                with ResourceSampler(app.pid) as sampler:
+                    row = run_level(
+                        base_url, endpoint, concurrency, args.requests, params,
+                        args.repeat_query, f"{endpoint}-{concurrency}"
+                    )
+                row.update(sampler.report())
+                results.append(row)
+                print(f"{endpoint} c={concurrency}: {row['throughput_rps']} req/s, p95 {row['latency_ms'].get('p95')} ms", flush=True)
+    finally:
+        app.terminate()
+        try:
+            app.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            app.kill()
+        stubs.stop()
+
+    print_table(results)
+    report = {
+        'settings': {
+            key: value for key, value in vars(args).items() if key not in ('save', 'compare')
+        },
+        'upstream_requests': stubs.requests_served,
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark for the OpenAlex fetcher against its earlier pyalex-based form.
+
+Offline (the default), it times abstract reconstruction from
+``abstract_inverted_index``:
+
+- the sort-based rebuild pyalex does (``invert_abstract`` in pyalex 0.13)
+- the positional rebuild in fetcher/openalex.py
+
+It runs over the saved works in bench/fixtures/openalex and over
+generated abstracts, and checks that both give the same text.
+
+With ``--live`` it also queries api.openalex.org. For each query it
+compares a full Works request, as pyalex sent it, with the ``select``
+request the fetcher sends. It reports response bytes, request time, and
+the time to decode the JSON and rebuild the abstracts.
+
+Usage (from the repository root):
+
+    python -m bench.openalex
+    python -m bench.openalex --live --query "protein structure prediction" --results 25
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+import requests
+
+from fetcher import openalex
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'openalex', 'works.json')
+DEFAULT_QUERIES = ["protein structure prediction", "transformer language models", "graphene superconductivity"]
+
+def sorted_invert_abstract(inv_index):
+    # pyalex 0.13's rebuild, kept here as the baseline
+    if inv_index is not None:
+        l_inv = [(w, p) for w, pos in inv_index.items() for p in pos]
+        return " ".join(map(lambda x: x[0], sorted(l_inv, key=lambda x: x[1])))
+
+def generated_indexes(count=2000, words=250, seed=1):
+    """Inverted indexes of abstracts with a realistic share of repeated words."""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(3000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    indexes = []
+    for _ in range(count):
+        index = {}
+        for position, word in enumerate(rng.choices(vocabulary, weights, k=words)):
+            index.setdefault(word, []).append(position)
+        indexes.append(index)
+    return indexes
+
+def _time(function, inputs, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for value in inputs:
+            function(value)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def bench_rebuild(repeat):
+    with open(FIXTURE_PATH, encoding='utf-8') as f:
+        fixture = [work['abstract_inverted_index'] for work in json.load(f)['results'] if work.get('abstract_inverted_index')]
+    print(f"{'abstracts':<28} {'count':>6} {'sorted (pyalex)':>16} {'positional':>12} {'speed-up':>9}")
+    for name, indexes in (('fixture', fixture * 500), ('generated, 250 words', generated_indexes())):
+        for index in indexes[:50]:
+            if sorted_invert_abstract(index) != openalex.invert_abstract(index):
+                raise SystemExit(f"{name}: the rebuilds disagree")
+        before = _time(sorted_invert_abstract, indexes, repeat)
+        after = _time(openalex.invert_abstract, indexes, repeat)
+        print(f"{name:<28} {len(indexes):>6} {before:>13.1f} ms {after:>9.1f} ms {before / after:>8.1f}x")
+
+def _fetch(query, results, select):
+    params = {'search': query, 'per_page': results, 'mailto': openalex.MAILTO}
+    if select:
+        params['select'] = openalex.SELECT_FIELDS
+    start = time.perf_counter()
+    response = requests.get(f"{openalex.OPENALEX_API_URL}/works", params=params, timeout=30)
+    response.raise_for_status()
+    request_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    works = response.json()['results']
+    rebuild = openalex.invert_abstract if select else sorted_invert_abstract
+    for work in works:
+        rebuild(work.get('abstract_inverted_index'))
+    return {
+        'bytes': len(response.content),
+        'wire_bytes': int(response.headers.get('Content-Length') or 0),
+        'request_ms': request_ms,
+        'process_ms': (time.perf_counter() - start) * 1000,
+    }
+
+def bench_live(queries, results, repeat):
+    print(f"\n{'query':<32} {'request':<8} {'bytes':>10} {'on wire':>10} {'request':>10} {'decode+rebuild':>15}")
+    for query in queries:
+        for name, select in (('full', False), ('select', True)):
+            rows = [_fetch(query, results, select) for _ in range(repeat)]
+            print(
+                f"{query[:32]:<32} {name:<8} {rows[0]['bytes']:>10} {rows[0]['wire_bytes'] or '-':>10} "
+                f"{statistics.median(row['request_ms'] for row in rows):>7.0f} ms "
+                f"{statistics.median(row['process_ms'] for row in rows):>12.2f} ms"
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement")
+    parser.add_argument('--live', action='store_true', help="Also compare full and select requests to OpenAlex")
+    parser.add_argument('--query', action='append', help="Query for --live (repeatable)")
+    parser.add_argument('--results', type=int, default=25, help="Works per request for --live")
+    args = parser.parse_args()
+
+    bench_rebuild(args.repeat)
+    if args.live:
+        bench_live(args.query or DEFAULT_QUERIES, args.results, min(args.repeat, 3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Deterministic generators for the large pages in the extraction corpus.
+
+Multi-megabyte pages are rebuilt from a seed instead of being committed;
+the manifest records each page's SHA-256 so any drift in a generator is
+caught before it is mistaken for a change in the extractors.
+"""
+import random
+
+WORDS = (
+    "protein structure model data analysis research network sequence result method system "
+    "performance design sample signal energy cell process value market price product review "
+    "quality delivery customer warranty battery display storage memory camera screen update"
+).split()
+
+CURRENCIES = ['$', '₹', '€', 'Rs. ', 'USD ']
+
+def _sentence(rng, min_words=8, max_words=24):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return ' '.join(words).capitalize() + '.'
+
+def _paragraph(rng, sentences=5):
+    return ' '.join(_sentence(rng) for _ in range(sentences))
+
+def _price(rng):
+    return f"{rng.choice(CURRENCIES)}{rng.randint(5, 90000):,}.{rng.randint(0, 99):02d}"
+
+def _page(title, body, head_extra=''):
+    return (
+        f'<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n<title>{title}</title>\n'
+        f'{head_extra}</head>\n<body>\n{body}\n</body>\n</html>\n'
+    )
+
+def ecommerce_listing(products=500, seed=1):
+    """A search-results grid in Amazon's markup, with prices in several currencies."""
+    rng = random.Random(seed)
+    cards = []
+    for i in range(products):
+        whole = rng.randint(5, 4000)
+        cards.append(
+            f'<div class="s-result-item" data-asin="B0{i:08d}">'
+            f'<div class="s-image"><img class="s-image" src="//m.media-amazon.com/images/I/{i:06d}.jpg" '
+            f'alt="{_sentence(rng, 3, 6)}"></div>'
+            f'<h2 class="a-size-mini"><a href="/dp/B0{i:08d}"><span>{_sentence(rng, 6, 14)}</span></a></h2>'
+            f'<div class="a-row"><span class="a-icon-alt">{rng.randint(1, 5)}.{rng.randint(0, 9)} out of 5 stars</span>'
+            f'<span class="a-size-base">({rng.randint(1, 90000):,})</span></div>'
+            f'<span class="a-price"><span class="a-offscreen">${whole:,}.{rng.randint(0, 99):02d}</span>'
+            f'<span class="a-price-whole">{whole:,}</span></span>'
+            f'<div class="a-row a-size-base a-color-secondary">List: {_price(rng)} · Save {_price(rng)}</div>'
+            f'</div>'
+        )
+    nav = ''.join(f'<li><a href="/b/{i}">{rng.choice(WORDS).title()}</a></li>' for i in range(120))
+    body = (
+        f'<header><nav><ul>{nav}</ul></nav></header>'
+        f'<div id="search"><div class="s-main-slot">{"".join(cards)}</div></div>'
+        f'<footer><p>{_paragraph(rng, 3)}</p></footer>'
+    )
+    return _page('Amazon.com : gpu workstation', body)
+
+def news_article(paragraphs=120, comments=400, seed=2):
+    """A long article followed by a large comment thread, ads and related links."""
+    rng = random.Random(seed)
+    article = ''.join(
+        (f'<h2>{_sentence(rng, 3, 7)}</h2>' if i % 8 == 0 else '') + f'<p>{_paragraph(rng)}</p>'
+        for i in range(paragraphs)
+    )
+    thread = ''.join(
+        f'<div class="comment"><span class="author">user{rng.randint(1, 99999)}</span>'
+        f'<p>{_sentence(rng, 4, 30)}</p></div>'
+        for _ in range(comments)
+    )
+    related = ''.join(f'<li><a href="/news/{i}">{_sentence(rng, 5, 10)}</a></li>' for i in range(60))
+    ads = ''.join(f'<div class="ad"><p>Sponsored: {_sentence(rng, 4, 8)} Only {_price(rng)}</p></div>' for _ in range(15))
+    body = (
+        f'<header><nav>{related}</nav></header>'
+        f'<main><article><h1>{_sentence(rng, 6, 12)}</h1>{article}</article>'
+        f'<section class="comments">{thread}</section></main>'
+        f'<aside>{ads}<ul>{related}</ul></aside>'
+        f'<footer><p>{_paragraph(rng, 2)}</p></footer>'
+    )
+    return _page(_sentence(rng, 6, 10), body)
+
+def image_gallery(images=1500, seed=3):
+    """Lazy-loaded images mixing src, data-src, srcset and CSS backgrounds."""
+    rng = random.Random(seed)
+    tiles = []
+    for i in range(images):
+        kind = i % 4
+        if kind == 0:
+            tiles.append(f'<figure><img src="/media/photo-{i}.jpg" alt="{_sentence(rng, 2, 5)}" title="Photo {i}"></figure>')
+        elif kind == 1:
+            tiles.append(f'<figure><img data-src="https://cdn.example.com/img/{i}.webp" alt="{_sentence(rng, 2, 5)}"></figure>')
+        elif kind == 2:
+            tiles.append(
+                f'<figure><img srcset="/thumb/{i}-480.png 480w, /thumb/{i}-1080.png 1080w" '
+                f'src="/thumb/{i}-1080.png" alt=""></figure>'
+            )
+        else:
+            tiles.append(f'<div class="tile" style="background-image: url(\'//static.example.com/gallery/{i}.jpg\')"></div>')
+    body = f'<h1>Gallery</h1><div class="gallery">{"".join(tiles)}</div><p>{_paragraph(rng, 2)}</p>'
+    return _page('Image gallery', body)
+
+def deep_dom(depth=2000, seed=4):
+    """Pathologically deep nesting, as produced by broken templates."""
+    rng = random.Random(seed)
+    opening = ''.join(f'<div class="level-{i % 10}"><span>{rng.choice(WORDS)}</span>' for i in range(depth))
+    closing = '</div>' * depth
+    body = f'<main>{opening}<p>{_paragraph(rng, 10)}</p>{closing}</main>'
+    return _page('Deep DOM', body)
+
+def wide_dom(elements=60000, seed=5):
+    """A huge flat DOM: tens of thousands of small table cells."""
+    rng = random.Random(seed)
+    columns = 12
+    rows = ''.join(
+        '<tr>' + ''.join(f'<td>{rng.choice(WORDS)} {rng.randint(0, 999)}</td>' for _ in range(columns)) + '</tr>'
+        for _ in range(elements // columns)
+    )
+    body = f'<div class="content"><table>{rows}</table></div>'
+    return _page('Wide DOM', body)
+
+def script_heavy(scripts=40, script_kb=64, seed=6):
+    """Large inline scripts, JSON state and styles around a small amount of text."""
+    rng = random.Random(seed)
+    blob = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789 =;{}()') for _ in range(script_kb * 1024))
+    state = '{"products": [' + ','.join(
+        f'{{"id": {i}, "price": "{_price(rng)}", "name": "{_sentence(rng, 2, 4)}"}}' for i in range(2000)
+    ) + ']}'
+    head = f'<style>{blob}</style>'
+    body = (
+        ''.join(f'<script>{blob}</script>' for _ in range(scripts))
+        + f'<script type="application/json" id="__STATE__">{state}</script>'
+        + f'<div id="content"><p>{_paragraph(rng, 4)}</p></div>'
+    )
+    return _page('Script heavy', body, head)
+
+def unclosed_tags(blocks=5000, seed=7):
+    """Tag soup: unclosed paragraphs, list items and table cells."""
+    rng = random.Random(seed)
+    soup = ''.join(
+        rng.choice([
+            f'<p>{_sentence(rng)}',
+            f'<li>{_sentence(rng, 3, 8)}',
+            f'<td>{_price(rng)}',
+            f'<b><i>{rng.choice(WORDS)}</b></i>',
+            f'<div class="content"><p>{_sentence(rng)}',
+        ])
+        for _ in range(blocks)
+    )
+    return _page('Unclosed tags', f'<article>{soup}')
+
+GENERATORS = {
+    'ecommerce_listing': ecommerce_listing,
+    'news_article': news_article,
+    'image_gallery': image_gallery,
+    'deep_dom': deep_dom,
+    'wide_dom': wide_dom,
+    'script_heavy': script_heavy,
+    'unclosed_tags': unclosed_tags,
+}
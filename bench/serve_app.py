@@ -0,0 +1,42 @@
+"""
+Runs api.py for the load test. Started by loadtest.py with the *_URL
+environment variables already pointing at the stand-in upstreams.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+UNLIMITED = {'rate': 10000, 'concurrency': 256}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--host-map', default='{}', help="JSON mapping stub address to the real host it stands in for")
+    parser.add_argument('--unthrottled', action='store_true', help="Lift per-host and per-API rate limits")
+    args = parser.parse_args()
+
+    import uvicorn
+    import api
+    from fetcher import pubmed, resilience, semantic_scholar
+    from fetcher.ratelimit import AdaptiveTokenBucket, TokenBucket
+
+    # Give each stub the limits of the upstream it replaces, so throttling
+    # behaves as it would in production. The websites stub serves pages that
+    # would come from many different hosts, so it is never throttled.
+    for stub_host, real_host in json.loads(args.host_map).items():
+        if real_host is None or args.unthrottled:
+            resilience.HOST_POLICIES[stub_host] = UNLIMITED
+        else:
+            resilience.HOST_POLICIES[stub_host] = resilience.HOST_POLICIES.get(real_host, resilience.DEFAULT_POLICY)
+
+    if args.unthrottled:
+        pubmed._bucket = TokenBucket(rate=10000, capacity=10000)
+        semantic_scholar._bucket = AdaptiveTokenBucket(rate=10000, capacity=10000)
+
+    uvicorn.run(api.app, host='127.0.0.1', port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()
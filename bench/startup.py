@@ -0,0 +1,123 @@
+"""
+Startup profile for api.py.
+
+By default it imports the app in fresh interpreters with ``-X importtime``
+and reports the median import time of the app, the packages that cost
+the most, and each fetcher module.
+
+With ``--ready`` it also starts the app against the stand-in upstreams
+from stubs.py, once per PREWARM setting. For each setting it reports:
+
+- when the app accepted connections
+- when /ready answered 200
+- how long the first and second /deepsearch requests took
+
+Usage (from the repository root):
+
+    python -m bench.startup
+    python -m bench.startup --ready --prewarm none,all
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import requests
+
+from bench.loadtest import ROOT, _free_port, start_app
+from bench.stubs import Faults, StubCluster
+
+_IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def import_profile():
+    """
+    One cold import of api.py. Returns (total, per package, per fetcher
+    module) in milliseconds: the app's cumulative time, the self time of
+    every top-level package, and the cumulative time of each fetcher module.
+    """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import api'],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stderr
+    total = 0.0
+    packages = defaultdict(float)
+    fetchers = {}
+    for match in _IMPORT_LINE.finditer(output):
+        self_us, cumulative_us, _, name = match.groups()
+        packages[name.split('.')[0]] += int(self_us) / 1000
+        if name.startswith('fetcher.'):
+            fetchers[name] = int(cumulative_us) / 1000
+        if name == 'api':
+            total = int(cumulative_us) / 1000
+    return total, packages, fetchers
+
+def _median(runs, key):
+    return statistics.median(run.get(key, 0.0) for run in runs)
+
+def bench_imports(repeat, top):
+    profiles = [import_profile() for _ in range(repeat)]
+    print(f"import api: {statistics.median(total for total, _, _ in profiles):.0f} ms (median of {repeat})\n")
+    packages = [package for _, package, _ in profiles]
+    names = sorted({name for package in packages for name in package}, key=lambda name: -_median(packages, name))
+    print(f"{'package':<28} {'self ms':>8}")
+    for name in names[:top]:
+        print(f"{name:<28} {_median(packages, name):>8.1f}")
+    fetchers = [fetcher for _, _, fetcher in profiles]
+    print(f"\n{'fetcher module':<28} {'cumulative ms':>14}")
+    for name in sorted(fetchers[0], key=lambda name: -_median(fetchers, name)):
+        print(f"{name:<28} {_median(fetchers, name):>14.1f}")
+
+def _time_get(url, params=None, timeout=120):
+    start = time.perf_counter()
+    response = requests.get(url, params=params, timeout=timeout)
+    return response, (time.perf_counter() - start) * 1000
+
+def bench_ready(settings):
+    print(f"\n{'PREWARM':<24} {'accepting':>10} {'ready':>10} {'1st request':>12} {'2nd request':>12}")
+    for setting in settings:
+        stubs = StubCluster(Faults(0, 0, 0)).start()
+        os.environ['PREWARM'] = '' if setting == 'none' else setting
+        start = time.perf_counter()
+        app, base_url = start_app(stubs, _free_port(), unthrottled=True)
+        try:
+            accepting_ms = (time.perf_counter() - start) * 1000
+            while requests.get(f"{base_url}/ready", timeout=5).status_code != 200:
+                time.sleep(0.05)
+            ready_ms = (time.perf_counter() - start) * 1000
+            timings = [
+                _time_get(f"{base_url}/deepsearch", {'query': f"startup probe {i}", 'num_results': 1})[1]
+                for i in range(2)
+            ]
+        finally:
+            app.terminate()
+            try:
+                app.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                app.kill()
+            stubs.stop()
+        print(
+            f"{setting:<24} {accepting_ms:>7.0f} ms {ready_ms:>7.0f} ms "
+            f"{timings[0]:>9.0f} ms {timings[1]:>9.0f} ms", flush=True
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help="Cold imports to take the median of")
+    parser.add_argument('--top', type=int, default=15, help="Packages to list")
+    parser.add_argument('--ready', action='store_true', help="Also time the app to ready and its first requests")
+    parser.add_argument(
+        '--prewarm', default='none,all',
+        help="Comma-separated PREWARM settings for --ready; 'none' for no warm-up, '+' joins steps, e.g. imports+http"
+    )
+    args = parser.parse_args()
+
+    bench_imports(args.repeat, args.top)
+    if args.ready:
+        bench_ready([setting.replace('+', ',') for setting in args.prewarm.split(',')])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Local stand-ins for every upstream the API calls.
+
+Each upstream gets its own loopback address (127.0.0.x), so the app keeps a
+separate rate limiter and circuit breaker per upstream just as it does in
+production. The stubs replay payloads from bench/fixtures in each upstream's
+response format and can add latency and errors.
+"""
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# A 1x1 transparent GIF served for every image the scraped pages reference
+PIXEL_GIF = bytes.fromhex('47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b')
+
+PAGE_FIXTURES = ['product.html', 'article.html', 'gallery.html']
+
+def _fixture(*parts):
+    with open(os.path.join(FIXTURES_DIR, *parts), 'rb') as f:
+        return f.read()
+
+def _json(body):
+    return 200, 'application/json', body
+
+class Upstream:
+    """
+    One stand-in upstream: where it listens, which environment variable
+    points the app at it, and how it answers requests.
+    """
+
+    def __init__(self, name, address, env_var, base_path, real_host):
+        self.name = name
+        self.address = address
+        self.env_var = env_var
+        self.base_path = base_path
+        self.real_host = real_host
+        self.server = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{self.base_path}"
+
+    def respond(self, method, path, params, body):
+        raise NotImplementedError
+
+class Arxiv(Upstream):
+    def respond(self, method, path, params, body):
+        return 200, 'application/atom+xml', _fixture('arxiv', 'query.xml')
+
+class Crossref(Upstream):
+    def respond(self, method, path, params, body):
+        return _json(_fixture('crossref', 'works.json'))
+
+class OpenAlex(Upstream):
+    def respond(self, method, path, params, body):
+        return _json(_fixture('openalex', 'works.json'))
+
+class PubMed(Upstream):
+    def respond(self, method, path, params, body):
+        if path.endswith('esearch.fcgi'):
+            return _json(_fixture('pubmed', 'esearch.json'))
+        if path.endswith('efetch.fcgi'):
+            return 200, 'text/xml', _fixture('pubmed', 'efetch.xml')
+        return 404, 'text/plain', b'unknown E-utility'
+
+class SemanticScholar(Upstream):
+    def respond(self, method, path, params, body):
+        if path.endswith('/paper/search'):
+            return _json(_fixture('semantic_scholar', 'search.json'))
+        if path.endswith('/paper/batch'):
+            papers = {paper['paperId']: paper for paper in json.loads(_fixture('semantic_scholar', 'papers.json'))}
+            ids = json.loads(body or b'{}').get('ids', [])
+            return _json(json.dumps([papers.get(paper_id) for paper_id in ids]).encode())
+        return 404, 'text/plain', b'unknown endpoint'
+
+class Wikipedia(Upstream):
+    def respond(self, method, path, params, body):
+        if params.get('list') == 'search':
+            return _json(_fixture('wikipedia', 'search.json'))
+        return _json(_fixture('wikipedia', 'extracts.json'))
+
+class Wikidata(Upstream):
+    def respond(self, method, path, params, body):
+        if params.get('action') == 'wbsearchentities':
+            return _json(_fixture('wikidata', 'search.json'))
+        return _json(_fixture('wikidata', 'entities.json'))
+
+class Doi(Upstream):
+    def respond(self, method, path, params, body):
+        return 200, 'text/html; charset=utf-8', _fixture('doi', 'landing.html')
+
+class Search(Upstream):
+    """Stands in for Google: returns result URLs on the websites stub."""
+
+    websites = None
+
+    def respond(self, method, path, params, body):
+        query = params.get('q', '')
+        num = int(params.get('num', 3))
+        # The query is part of each URL so different queries scrape different pages
+        urls = [
+            f"{self.websites.base_url}/pages/{PAGE_FIXTURES[i % len(PAGE_FIXTURES)]}?q={quote(query)}&n={i}"
+            for i in range(num)
+        ]
+        return _json(json.dumps({'urls': urls}).encode())
+
+class Websites(Upstream):
+    """Serves the saved HTML pages that Playwright loads."""
+
+    def respond(self, method, path, params, body):
+        if path.startswith('/pages/'):
+            name = os.path.basename(path)
+            if name in PAGE_FIXTURES:
+                return 200, 'text/html; charset=utf-8', _fixture('pages', name)
+        if path.startswith('/img/'):
+            return 200, 'image/gif', PIXEL_GIF
+        return 404, 'text/plain', b'not found'
+
+def default_upstreams():
+    search = Search('search', '127.0.0.10', 'SEARCH_API_URL', '/search', 'www.google.com')
+    websites = Websites('websites', '127.0.0.20', None, '', None)
+    search.websites = websites
+    return [
+        Arxiv('arxiv', '127.0.0.11', 'ARXIV_API_URL', '/api/query', 'export.arxiv.org'),
+        OpenAlex('openalex', '127.0.0.12', 'OPENALEX_API_URL', '', 'api.openalex.org'),
+        Crossref('crossref', '127.0.0.13', 'CROSSREF_API_URL', '', 'api.crossref.org'),
+        PubMed('pubmed', '127.0.0.14', 'EUTILS_URL', '/entrez/eutils', 'eutils.ncbi.nlm.nih.gov'),
+        SemanticScholar('semantic_scholar', '127.0.0.15', 'S2_API_URL', '/graph/v1', 'api.semanticscholar.org'),
+        Wikipedia('wikipedia', '127.0.0.16', 'WIKIPEDIA_API_URL', '/w/api.php', 'en.wikipedia.org'),
+        Wikidata('wikidata', '127.0.0.17', 'WIKIDATA_API_URL', '/w/api.php', 'www.wikidata.org'),
+        Doi('doi', '127.0.0.18', 'DOI_RESOLVER_URL', '', 'doi.org'),
+        search,
+        websites,
+    ]
+
+class Faults:
+    """Latency and error injection for one upstream."""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def delay(self):
+        seconds = random.gauss(self.latency_ms, self.jitter_ms) / 1000 if self.jitter_ms else self.latency_ms / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+def _make_handler(upstream, faults, cluster):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _handle(self, method):
+            parsed = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            path = parsed.path[len(upstream.base_path):] if parsed.path.startswith(upstream.base_path) else parsed.path
+
+            faults.delay()
+            cluster.count(upstream.name)
+            if faults.should_fail():
+                status, content_type, payload = 503, 'text/plain', b'injected failure'
+            else:
+                status, content_type, payload = upstream.respond(method, path, params, body)
+
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            if status == 503:
+                self.send_header('Retry-After', '1')
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class StubCluster:
+    """
+    Starts every stand-in upstream on its own thread.
+
+    ``faults`` maps upstream name to a Faults; ``default_faults`` applies to
+    the rest. ``env()`` returns the variables that point the app at the stubs.
+    """
+
+    def __init__(self, default_faults=None, faults=None, upstreams=None):
+        self.upstreams = upstreams or default_upstreams()
+        self.default_faults = default_faults or Faults()
+        self.faults = faults or {}
+        self.requests_served = {}
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        for upstream in self.upstreams:
+            faults = self.faults.get(upstream.name, self.default_faults)
+            upstream.server = ThreadingHTTPServer(
+                (upstream.address, 0), _make_handler(upstream, faults, self)
+            )
+            upstream.server.daemon_threads = True
+            thread = threading.Thread(target=upstream.server.serve_forever, name=f"stub-{upstream.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def count(self, name):
+        with self._lock:
+            self.requests_served[name] = self.requests_served.get(name, 0) + 1
+
+    def stop(self):
+        for upstream in self.upstreams:
+            if upstream.server is not None:
+                upstream.server.shutdown()
+                upstream.server.server_close()
+
+    def env(self):
+        return {upstream.env_var: upstream.base_url for upstream in self.upstreams if upstream.env_var}
+
+    def host_map(self):
+        """
+        Maps each stub's address to the real host whose limits it should get;
+        None for the websites stub, which stands in for many different sites.
+        """
+        return {upstream.address: upstream.real_host for upstream in self.upstreams}
@@ -1,10 +1,11 @@
 import json
 import sys
 import os
+import asyncio
 import concurrent.futures
 import time
 import tempfile
-from multiprocessing import Process
+import multiprocessing
 import uuid
 
 # Add the root project directory to the Python path
@@ -12,128 +13,168 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from fetcher import (
     arxiv_scraper, wikipedia, semantic_scholar, openalex, 
-    pubmed, crossref, unpaywall, wikidata, websearch, doi_resolver
+    pubmed, crossref, unpaywall, wikidata, websearch, doi_resolver, browser_pool, logs, tracing
 )
+from fetcher.budget import Deadline, COMPLETE, PARTIAL, SKIPPED
 
-def web_search_process_wrapper(query, num_results, temp_file_path):
+log = logs.get_logger('cleaner')
+
+# Seconds the web search process keeps back from its budget to write results
+WEB_WRAP_UP_SECONDS = 1.0
+# How often a run checks its stop flag while it waits
+STOP_POLL_SECONDS = 0.25
+
+async def _scrape_web(query, num_results, deadline):
+    try:
+        return await websearch.scrape_web(query, num_results, deadline)
+    finally:
+        await browser_pool.close_pool()
+
+def web_search_process_wrapper(query, num_results, temp_file_path, budget_ms=None, request_id=None):
     """
     A wrapper to run the Playwright web scraper in a separate process.
     This isolates it and prevents it from hanging the main application.
     Uses a temporary file to communicate results instead of a queue.
     """
     import os
-    print(f"Starting isolated web search process... PID: {os.getpid()}")
+    # The process may be spawned fresh, so it sets up logging and the run's ID again
+    logs.configure()
+    logs.request_id.set(request_id)
+    log.info("web search process started", pid=os.getpid())
     try:
-        results = websearch.search_and_scrape_web(query, num_results)
-        print(f"Web search completed, writing {len(results)} results to {temp_file_path}")
+        deadline = Deadline(budget_ms).reserve(WEB_WRAP_UP_SECONDS)
+        report = asyncio.run(_scrape_web(query, num_results, deadline))
+        log.info("web search process writing results", results=len(report['results']), path=temp_file_path)
         # Write results to temporary file
         with open(temp_file_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        print(f"Isolated web search process finished. PID: {os.getpid()}")
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        log.info("web search process finished", pid=os.getpid())
     except Exception as e:
-        print(f"Error in web search process: {e}")
+        log.error("web search process failed", pid=os.getpid(), error=repr(e))
         # Write empty results on error
         with open(temp_file_path, 'w', encoding='utf-8') as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
-        print(f"Web search process finished with error. PID: {os.getpid()}")
+            json.dump({'results': [], 'pages': {}}, f, ensure_ascii=False, indent=2)
 
-def run_all_fetchers_with_timeout(topic, doi_example, timeout=20):
+def _stopped(stop):
+    return stop is not None and stop.is_set()
+
+def run_all_fetchers_with_timeout(topic, doi_example, timeout=20, source_status=None, stop=None):
     """
     Runs all fetchers concurrently, with the web scraper in a separate process.
+
+    ``timeout`` is the total budget in seconds shared by the API fetchers, the
+    web search and abstract enrichment; whatever has not finished by then is
+    abandoned and the results collected so far are returned. Pass a dict as
+    ``source_status`` to receive each source's completion state (complete,
+    partial or skipped). Setting the ``stop`` event (a threading.Event)
+    abandons the run within a fraction of a second: the web search process
+    and its browser are terminated and the results so far returned.
     """
     all_results = []
+    deadline = Deadline(timeout * 1000)
+    if source_status is None:
+        source_status = {}
+    if logs.request_id.get() is None:
+        logs.request_id.set(logs.new_request_id())
     
-    print(f"--- Searching for topic: '{topic}' across all sources ---")
+    log.info("search started", topic=topic, budget_s=timeout)
 
     # --- Start the isolated Web Search Process ---
     # Create a temporary file for communication
     temp_file_path = os.path.join(tempfile.gettempdir(), f"websearch_results_{uuid.uuid4().hex}.json")
-    print(f"[DEBUG] Creating web search process with temp file: {temp_file_path}")
-    web_search_proc = Process(target=web_search_process_wrapper, args=(topic, 2, temp_file_path))
-    print(f"[DEBUG] Starting web search process...")
+    # Spawned rather than forked: the caller may be a threaded server (e.g. the
+    # API's job workers), and forking a process with live threads is unsafe
+    web_search_proc = multiprocessing.get_context('spawn').Process(
+        target=web_search_process_wrapper,
+        args=(topic, 2, temp_file_path, timeout * 1000, logs.request_id.get())
+    )
     web_search_proc.start()
-    print(f"[DEBUG] Web search process started with PID: {web_search_proc.pid}")
+    log.debug("web search process started", pid=web_search_proc.pid, path=temp_file_path)
 
     # --- Run all other fetchers in a Thread Pool ---
     api_fetcher_jobs = {
         "arXiv": (arxiv_scraper.search_arxiv, topic, 2),  # Reduced from 3 to 2
         "OpenAlex": (openalex.search_openalex, topic, 2),  # Reduced from 3 to 2
         "CrossRef": (crossref.search_crossref, topic, 2),  # Reduced from 3 to 2
-        "Wikipedia": (wikipedia.get_wikipedia_articles, [topic]),
+        "PubMed": (pubmed.search_pubmed, topic, 2),
+        "Semantic Scholar": (semantic_scholar.search_semantic_scholar, topic, 2),
+        "Wikipedia": (wikipedia.get_wikipedia_articles, [topic], 2),
         "Wikidata": (wikidata.search_wikidata, topic, 2),  # Reduced from 3 to 2
-        # Removed PubMed and Semantic Scholar for speed
     }
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(api_fetcher_jobs)) as executor:
-        future_to_source = {executor.submit(func, *args): source for source, (func, *args) in api_fetcher_jobs.items()}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(api_fetcher_jobs))
+    future_to_source = {executor.submit(tracing.bind(func), *args): source for source, (func, *args) in api_fetcher_jobs.items()}
+    for source in api_fetcher_jobs:
+        source_status[source] = SKIPPED
 
-        try:
-            for future in concurrent.futures.as_completed(future_to_source, timeout=12):  # Reduced timeout
-                source_name = future_to_source[future]
-                try:
-                    data = future.result(timeout=6)  # Reduced individual timeout
-                    if data:
-                        print(f"-> Successfully fetched {len(data)} results from {source_name}")
-                        all_results.extend(data)
-                    else:
-                        print(f"-> {source_name} returned no results")
-                except concurrent.futures.TimeoutError:
-                    print(f"-> {source_name} timed out after 6 seconds")
-                except Exception as exc:
-                    print(f"-> API fetcher {source_name} generated an exception: {exc}")
-        except concurrent.futures.TimeoutError:
-            print("-> Some API fetchers timed out, proceeding with available results")
-            # Cancel remaining futures
-            for future in future_to_source:
-                future.cancel()
-        
-        print("[DEBUG] API fetcher section completed")
+    pending = set(future_to_source)
+    # Waited for in short slices, so a stop request is noticed
+    while pending and not deadline.expired() and not _stopped(stop):
+        done, pending = concurrent.futures.wait(
+            pending, timeout=deadline.timeout(STOP_POLL_SECONDS), return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            source_name = future_to_source[future]
+            try:
+                data = future.result()
+                source_status[source_name] = COMPLETE
+                if data:
+                    log.info("source fetched", source=source_name, results=len(data))
+                    all_results.extend(data)
+                else:
+                    log.info("source returned no results", source=source_name)
+            except Exception as exc:
+                log.warning("source failed", source=source_name, error=repr(exc))
+    if pending:
+        log.warning(
+            "sources stopped" if _stopped(stop) else "sources ran out of budget",
+            sources=[future_to_source[future] for future in pending]
+        )
+        # Cancel remaining futures
+        for future in pending:
+            future.cancel()
+    # Don't wait for fetchers that are still running past the budget
+    executor.shutdown(wait=False)
 
     # --- Get results from the Web Search Process ---
-    print("\n[DEBUG] Waiting for web search results...")
-    web_search_results = []
+    while web_search_proc.is_alive() and not deadline.expired() and not _stopped(stop):
+        web_search_proc.join(timeout=deadline.timeout(STOP_POLL_SECONDS))
     
-    # Simple approach: just wait a fixed time since we know the process completes quickly
-    print("[DEBUG] Waiting 5 seconds for web search to complete...")
-    time.sleep(5)
-    
-    print("[DEBUG] Attempting to clean up web search process...")
-    try:
-        if hasattr(web_search_proc, 'terminate'):
+    if web_search_proc.is_alive():
+        log.warning(
+            "web search process stopped" if _stopped(stop) else "web search process over budget, terminating",
+            pid=web_search_proc.pid
+        )
+        try:
             web_search_proc.terminate()
-        time.sleep(2)
-    except:
-        print("[DEBUG] Process cleanup had issues, continuing...")
-    
-    print(f"[DEBUG] Process cleanup completed")
+            web_search_proc.join(timeout=2)
+        except Exception as e:
+            log.warning("web search process cleanup failed", pid=web_search_proc.pid, error=repr(e))
     
     # Read results from temporary file
-    print("[DEBUG] Reading results from temporary file...")
+    source_status["Web Search"] = SKIPPED
     try:
         if os.path.exists(temp_file_path):
-            print(f"[DEBUG] Temporary file exists: {temp_file_path}")
-            file_size = os.path.getsize(temp_file_path)
-            print(f"[DEBUG] File size: {file_size} bytes")
+            log.debug("reading web search results", path=temp_file_path, bytes=os.path.getsize(temp_file_path))
             
             with open(temp_file_path, 'r', encoding='utf-8') as f:
-                web_search_results = json.load(f)
+                web_report = json.load(f)
+            web_search_results = web_report['results']
             
             if web_search_results:
-                print(f"-> Successfully fetched {len(web_search_results)} results from Web Search")
+                log.info("source fetched", source="Web Search", results=len(web_search_results))
                 all_results.extend(web_search_results)
+                page_states = set(web_report['pages'].values())
+                source_status["Web Search"] = COMPLETE if page_states == {COMPLETE} else PARTIAL
             else:
-                print("-> Web search returned empty results")
+                log.info("source returned no results", source="Web Search")
                 
             # Clean up temporary file
             os.remove(temp_file_path)
-            print("[DEBUG] Temporary file cleaned up")
         else:
-            print("-> SKIPPED: Web search did not create results file")
-            print(f"[DEBUG] Expected file path: {temp_file_path}")
-    except Exception as e:
-        print(f"-> An error occurred reading web search results: {e}")
-        import traceback
-        traceback.print_exc()
+            log.warning("web search did not create results file", path=temp_file_path)
+    except Exception:
+        log.exception("reading web search results failed", path=temp_file_path)
         # Clean up temporary file if it exists
         try:
             if os.path.exists(temp_file_path):
@@ -141,65 +182,42 @@ def run_all_fetchers_with_timeout(topic, doi_example, timeout=20):
         except:
             pass
 
-    print("-> Web search process cleaned up.")
-
     # --- Skip Unpaywall Check for Speed ---
-    print("-> Skipping Unpaywall check for faster execution")
     
+    if _stopped(stop):
+        log.info("search stopped", topic=topic, results=len(all_results))
+        return all_results
+
     # --- Enhance results with missing abstracts ---
-    print("-> Enhancing results with missing abstracts...")
     try:
-        all_results = doi_resolver.enhance_results_with_abstracts(all_results)
-        print("-> Abstract enhancement completed")
+        all_results = doi_resolver.enhance_results_with_abstracts(all_results, deadline)
     except Exception as e:
-        print(f"-> Abstract enhancement failed: {e}")
+        log.warning("abstract enhancement failed", error=repr(e))
 
+    log.info("search finished", topic=topic, results=len(all_results), source_status=source_status)
     return all_results
 
 if __name__ == "__main__":
     # This guard is essential for multiprocessing on Windows
-    import multiprocessing
     multiprocessing.set_start_method('spawn', force=True)
+    logs.configure()
     
     search_topic = "Crop Circle"
     example_doi = "10.1038/s41586-021-03491-6"
     
-    print(f"[DEBUG] Main process starting with PID: {os.getpid()}")
+    log.debug("main process started", pid=os.getpid())
     start_time = time.perf_counter()
     consolidated_data = run_all_fetchers_with_timeout(search_topic, example_doi, timeout=10)
     end_time = time.perf_counter()
-    
-    print(f"\n[DEBUG] Total items collected before writing file: {len(consolidated_data)}")
-    print(f"[DEBUG] Sample of collected data types: {[type(item).__name__ for item in consolidated_data[:3]]}")
 
-    if consolidated_data:
-        print("[DEBUG] Data found. Proceeding to write 'consolidated_results.json'...")
-        filename = "consolidated_results.json"
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(consolidated_data, f, ensure_ascii=False, indent=4)
-            print(f"[DEBUG] Successfully wrote {len(consolidated_data)} items to {filename}")
-            
-            # Verify the file was created and has content
-            if os.path.exists(filename):
-                file_size = os.path.getsize(filename)
-                print(f"[DEBUG] File created successfully. Size: {file_size} bytes")
-            else:
-                print("[ERROR] File was not created!")
-                
-        except Exception as e:
-            print(f"[ERROR] Failed to write JSON file: {e}")
-            
-        print(f"\n--- Operation Complete ---")
-        print(f"Successfully saved {len(consolidated_data)} results from all sources to '{filename}'")
-        print(f"\nTotal execution time: {end_time - start_time:.2f} seconds")
-    else:
-        print("\n--- No results found from any source. ---")
-        print("[DEBUG] Creating empty results file for debugging...")
-        filename = "consolidated_results.json"
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=4)
-            print(f"[DEBUG] Created empty results file: {filename}")
-        except Exception as e:
-            print(f"[ERROR] Failed to create empty results file: {e}")
\ No newline at end of file
+    filename = "consolidated_results.json"
+    try:
+        # An empty file is still written so a run with no results is visible
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(consolidated_data, f, ensure_ascii=False, indent=4)
+        log.info(
+            "results saved", path=filename, results=len(consolidated_data),
+            bytes=os.path.getsize(filename), elapsed_s=round(end_time - start_time, 2)
+        )
+    except Exception:
+        log.exception("writing results failed", path=filename)
@@ -0,0 +1,198 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fetcher.logs import get_logger
+from fetcher.metrics import ADMISSION_REJECTED, ADMISSION_WAIT
+
+log = get_logger('admission')
+
+# Lanes, served in this order when a slot frees up. Priority waiters are
+# cheap requests; background waiters (jobs) are already queued elsewhere, so
+# they wait without a time limit and do not count towards the queue bound.
+PRIORITY = 'priority'
+NORMAL = 'normal'
+BACKGROUND = 'background'
+LANES = (PRIORITY, NORMAL, BACKGROUND)
+
+class Overloaded(Exception):
+    """
+    Raised when a request cannot be admitted: the wait queue is full or the
+    request waited longer than its queue-time budget.
+    """
+
+    def __init__(self, pool, reason, retry_after):
+        super().__init__(f"{pool} is overloaded ({reason})")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionPool:
+    """
+    Caps how many requests of one kind run at once.
+
+    Requests beyond ``limit`` wait in a FIFO queue per lane, each holding at
+    most ``max_queue`` requests, for at most ``max_wait`` seconds. When the queue is full, or the wait runs
+    out, Overloaded is raised with a Retry-After estimate. A freed slot is
+    handed straight to the next waiter, so late arrivals cannot overtake the
+    queue. At most ``background_limit`` slots (by default all but one) are
+    held by background requests, so jobs cannot lock interactive ones out.
+    """
+
+    def __init__(self, name, limit, max_queue, max_wait, background_limit=None):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.background_limit = max(1, limit - 1) if background_limit is None else background_limit
+        self.active = 0
+        self.background_active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._lanes = {lane: deque() for lane in LANES}
+        # Moving average of how long a slot is held, for Retry-After
+        self._hold_seconds = 1.0
+
+    def queued(self):
+        return sum(len(waiters) for waiters in self._lanes.values())
+
+    def retry_after(self):
+        """Seconds until a slot is likely to be free for a new request."""
+        backlog = self.queued() + 1
+        return max(1, math.ceil(self._hold_seconds * backlog / self.limit))
+
+    def _reject(self, reason):
+        self.rejected += 1
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        log.warning("request shed", pool=self.name, reason=reason, active=self.active, queued=self.queued())
+        raise Overloaded(self.name, reason, self.retry_after())
+
+    async def acquire(self, lane=NORMAL, timeout=None):
+        """
+        Waits for a slot and returns the time it was granted, to pass to
+        release(). ``timeout`` can shorten the queue-time budget, e.g. to
+        what is left of the request's own deadline.
+        """
+        start = time.monotonic()
+        if self._can_start(lane):
+            self.active += 1
+            if lane == BACKGROUND:
+                self.background_active += 1
+        else:
+            if lane != BACKGROUND and len(self._lanes[lane]) >= self.max_queue:
+                self._reject('queue_full')
+            waiter = asyncio.get_running_loop().create_future()
+            self._lanes[lane].append(waiter)
+            wait = None if lane == BACKGROUND else self.max_wait
+            if timeout is not None:
+                wait = timeout if wait is None else min(wait, timeout)
+            try:
+                await asyncio.wait_for(waiter, wait)
+            except asyncio.TimeoutError:
+                self._discard(lane, waiter)
+                self._reject('queue_timeout')
+            except asyncio.CancelledError:
+                self._discard(lane, waiter)
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as the caller went away
+                    self.release(lane=lane)
+                raise
+        self.admitted += 1
+        ADMISSION_WAIT.labels(self.name).observe(time.monotonic() - start)
+        return time.monotonic()
+
+    def _can_start(self, lane):
+        # Freed slots are handed to waiters, so a slot is only free while the
+        # waiters ahead are background requests held back by their cap
+        if self.active >= self.limit:
+            return False
+        if lane == BACKGROUND:
+            return self.background_active < self.background_limit and not self._lanes[BACKGROUND]
+        return not any(self._lanes[waiting] for waiting in LANES if waiting != BACKGROUND)
+
+    def check(self, lane=NORMAL):
+        """
+        Raises Overloaded at once if a request in ``lane`` would be turned
+        away because the queue is full, without taking a slot.
+        """
+        if self.active >= self.limit and lane != BACKGROUND and len(self._lanes[lane]) >= self.max_queue:
+            self._reject('queue_full')
+
+    def release(self, admitted_at=None, lane=NORMAL):
+        """Gives back a slot taken in ``lane``, handing it to the next waiter."""
+        if admitted_at is not None:
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (time.monotonic() - admitted_at)
+        if lane == BACKGROUND:
+            self.background_active -= 1
+        for waiting in LANES:
+            if waiting == BACKGROUND and self.background_active >= self.background_limit:
+                continue
+            waiters = self._lanes[waiting]
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    # Hand the slot over without giving it up
+                    if waiting == BACKGROUND:
+                        self.background_active += 1
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+
+    def _discard(self, lane, waiter):
+        try:
+            self._lanes[lane].remove(waiter)
+        except ValueError:
+            pass
+
+    @asynccontextmanager
+    async def admit(self, lane=NORMAL, timeout=None):
+        admitted_at = await self.acquire(lane, timeout)
+        try:
+            yield
+        finally:
+            self.release(admitted_at, lane)
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'limit': self.limit,
+            'background_active': self.background_active,
+            'background_limit': self.background_limit,
+            'queued': {lane: len(self._lanes[lane]) for lane in LANES},
+            'max_queue': self.max_queue,
+            'max_wait_seconds': self.max_wait,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+        }
+
+def _env(name, default, cast=int):
+    return cast(os.environ.get(name, default))
+
+def _env_optional(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+# Each browser-backed request may open many pages and Chromium is the
+# process's largest memory consumer, so few run at once; API-only work is
+# cheap and mostly waits on the network.
+BROWSER = AdmissionPool(
+    'browser',
+    limit=_env('ADMIT_BROWSER_CONCURRENCY', 4),
+    max_queue=_env('ADMIT_BROWSER_QUEUE', 16),
+    max_wait=_env('ADMIT_BROWSER_WAIT_SECONDS', 10, float),
+    background_limit=_env_optional('ADMIT_BROWSER_BACKGROUND'),
+)
+API = AdmissionPool(
+    'api',
+    limit=_env('ADMIT_API_CONCURRENCY', 32),
+    max_queue=_env('ADMIT_API_QUEUE', 64),
+    max_wait=_env('ADMIT_API_WAIT_SECONDS', 5, float),
+    background_limit=_env_optional('ADMIT_API_BACKGROUND'),
+)
+POOLS = (BROWSER, API)
+
+def stats():
+    return {pool.name: pool.stats() for pool in POOLS}
@@ -1,61 +1,129 @@
-import arxiv
-from arxiv import Client, Search, SortCriterion
+import re
+import sqlite3
 import textwrap
+import threading
 import json
+import os
 
+from fetcher import arxiv_index, content_store, resilience
+from fetcher.logs import get_logger
+from fetcher.singleflight import coalesced
+
+log = get_logger('arxiv')
+
+ARXIV_API_URL = os.environ.get("ARXIV_API_URL", "https://export.arxiv.org/api/query")
+
+_VERSION = re.compile(r'v\d+$')
+
+# One client for the process, so its built-in delay between export API
+# requests holds across searches; requests take turns on it
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    global _client
+    if _client is None:
+        import arxiv
+
+        _client = arxiv.Client()
+        _client.query_url_format = ARXIV_API_URL + '?{}'
+    return _client
+
+def _result(arxiv_id, url, title, authors, summary, published, pdf_url, doi):
+    return content_store.attach({
+        'url': url,
+        'title': title,
+        'author': authors,
+        'content': summary,  # Using summary as content for arXiv
+        'summary': content_store.snippet(summary),
+        'published_date': published,
+        'source': 'arXiv',
+        'pdf_url': pdf_url,
+        'doi': doi,
+        'arxiv_id': arxiv_id
+    }, summary)
+
+def _search_live(query, max_results, newest=False):
+    """
+    Searches the arXiv export API, by relevance or, with ``newest``, by
+    submission date.
+    """
+    import arxiv
+
+    sort_by = arxiv.SortCriterion.SubmittedDate if newest else arxiv.SortCriterion.Relevance
+    search = arxiv.Search(query=query, max_results=max_results, sort_by=sort_by)
+    with _client_lock, resilience.guard_for_url(ARXIV_API_URL).call():
+        results = list(_get_client().results(search))
+
+    papers = []
+    for result in results:
+        # Format authors as a string
+        authors_str = ', '.join([author.name for author in result.authors])
+
+        # Clean summary, with fallback
+        if result.summary:
+            summary = result.summary.replace('\n', ' ').strip()
+        else:
+            # Fallback: create summary from available metadata
+            summary = f"arXiv preprint in category {result.primary_category}. "
+            if result.categories:
+                summary += f"Categories: {', '.join(result.categories[:3])}. "
+            summary += f"Submitted on {result.published.strftime('%Y-%m-%d')}."
+
+        papers.append(_result(
+            _VERSION.sub('', result.get_short_id()), result.entry_id, result.title, authors_str, summary,
+            result.published.strftime('%Y-%m-%d'), result.pdf_url, result.doi
+        ))
+    return papers
+
+def _search_local(index, query, max_results):
+    return [
+        _result(
+            paper['id'], f"https://arxiv.org/abs/{paper['id']}", paper['title'], paper['authors'], paper['abstract'],
+            paper['published'], f"https://arxiv.org/pdf/{paper['id']}", paper['doi']
+        )
+        for paper in index.search(query, max_results)
+    ]
+
+@coalesced
 def search_arxiv(query, max_results=5):
     """
-    Searches arXiv for a given query and returns the results.
+    Searches arXiv for a given query and returns the results, best match first.
+
+    Searches are served from the local index (see arxiv_index) when one has
+    been built. The live export API is only asked when there is no index,
+    when the index has too few matches, or when it is stale, in which case
+    up to half the results are papers submitted since it was last updated.
     """
     papers = []
+    index = arxiv_index.get_index()
+    if index is not None:
+        try:
+            papers = _search_local(index, query, max_results)
+            if len(papers) >= max_results and not index.stale():
+                return papers
+        except sqlite3.Error as e:
+            log.warning("local index failed", error=repr(e))
+            index = None
+
     try:
-        # The timeout argument was causing an error, so it has been removed.
-        # The new cleaner script will handle timeouts globally.
-        client = arxiv.Client()
-
-        # Search for articles
-        search = arxiv.Search(
-            query=query,
-            max_results=max_results,
-            sort_by=SortCriterion.SubmittedDate
-        )
-        
-        results = client.results(search)
-        
-        for result in results:
-            # Format authors as a string
-            authors_str = ', '.join([author.name for author in result.authors])
-            
-            # Clean and truncate summary, with fallback
-            if result.summary:
-                summary = result.summary.replace('\n', ' ').strip()
-            else:
-                # Fallback: create summary from available metadata
-                summary = f"arXiv preprint in category {result.primary_category}. "
-                if result.categories:
-                    summary += f"Categories: {', '.join(result.categories[:3])}. "
-                summary += f"Submitted on {result.published.strftime('%Y-%m-%d')}."
-            
-            if len(summary) > 1000:
-                summary = summary[:1000] + "..."
-            
-            papers.append({
-                'url': result.entry_id,
-                'title': result.title,
-                'author': authors_str,
-                'content': summary,  # Using summary as content for arXiv
-                'summary': summary,
-                'published_date': result.published.strftime('%Y-%m-%d'),
-                'source': 'arXiv',
-                'pdf_url': result.pdf_url,
-                'doi': None  # arXiv papers don't have DOIs initially
-            })
-            
+        if index is None or len(papers) < max_results:
+            live = _search_live(query, max_results)
+        else:
+            # Stale index: the newest matches are the ones it lacks
+            newest = index.newest() or ''
+            live = [
+                paper for paper in _search_live(query, max_results, newest=True)
+                if paper['published_date'] > newest
+            ][:max(1, max_results // 2)]
+            papers = papers[:max_results - len(live)]
     except Exception as e:
         print(f"An error occurred while searching arXiv: {e}")
-        return []
-        
-    return papers
+        return papers
+
+    known = {paper['arxiv_id'] for paper in papers}
+    papers += [paper for paper in live if paper['arxiv_id'] not in known]
+    return papers[:max_results]
 
 if __name__ == "__main__":
     search_query = "quantum entanglement"
@@ -72,8 +140,7 @@ if __name__ == "__main__":
         for i, paper in enumerate(scraped_papers, 1):
             print(f"\n--- Result {i} ---")
             print(f"Title: {paper['title']}")
-            authors = paper['authors']
-            print(f"Authors: {', '.join(authors)}")
+            print(f"Authors: {paper['author']}")
             print(f"Published: {paper['published_date']}")
             summary = textwrap.fill(paper['summary'], width=100)
             print(f"Summary:\n{summary}")
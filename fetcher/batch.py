@@ -0,0 +1,127 @@
+import asyncio
+import copy
+import time
+
+from fetcher import doi_resolver, fanout, pdf_text, pubmed, semantic_scholar, tracing, wikidata, wikipedia
+from fetcher.budget import Deadline
+from fetcher.logs import get_logger
+from fetcher.metrics import timed_source
+
+log = get_logger('batch')
+
+# Sources that can answer many queries with fewer upstream calls than one
+# call per query: each takes a list of queries and returns {query: results}
+BATCH_SOURCES = {
+    "PubMed": lambda queries, n: pubmed.search_pubmed_many(queries, n),
+    "Semantic Scholar": lambda queries, n: semantic_scholar.search_semantic_scholar_many(queries, n),
+    "Wikipedia": lambda queries, n: wikipedia.get_articles_by_query(queries, n),
+    "Wikidata": lambda queries, n: wikidata.search_wikidata_many(queries, n),
+}
+
+# Queries are run in waves of this size; each wave shares one batched call
+# per batch source and the browser pool works through its pages together
+WAVE_SIZE = 16
+
+def normalize_query(query):
+    return ' '.join(query.split()).casefold()
+
+def plan(queries):
+    """
+    Collapses identical queries (ignoring case and spacing) and splits the
+    distinct ones into waves.
+
+    Returns:
+        A tuple of (waves, positions): ``waves`` lists distinct queries in
+        first-seen order, ``positions`` maps each of them to every index it
+        occupies in ``queries``.
+    """
+    positions = {}
+    distinct = []
+    first_seen = {}
+    for index, query in enumerate(queries):
+        key = normalize_query(query)
+        if key not in first_seen:
+            first_seen[key] = query
+            distinct.append(query)
+        positions.setdefault(first_seen[key], []).append(index)
+    waves = [distinct[start:start + WAVE_SIZE] for start in range(0, len(distinct), WAVE_SIZE)]
+    return waves, positions
+
+def _start_shared(queries, num_results):
+    loop = asyncio.get_running_loop()
+    shared = {}
+    for source, fetch_many in BATCH_SOURCES.items():
+        host = fanout.API_SOURCES[source][0]
+        if fanout.skip_reason(host):
+            # run_sources reports the skip for every query
+            continue
+        shared[source] = loop.run_in_executor(
+            fanout._executor, tracing.bind(timed_source(source, fetch_many)), queries, num_results
+        )
+    return shared
+
+async def _research(query, num_results, deadline, enrich, shared, page_tasks, full_text=False):
+    start_time = time.time()
+    report = await fanout.run_sources(query, num_results, deadline, shared=shared, page_tasks=page_tasks)
+    if enrich and not deadline.expired():
+        report['results'] = await asyncio.get_running_loop().run_in_executor(
+            None, tracing.bind(doi_resolver.enhance_results_with_abstracts), report['results'], deadline
+        )
+    if full_text and not deadline.expired():
+        report['results'] = await asyncio.get_running_loop().run_in_executor(
+            None, tracing.bind(pdf_text.enhance_results_with_full_text), report['results'], query, deadline
+        )
+    report['execution_time'] = time.time() - start_time
+    return report
+
+async def run_batch(queries, num_results=3, deadline=None, enrich=False, full_text=False):
+    """
+    Researches many queries under one deadline, sharing work between them.
+
+    - identical queries run once
+    - batch sources are called once per wave for all of its queries
+    - a URL found by several queries is scraped once
+    - a DOI found by several queries is resolved once (see doi_resolver)
+    - a PDF found by several queries is parsed once (see pdf_text)
+
+    Yields (index, query, report) as each query finishes, where ``report`` is
+    what fanout.run_sources returns plus ``execution_time``, or ``{'error':
+    ...}`` if the query failed. A query that appears several times is
+    yielded once per position.
+    """
+    deadline = deadline or Deadline()
+    waves, positions = plan(queries)
+    page_tasks = {}
+    log.info("batch started", queries=len(queries), distinct=len(positions), waves=len(waves))
+
+    pending = {}
+    try:
+        for wave in waves:
+            shared = {} if deadline.expired() else _start_shared(wave, num_results)
+            pending = {
+                asyncio.ensure_future(
+                    _research(query, num_results, deadline, enrich, shared, page_tasks, full_text)
+                ): query
+                for query in wave
+            }
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    query = pending.pop(task)
+                    if task.exception() is not None:
+                        log.warning("query failed", query=query, error=repr(task.exception()))
+                        report = {'error': str(task.exception())}
+                    else:
+                        report = task.result()
+                    indices = positions[query]
+                    yield indices[0], queries[indices[0]], report
+                    for index in indices[1:]:
+                        yield index, queries[index], copy.deepcopy(report)
+    finally:
+        # Reached early when the consumer stops reading (e.g. the client disconnects)
+        for task in pending:
+            task.cancel()
+        for task in page_tasks.values():
+            task.cancel()
+        await asyncio.gather(*pending, *page_tasks.values(), return_exceptions=True)
+        log.info("batch finished", queries=len(queries), pages=len(page_tasks))
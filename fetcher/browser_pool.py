@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fetcher import memory
+from fetcher.logs import get_logger
+
+log = get_logger('browser_pool')
+
+# V8 heap limit of each page, in MB; a page that outgrows it crashes on its
+# own instead of taking the browser's memory with it
+JS_HEAP_MB = int(os.environ.get("BROWSER_JS_HEAP_MB", "512"))
+LAUNCH_ARGS = [
+    '--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu', f'--js-flags=--max-old-space-size={JS_HEAP_MB}'
+]
+
+# Pages open at once across all requests sharing the browser
+MAX_PAGES = 8
+# A browser whose processes together use more than this is replaced: new
+# pages go to a fresh one and it is closed once its open pages are done
+MAX_BROWSER_RSS_MB = int(os.environ.get("BROWSER_MAX_RSS_MB", "1500"))
+# The browser's memory is read after a page closes, at most this often
+RSS_CHECK_SECONDS = 5
+
+# Longest page HTML handed to Python. A larger page is first stripped of the
+# subtrees no scraper reads, then cut at this length, so one giant listing
+# or infinite-scroll page cannot fill the worker with its string and tree.
+MAX_HTML_CHARS = int(os.environ.get("PAGE_MAX_HTML_CHARS", str(2_000_000)))
+STRIP_SELECTOR = 'script, style, noscript, template, svg, canvas, iframe, object'
+
+# Serialises the page inside Chromium; returns [html, length before
+# stripping, whether it was cut]
+_PAGE_HTML_JS = """([maxChars, strip]) => {
+    const root = document.documentElement;
+    let html = root.outerHTML;
+    const chars = html.length;
+    if (chars > maxChars) {
+        for (const element of document.querySelectorAll(strip)) element.remove();
+        html = root.outerHTML;
+    }
+    return html.length > maxChars ? [html.slice(0, maxChars), chars, true] : [html, chars, false];
+}"""
+
+class BrowserPool:
+    """
+    One shared headless Chromium for every scraper in the process.
+
+    The browser is launched on first use and relaunched if it disconnects
+    or outgrows ``max_rss_mb``; callers borrow pages through page(), which
+    caps how many are open at once.
+    """
+
+    def __init__(self, max_pages=MAX_PAGES, max_rss_mb=MAX_BROWSER_RSS_MB):
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.pages_in_use = 0
+        self.launches = 0
+        self.recycles = 0
+        self.browser_rss_mb = None
+        self._playwright = None
+        self._browser = None
+        # PID of the current browser's main process, where /proc shows it
+        self._browser_pid = None
+        # Open pages per browser, including browsers being retired
+        self._open_pages = {}
+        self._retiring = set()
+        self._checked_at = 0.0
+        self._launch_lock = asyncio.Lock()
+        self._page_slots = asyncio.Semaphore(max_pages)
+        self.loop = asyncio.get_running_loop()
+
+    async def browser(self):
+        async with self._launch_lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    # Imported here so processes that never browse skip it
+                    from playwright.async_api import async_playwright
+
+                    self._playwright = await async_playwright().start()
+                running = await asyncio.to_thread(memory.chromium_browsers)
+                self._browser = await self._playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+                self.launches += 1
+                # The new browser is the Chromium that was not running before
+                launched = set(await asyncio.to_thread(memory.chromium_browsers)) - set(running)
+                self._browser_pid = launched.pop() if len(launched) == 1 else None
+                self.browser_rss_mb = None
+            return self._browser
+
+    async def _check_memory(self, browser):
+        # Retires the current browser once it outgrows max_rss_mb
+        if browser is not self._browser or self._browser_pid is None \
+                or time.monotonic() - self._checked_at < RSS_CHECK_SECONDS:
+            return
+        self._checked_at = time.monotonic()
+        rss = (await asyncio.to_thread(memory.chromium_browsers)).get(self._browser_pid)
+        if rss is None:
+            return
+        self.browser_rss_mb = round(rss, 1)
+        if rss <= self.max_rss_mb:
+            return
+        async with self._launch_lock:
+            if browser is self._browser:
+                log.info("browser recycled", rss_mb=round(rss, 1), max_rss_mb=self.max_rss_mb)
+                self._retiring.add(browser)
+                self._browser = None
+                self._browser_pid = None
+                self.browser_rss_mb = None
+                self.recycles += 1
+
+    async def _release(self, browser):
+        self._open_pages[browser] -= 1
+        if self._open_pages[browser]:
+            return
+        del self._open_pages[browser]
+        if browser in self._retiring:
+            self._retiring.discard(browser)
+            try:
+                await browser.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def page(self):
+        async with self._page_slots:
+            browser = await self.browser()
+            self._open_pages[browser] = self._open_pages.get(browser, 0) + 1
+            try:
+                page = await browser.new_page()
+                self.pages_in_use += 1
+                try:
+                    yield page
+                finally:
+                    self.pages_in_use -= 1
+                    try:
+                        await page.close()
+                    except Exception:
+                        pass
+                await self._check_memory(browser)
+            finally:
+                await self._release(browser)
+
+    async def close(self):
+        async with self._launch_lock:
+            for browser in list(self._retiring):
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+            self._retiring.clear()
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception:
+                    pass
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+    def stats(self):
+        return {
+            'pages_in_use': self.pages_in_use,
+            'max_pages': self.max_pages,
+            'browser_launches': self.launches,
+            'browser_recycles': self.recycles,
+            'browser_rss_mb': self.browser_rss_mb,
+            'max_browser_rss_mb': self.max_rss_mb,
+            'browser_running': self._browser is not None and self._browser.is_connected(),
+        }
+
+async def page_html(page, max_chars=MAX_HTML_CHARS):
+    """
+    The page's HTML, at most ``max_chars`` long, as (html, characters the
+    page had, whether it was cut). Pages over the limit are altered: their
+    scripts, styles and embeds are removed from the DOM.
+    """
+    return tuple(await page.evaluate(_PAGE_HTML_JS, [max_chars, STRIP_SELECTOR]))
+
+_pool = None
+
+def get_pool():
+    """Returns the process-wide pool for the running event loop."""
+    global _pool
+    if _pool is None or _pool.loop is not asyncio.get_running_loop():
+        _pool = BrowserPool()
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+def pool_stats():
+    return _pool.stats() if _pool is not None else None
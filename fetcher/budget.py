@@ -0,0 +1,53 @@
+import time
+
+# Completion states reported for each source and page
+COMPLETE = 'complete'
+PARTIAL = 'partial'
+SKIPPED = 'skipped'
+
+class Deadline:
+    """
+    A point in time by which a request must answer.
+
+    Created from a millisecond budget; ``Deadline(None)`` never expires, so
+    code can take a deadline unconditionally and behave as before when the
+    caller did not ask for one.
+    """
+
+    def __init__(self, budget_ms=None):
+        self.budget_ms = budget_ms
+        self.expires_at = None if budget_ms is None else time.monotonic() + budget_ms / 1000
+
+    def remaining(self):
+        """Seconds left, or None when there is no deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def timeout(self, default):
+        """Clips a per-operation timeout (seconds) to the time that is left."""
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def timeout_ms(self, default):
+        """
+        timeout() in milliseconds, never below 1: clients such as Playwright
+        treat a timeout of 0 as no timeout at all.
+        """
+        return max(1, int(self.timeout(default) * 1000))
+
+    def reserve(self, seconds):
+        """
+        Returns a deadline that expires ``seconds`` earlier than this one.
+
+        Lets a sub-task wrap up and hand back partial results before the
+        caller stops waiting for it.
+        """
+        child = Deadline()
+        child.budget_ms = self.budget_ms
+        if self.expires_at is not None:
+            child.expires_at = self.expires_at - seconds
+        return child
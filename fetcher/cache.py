@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    A small thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Fetchers share it for memoising upstream lookups (entities, IDs, pages)
+    so repeated queries within a worker do not hit the network again. Every
+    cache is registered under its name so its hit ratio can be reported.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=3600):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _caches[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_many(self, keys):
+        """Return a dict of the keys that are cached and still fresh."""
+        found = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, items, ttl=None):
+        for key, value in items.items():
+            self.set(key, value, ttl=ttl)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+_MISSING = object()
+_caches = {}
+
+def cache_stats():
+    """Size, hits and misses for every named cache in the process."""
+    return {
+        name: {'size': len(cache), 'hits': cache.hits, 'misses': cache.misses}
+        for name, cache in sorted(_caches.items())
+    }
@@ -0,0 +1,122 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; without it responses are only ever gzipped
+    brotli = None
+
+# Small bodies gain little and cost a round of compression each
+MINIMUM_SIZE = 1024
+
+# Fast settings: responses are compressed on every request, never cached
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+# Sent as they are written: holding their headers back would delay the
+# response until the first line, e.g. a job's first event
+STREAMED_TYPES = ('application/x-ndjson', 'text/event-stream')
+
+def supported_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def choose_encoding(accept_encoding):
+    """
+    Picks the best encoding the client accepts, preferring Brotli, or None.
+    Encodings listed with q=0 are refused.
+    """
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in supported_encodings():
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """
+    Compresses complete JSON and text responses with Brotli or gzip, as
+    negotiated through Accept-Encoding.
+
+    Streamed responses (NDJSON batches, server-sent events) are passed
+    through untouched, headers included, so that each line still reaches
+    the client as soon as it is written. So are partial (206) responses and
+    any carrying Content-Range, whose byte offsets would no longer match.
+    """
+
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope['headers'])
+        encoding = choose_encoding(headers.get(b'accept-encoding', b'').decode('latin-1'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                response_headers = dict(message['headers'])
+                content_type = response_headers.get(b'content-type', b'').decode('latin-1')
+                if (
+                    content_type.startswith(STREAMED_TYPES)
+                    or b'content-encoding' in response_headers
+                    # Content-Range offsets refer to the uncompressed body
+                    or message['status'] == 206
+                    or b'content-range' in response_headers
+                ):
+                    await send(message)
+                    return
+                # Held back until the first body message shows whether the response is streamed
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+
+            response_start, start = start, None
+            body = message.get('body', b'')
+            response_headers = dict(response_start['headers'])
+            content_type = response_headers.get(b'content-type', b'').decode('latin-1')
+            if (
+                message.get('more_body', False)
+                or len(body) < self.minimum_size
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(response_start)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            raw_headers = [(name, value) for name, value in response_start['headers'] if name.lower() != b'content-length']
+            raw_headers += [
+                (b'content-encoding', encoding.encode()),
+                (b'content-length', str(len(body)).encode()),
+                (b'vary', b'Accept-Encoding'),
+            ]
+            await send(dict(response_start, headers=raw_headers))
+            await send(dict(message, body=body))
+
+        await self.app(scope, receive, send_compressed)
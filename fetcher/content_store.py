@@ -0,0 +1,184 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from fetcher.logs import get_logger
+
+log = get_logger('content_store')
+
+CONTENT_DB_PATH = os.environ.get(
+    "CONTENT_DB_PATH", os.path.join(tempfile.gettempdir(), "deepresearch_content.sqlite3")
+)
+# Kept well beyond the fetcher caches' TTLs, so a cached result never
+# carries a handle whose text has already expired
+CONTENT_RETENTION_SECONDS = int(os.environ.get("CONTENT_RETENTION_SECONDS", str(24 * 3600)))
+# Results inline this much of their text; the rest is served by /content
+SNIPPET_CHARS = int(os.environ.get("CONTENT_SNIPPET_CHARS", "500"))
+# Largest page /content returns in one response
+MAX_PAGE_CHARS = 100000
+
+PURGE_INTERVAL_SECONDS = 600
+
+class ContentStore:
+    """
+    Keeps the full extracted text of results in SQLite, keyed by a hash of
+    the text, so the same document fetched twice is stored once.
+    """
+
+    def __init__(self, path=CONTENT_DB_PATH, retention_seconds=CONTENT_RETENTION_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._purged_at = 0.0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS content (
+                    id TEXT PRIMARY KEY,
+                    source TEXT,
+                    text TEXT NOT NULL,
+                    stored_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS content_stored_at ON content (stored_at)")
+
+    def put(self, text, source=None):
+        handle = hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+        now = time.time()
+        with self._lock:
+            # Storing the same text again keeps it for another retention period
+            self._conn.execute(
+                "INSERT INTO content (id, source, text, stored_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET stored_at = excluded.stored_at",
+                (handle, source, text, now)
+            )
+        if now - self._purged_at > PURGE_INTERVAL_SECONDS:
+            self.purge(now - self.retention_seconds)
+        return handle
+
+    def get(self, handle):
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM content WHERE id = ?", (handle,)).fetchone()
+        return row[0] if row else None
+
+    def purge(self, stored_before):
+        self._purged_at = time.time()
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM content WHERE stored_at < ?", (stored_before,)).rowcount
+        if removed:
+            log.info("expired content purged", documents=removed)
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Returns the process's store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ContentStore()
+        return _store
+
+# Handle prefix -> function loading the text on demand, for sources whose
+# results point at text that was never downloaded (e.g. "wikipedia:123").
+# A loader returns None for a handle it cannot resolve, malformed ones
+# included, and raises only when its source fails.
+_loaders = {}
+
+def register_loader(prefix, loader):
+    _loaders[prefix] = loader
+
+def snippet(text, size=SNIPPET_CHARS):
+    """The start of ``text``, cut at a word boundary when it is longer than ``size``."""
+    if len(text) <= size:
+        return text
+    cut = text.rfind(' ', 0, size)
+    return text[:cut if cut > size // 2 else size].rstrip() + "..."
+
+def attach(result, text):
+    """
+    Stores ``text`` as the result's full content and replaces its inline
+    content with a snippet, a ``content_handle`` and the full length.
+    """
+    try:
+        result['content_handle'] = get_store().put(text, result.get('source'))
+    except sqlite3.Error as e:
+        # Without the store the result still carries its snippet
+        log.warning("content not stored", source=result.get('source'), error=repr(e))
+        result['content_handle'] = None
+    result['content'] = snippet(text)
+    result['content_length'] = len(text)
+    return result
+
+def load(handle):
+    """
+    Returns the full text behind a content handle, or None if it is unknown
+    or has expired.
+    """
+    prefix, _, key = handle.partition(':')
+    if key:
+        loader = _loaders.get(prefix)
+        return loader(handle) if loader else None
+    return get_store().get(handle)
+
+def read(handle, offset=0, limit=None):
+    """
+    Returns one page of a document, or None if the handle is unknown.
+    """
+    text = load(handle)
+    return read_text(handle, text, offset, limit) if text is not None else None
+
+def read_text(handle, text, offset=0, limit=None):
+    """
+    Pages an already loaded document: ``limit`` characters from ``offset``
+    (at most MAX_PAGE_CHARS), with the offset of the next page, or None
+    once there is nothing further.
+    """
+    limit = min(limit or MAX_PAGE_CHARS, MAX_PAGE_CHARS)
+    page = text[offset:offset + limit]
+    end = offset + len(page)
+    return {
+        'id': handle,
+        'offset': offset,
+        'length': len(page),
+        'total_length': len(text),
+        'next_offset': end if end < len(text) else None,
+        'content': page,
+    }
+
+def parse_range(header, size):
+    """
+    Parses a single HTTP byte range (``bytes=0-99``, ``bytes=100-`` or
+    ``bytes=-100``) against a body of ``size`` bytes.
+
+    Returns (start, end) with ``end`` inclusive; raises ValueError if the
+    header is malformed or the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        raise ValueError(f"Unsupported range: {header}")
+    first, _, last = spec.strip().partition('-')
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, end
+
+if __name__ == "__main__":
+    result = attach({'source': 'Example'}, "A long document. " * 100)
+    print(result['content_handle'], result['content_length'], result['content'][:60])
+    print(read(result['content_handle'], offset=1000, limit=50))
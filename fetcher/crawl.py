@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import math
+import re
+from urllib import robotparser
+from urllib.parse import urlparse
+
+from fetcher import dedup, passages, resilience, tracing, websearch
+from fetcher.budget import Deadline, SKIPPED
+from fetcher.cache import TTLCache
+from fetcher.logs import get_logger
+from fetcher.metrics import CRAWL_LINKS
+from fetcher.singleflight import SingleFlight
+
+log = get_logger('crawl')
+
+# Crawls are bounded three ways: link depth from the seeds, pages fetched in
+# total, and the request's time budget (this one if it has none)
+MAX_DEPTH = 2
+MAX_PAGES = 20
+DEFAULT_BUDGET_MS = 30000
+# Pages loaded at once by one crawl; the browser pool caps all crawls together
+CONCURRENCY = 4
+
+ROBOTS_USER_AGENT = 'DeepResearchBot'
+_robots_cache = TTLCache('crawl.robots', maxsize=1000, ttl=3600)
+_robots_flight = SingleFlight('crawl.robots')
+
+_WORD = re.compile(r'\w+')
+
+class BloomFilter:
+    """
+    A fixed-size set of strings that may report false positives but never
+    false negatives. Sized for ``capacity`` items at ``error_rate``; a crawl
+    frontier holding thousands of URLs fits in a few kilobytes.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        """Adds ``item``; returns False if it was (probably) already present."""
+        added = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                added = True
+        return added
+
+    def __contains__(self, item):
+        return all(self._bits[position // 8] & (1 << position % 8) for position in self._positions(item))
+
+class Frontier:
+    """
+    URLs waiting to be crawled, best first: highest link score, then
+    shallowest depth, then discovery order. Every URL is accepted once,
+    counting variants with the same canonical form as one.
+    """
+
+    def __init__(self, capacity):
+        self._seen = BloomFilter(capacity)
+        self._heap = []
+        self._seq = itertools.count()
+
+    def push(self, url, depth, score=0.0):
+        if not self._seen.add(dedup.canonical_url(url)):
+            return False
+        heapq.heappush(self._heap, (-score, depth, next(self._seq), url))
+        return True
+
+    def pop(self):
+        """Returns (url, depth) of the best waiting URL."""
+        _, depth, _, url = heapq.heappop(self._heap)
+        return url, depth
+
+    def __len__(self):
+        return len(self._heap)
+
+def _bounded(deadline):
+    # A crawl always has a time limit, even when the request has none
+    if deadline is None or deadline.remaining() is None:
+        return Deadline(DEFAULT_BUDGET_MS)
+    return deadline
+
+def site_of(url):
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+def query_terms(query):
+    return {term for term in _WORD.findall(query.lower()) if len(term) > 2}
+
+def link_score(terms, url, text):
+    """
+    Relevance of a link to the query: query terms in the link text count
+    twice as much as terms in the URL path.
+    """
+    if not terms:
+        return 0.0
+    text_words = set(_WORD.findall(text.lower()))
+    path_words = set(_WORD.findall(urlparse(url).path.lower()))
+    return (2 * len(terms & text_words) + len(terms & path_words)) / len(terms)
+
+def _fetch_robots(origin):
+    parser = robotparser.RobotFileParser(origin + '/robots.txt')
+    try:
+        response = resilience.get(origin + '/robots.txt', timeout=5)
+    except Exception as e:
+        # Unreachable robots.txt: crawl as if there were none
+        log.debug("robots.txt unavailable", origin=origin, error=repr(e))
+        parser.parse([])
+        return parser
+    if response.status_code in (401, 403):
+        parser.disallow_all = True
+    elif response.status_code >= 400:
+        parser.parse([])
+    else:
+        parser.parse(response.text.splitlines())
+    return parser
+
+def robots_parser(origin):
+    """The parsed robots.txt of an origin, fetched once an hour at most."""
+    parser = _robots_cache.get(origin)
+    if parser is None:
+        parser = _robots_flight.do(origin, _fetch_robots, origin)
+        _robots_cache.set(origin, parser)
+    return parser
+
+async def allowed(url):
+    parsed = urlparse(url)
+    parser = await asyncio.to_thread(robots_parser, f"{parsed.scheme}://{parsed.netloc}")
+    return parser.can_fetch(ROBOTS_USER_AGENT, url)
+
+async def crawl(query, seeds, deadline=None, max_depth=MAX_DEPTH, max_pages=MAX_PAGES, concurrency=CONCURRENCY):
+    """
+    Crawls outwards from ``seeds``, following same-site links best first.
+
+    Seed pages are loaded as they are; pages found by following links are
+    checked against the site's robots.txt first and skipped if disallowed.
+    The crawl stops when the frontier is empty, ``max_pages`` pages have
+    been loaded, or the deadline passes, at which point pages still loading
+    are cancelled. Pages that duplicate one already crawled are dropped and
+    their links are not followed.
+
+    Returns:
+        A dict with the scraped ``results`` (each with its ``crawl_depth``
+        and focused on the query's passages), ``pages``, mapping the URL of
+        every result or skipped page to its completion state, and the
+        ``duplicates`` dropped.
+    """
+    deadline = _bounded(deadline)
+    scraper = websearch.AdvancedWebScraper()
+    terms = query_terms(query)
+    seed_sites = {site_of(url) for url in seeds}
+    frontier = Frontier(capacity=max(1000, max_pages * websearch.MAX_LINKS_PER_PAGE))
+    for url in seeds:
+        frontier.push(url, 0, math.inf)
+
+    async def visit(url, depth):
+        if depth and not await allowed(url):
+            CRAWL_LINKS.labels('robots').inc()
+            return None, None
+        return await scraper.scrape_page_with_links(url, deadline)
+
+    dedup_state = dedup.Deduplicator()
+    results, pages, running = [], {}, {}
+    started = 0
+    try:
+        while not deadline.expired():
+            while frontier and len(running) < concurrency and started < max_pages:
+                url, depth = frontier.pop()
+                running[asyncio.ensure_future(visit(url, depth))] = (url, depth)
+                started += 1
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                url, depth = running.pop(task)
+                result, links = task.result()
+                if links is None:
+                    # Disallowed by robots.txt: not loaded, so not counted against the budget
+                    started -= 1
+                    continue
+                if result is None:
+                    pages[url] = SKIPPED
+                    continue
+                if dedup_state.check_result(url, result) is not None:
+                    continue
+                result['crawl_depth'] = depth
+                results.append(result)
+                pages[url] = result['fetch_status']
+                if depth >= max_depth:
+                    continue
+                for link, text in links:
+                    if site_of(link) not in seed_sites:
+                        CRAWL_LINKS.labels('offsite').inc()
+                    elif frontier.push(link, depth + 1, link_score(terms, link, text)):
+                        CRAWL_LINKS.labels('queued').inc()
+                    else:
+                        CRAWL_LINKS.labels('duplicate').inc()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+    for url, _ in running.values():
+        pages[url] = SKIPPED
+    await asyncio.to_thread(passages.focus_all, results, query)
+
+    log.info("crawl finished", query=query, seeds=len(seeds), pages=len(results), frontier=len(frontier))
+    return {'results': results, 'pages': pages, 'duplicates': dedup_state.duplicates}
+
+async def crawl_web(query, num_results=3, deadline=None, max_depth=MAX_DEPTH, max_pages=MAX_PAGES):
+    """
+    Searches the web and crawls from the top ``num_results`` result pages.
+    """
+    deadline = _bounded(deadline)
+    try:
+        with tracing.span('search_engine'):
+            seeds = await asyncio.wait_for(
+                asyncio.to_thread(websearch.find_urls, query, num_results), timeout=deadline.remaining()
+            )
+    except Exception as e:
+        log.warning("search failed", query=query, error=repr(e))
+        return {'results': [], 'pages': {}, 'duplicates': []}
+    with tracing.span('crawl', seeds=len(seeds)):
+        return await crawl(query, seeds, deadline, max_depth, max_pages=max(max_pages, len(seeds)))
+
+if __name__ == "__main__":
+    report = asyncio.run(crawl_web("python asyncio tutorial", num_results=2, max_pages=6))
+    for result in report['results']:
+        print(result['crawl_depth'], result['url'], result['title'])
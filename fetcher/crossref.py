@@ -1,11 +1,19 @@
 import requests
 import json
+import os
 
+from fetcher import content_store, resilience
+from fetcher.singleflight import coalesced
+
+CROSSREF_API_URL = os.environ.get("CROSSREF_API_URL", "https://api.crossref.org")
+
+@coalesced
 def search_crossref(query, max_results=5):
     """
     Searches CrossRef for a given query.
     """
-    url = f"https://api.crossref.org/works?query.bibliographic={query}&rows={max_results}"
+    url = f"{CROSSREF_API_URL}/works"
+    params = {'query.bibliographic': query, 'rows': max_results}
     # It's good practice to identify your client in the User-Agent
     headers = {
         'User-Agent': 'FetcherBot/1.0 (mailto:transformtrails@gmail.com)'
@@ -13,7 +21,7 @@ def search_crossref(query, max_results=5):
     
     results_data = []
     try:
-        response = requests.get(url, headers=headers, timeout=8)
+        response = resilience.get(url, params=params, headers=headers, timeout=8)
         response.raise_for_status()
         data = response.json()
         
@@ -79,27 +87,24 @@ def search_crossref(query, max_results=5):
                 
                 content = '. '.join(content_parts) if content_parts else f"Research paper: {title}"
             
-            if len(content) > 500:
-                content = content[:500] + "..."
-            
             # Create URL from DOI if available
             doi = item.get('DOI')
             url = f"https://doi.org/{doi}" if doi else item.get('URL', 'No URL available')
             
-            results_data.append({
+            results_data.append(content_store.attach({
                 'url': url,
                 'title': title,
                 'author': authors_str,
                 'content': content,
-                'summary': content,
+                'summary': content_store.snippet(content),
                 'published_date': str(year) if year else 'Unknown',
                 'source': 'CrossRef',
                 'publisher': item.get('publisher', 'Unknown'),
                 'doi': doi,
                 'journal': item.get('container-title', ['Unknown'])[0] if item.get('container-title') else 'Unknown'
-            })
+            }, content))
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, resilience.UpstreamUnavailable) as e:
         print(f"An error occurred while searching CrossRef: {e}")
         return []
     
@@ -0,0 +1,137 @@
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from fetcher.metrics import DUPLICATE_PAGES
+
+# Fingerprints this many bits apart or fewer are the same document; unrelated
+# pages differ in about half of the 64 bits
+NEAR_DUPLICATE_DISTANCE = 6
+# Shorter texts (error pages, "no content" placeholders) are not fingerprinted,
+# as unrelated pages would collide
+MIN_FINGERPRINT_CHARS = 200
+SHINGLE_WORDS = 3
+
+# Hosts that serve the same pages as their bare domain
+_HOST_PREFIXES = ('www.', 'm.', 'mobile.', 'amp.')
+# Query parameters that only track where a visitor came from
+_TRACKING_PARAMS = {'gclid', 'fbclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid', 'ref', 'ref_src', 'spm', 'amp', 'outputtype'}
+_AMP_PATH = re.compile(r'/(?:amp(?:\.html)?|index\.(?:html?|php))$')
+_WORD = re.compile(r'\w+')
+
+def canonical_url(url):
+    """
+    A comparison key for a URL: scheme, www./m./amp. host prefixes, AMP and
+    index suffixes, tracking parameters, parameter order, fragments and
+    trailing slashes are all ignored.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = _AMP_PATH.sub('', parts.path.rstrip('/'))
+    if path.endswith('.amp'):
+        path = path[:-4]
+    params = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith('utm_') and name.lower() not in _TRACKING_PARAMS
+    )
+    key = host + (path.rstrip('/') or '/')
+    return f"{key}?{urlencode(params)}" if params else key
+
+def simhash(text):
+    """
+    A 64-bit SimHash of the text's three-word shingles, or None for texts
+    too short to fingerprint. Near-identical texts differ in few bits.
+    """
+    if len(text) < MIN_FINGERPRINT_CHARS:
+        return None
+    words = _WORD.findall(text.lower())
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = [
+        format(int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big'), '064b')
+        for shingle in shingles
+    ]
+    # Each bit is set when it is set in most shingle hashes; columns are counted in C
+    half = len(hashes) / 2
+    return int(''.join('1' if column.count('1') > half else '0' for column in zip(*hashes)), 2)
+
+def fingerprint(text):
+    """The text's SimHash as 16 hex digits, as carried by results, or None."""
+    value = simhash(text)
+    return None if value is None else f"{value:016x}"
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+class Deduplicator:
+    """
+    Tracks the pages kept for one request and spots duplicates of them:
+
+    - before loading, by canonical URL (mirrors, AMP and mobile versions)
+    - after loading, by the page's ``<link rel=canonical>`` and by a
+      content fingerprint within NEAR_DUPLICATE_DISTANCE bits
+
+    Every duplicate found is recorded in ``duplicates`` with the URL it
+    duplicates and why.
+    """
+
+    def __init__(self, max_distance=NEAR_DUPLICATE_DISTANCE):
+        self.max_distance = max_distance
+        self.duplicates = []
+        self._candidates = {}
+        self._kept = {}
+        self._fingerprints = []
+
+    def _record(self, url, original, reason):
+        self.duplicates.append({'url': url, 'duplicate_of': original, 'reason': reason})
+        DUPLICATE_PAGES.labels(reason).inc()
+
+    def check_url(self, url):
+        """
+        Call before loading a page. Returns the URL it duplicates among the
+        pages already checked, or None if it should be loaded.
+        """
+        key = canonical_url(url)
+        original = self._candidates.setdefault(key, url)
+        if original != url:
+            self._record(url, original, 'url')
+            return original
+        return None
+
+    def check_result(self, url, result):
+        """
+        Call once a page is loaded. Returns the URL of the kept page it
+        duplicates, or None, in which case the page is kept.
+        """
+        keys = {canonical_url(url)}
+        if result.get('canonical_url'):
+            keys.add(canonical_url(result['canonical_url']))
+        for key in keys:
+            original = self._kept.get(key)
+            if original is not None and original != url:
+                self._record(url, original, 'canonical')
+                return original
+
+        value = int(result['fingerprint'], 16) if result.get('fingerprint') else None
+        if value is not None:
+            for kept_value, original in self._fingerprints:
+                if distance(value, kept_value) <= self.max_distance:
+                    self._record(url, original, 'content')
+                    return original
+            self._fingerprints.append((value, url))
+        for key in keys:
+            self._kept.setdefault(key, url)
+        return None
+
+if __name__ == "__main__":
+    article = " ".join(f"Sentence {i} of the report describes finding number {i * 7 % 13}." for i in range(60))
+    print(canonical_url("https://www.example.com/news/story/amp/?utm_source=x&id=7#top"))
+    dedup = Deduplicator()
+    dedup.check_result("https://example.com/a", {'fingerprint': fingerprint(article)})
+    print(dedup.check_result("https://mirror.example.org/a", {'fingerprint': fingerprint(article + " Syndicated by Example Wire.")}))
+    print(dedup.duplicates)
@@ -1,30 +1,54 @@
-import requests
-from bs4 import BeautifulSoup
+import concurrent.futures
 import json
+import os
 
-def get_abstract_from_doi(doi):
+from fetcher import content_store, resilience, tracing
+from fetcher.budget import Deadline
+from fetcher.cache import TTLCache
+from fetcher.singleflight import SingleFlight
+
+DOI_RESOLVER_URL = os.environ.get("DOI_RESOLVER_URL", "https://doi.org")
+
+# Abstracts found on landing pages; misses are not cached so they are retried
+_abstract_cache = TTLCache('doi_resolver.abstracts', maxsize=5000, ttl=24 * 3600)
+
+# Concurrent lookups of one DOI (e.g. from several queries of a batch) share a request
+_flight = SingleFlight('doi_resolver.get_abstract_from_doi')
+
+def clean_doi(doi):
+    """Strips a resolver prefix, returning the bare DOI."""
+    if doi.startswith('https://doi.org/'):
+        return doi.replace('https://doi.org/', '')
+    if doi.startswith('http://dx.doi.org/'):
+        return doi.replace('http://dx.doi.org/', '')
+    return doi
+
+def get_abstract_from_doi(doi, timeout=10):
     """
     Try to get abstract from DOI by scraping the publisher's page
     """
     if not doi:
         return None
-    
-    # Clean DOI
-    if doi.startswith('https://doi.org/'):
-        clean_doi = doi.replace('https://doi.org/', '')
-    elif doi.startswith('http://dx.doi.org/'):
-        clean_doi = doi.replace('http://dx.doi.org/', '')
-    else:
-        clean_doi = doi
-    
+
+    key = clean_doi(doi)
+    abstract = _abstract_cache.get(key)
+    if abstract is None:
+        abstract = _flight.do(key, _fetch_abstract, key, timeout)
+        if abstract:
+            _abstract_cache.set(key, abstract)
+    return abstract
+
+def _fetch_abstract(doi, timeout):
+    from bs4 import BeautifulSoup
+
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
     
     try:
         # Try the DOI URL
-        url = f"https://doi.org/{clean_doi}"
-        response = requests.get(url, headers=headers, timeout=10, allow_redirects=True)
+        url = f"{DOI_RESOLVER_URL}/{doi}"
+        response = resilience.get(url, headers=headers, timeout=timeout, allow_redirects=True)
         
         if response.status_code == 200:
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -47,42 +71,69 @@ def get_abstract_from_doi(doi):
                 if abstract_elem:
                     abstract_text = abstract_elem.get_text(strip=True)
                     if len(abstract_text) > 50:  # Only return if substantial
-                        return abstract_text[:1000] + "..." if len(abstract_text) > 1000 else abstract_text
+                        return abstract_text
             
             # Try meta tags
             meta_abstract = soup.find('meta', attrs={'name': 'description'})
             if meta_abstract and meta_abstract.get('content'):
                 content = meta_abstract.get('content').strip()
                 if len(content) > 50:
-                    return content[:500] + "..." if len(content) > 500 else content
+                    return content
                     
     except Exception as e:
         print(f"Error fetching abstract for DOI {doi}: {e}")
     
     return None
 
-def enhance_results_with_abstracts(results):
+def _needs_abstract(item):
+    # If content is "No abstract available" or very short, try to get abstract from DOI
+    return bool(item.get('doi')) and (
+        item.get('content') in ['No abstract available', 'No information available'] or
+        (item.get('content') and len(item.get('content', '')) < 50))
+
+def _lookup(doi, timeout):
+    with tracing.span('doi_lookup', doi=doi):
+        return get_abstract_from_doi(doi, timeout)
+
+def enhance_results_with_abstracts(results, deadline=None, max_workers=4):
     """
     Enhance results by trying to fetch abstracts for items that don't have them
+
+    DOI pages are fetched concurrently. Lookups still running when the
+    deadline passes are abandoned and their items are returned unchanged.
     """
-    enhanced_results = []
-    
-    for item in results:
-        # If content is "No abstract available" or very short, try to get abstract from DOI
-        if (item.get('content') in ['No abstract available', 'No information available'] or 
-            (item.get('content') and len(item.get('content', '')) < 50)):
-            
-            doi = item.get('doi')
-            if doi:
-                print(f"Trying to fetch abstract for: {item.get('title', 'Unknown')}")
-                abstract = get_abstract_from_doi(doi)
-                if abstract:
-                    item['content'] = abstract
-                    item['summary'] = abstract[:300] + "..." if len(abstract) > 300 else abstract
-                    print(f"  -> Found abstract ({len(abstract)} chars)")
-                else:
-                    print(f"  -> No abstract found")
-        
-        enhanced_results.append(item)
+    deadline = deadline or Deadline()
+    candidates = [item for item in results if _needs_abstract(item)]
+    if not candidates or deadline.expired():
+        return results
+
+    # Several sources often return the same paper, so look each DOI up once
+    items_by_doi = {}
+    for item in candidates:
+        items_by_doi.setdefault(clean_doi(item['doi']), []).append(item)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    futures = {}
+    for doi, items in items_by_doi.items():
+        print(f"Trying to fetch abstract for: {items[0].get('title', 'Unknown')}")
+        futures[executor.submit(tracing.bind(_lookup), doi, deadline.timeout(10))] = items
+
+    done, not_done = concurrent.futures.wait(futures, timeout=deadline.remaining())
+    for future in not_done:
+        future.cancel()
+    executor.shutdown(wait=False)
+
+    for future in done:
+        items = futures[future]
+        abstract = future.result()
+        for item in items:
+            if abstract:
+                content_store.attach(item, abstract)
+                item['summary'] = abstract[:300] + "..." if len(abstract) > 300 else abstract
+                print(f"  -> Found abstract for {item.get('title', 'Unknown')} ({len(abstract)} chars)")
+            else:
+                print(f"  -> No abstract found for {item.get('title', 'Unknown')}")
+    if not_done:
+        print(f"  -> Ran out of time for {len(not_done)} abstract lookups")
     
-    return enhanced_results
\ No newline at end of file
+    return results
@@ -0,0 +1,245 @@
+import re
+
+# Subtrees that never hold main content; skipped without being visited
+SKIP_TAGS = {
+    'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe', 'object', 'head',
+    'nav', 'header', 'footer', 'aside', 'menu', 'form', 'button', 'select', 'textarea',
+}
+# Elements whose text is scored as prose
+PARAGRAPH_TAGS = {'p', 'pre', 'td', 'blockquote', 'li', 'dd'}
+# Table cells are kept apart by a space rather than a paragraph break
+CELL_TAGS = {'td', 'th'}
+# Elements that start a new paragraph in the extracted text
+BLOCK_TAGS = {
+    'address', 'article', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption', 'figure', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'hr', 'li', 'main', 'ol', 'p', 'pre', 'section', 'table', 'tr', 'ul',
+}
+# Prior weight of a candidate container, by tag, as in Readability
+TAG_WEIGHTS = {
+    'article': 10, 'main': 10, 'div': 5, 'section': 3, 'pre': 3, 'td': 3, 'blockquote': 3,
+    'ol': -3, 'ul': -3, 'dl': -3, 'li': -3, 'th': -5, 'h1': -5, 'h2': -5, 'h3': -5, 'h4': -5,
+}
+
+# Class and ID names of boilerplate blocks, and of blocks that hold content
+UNLIKELY = re.compile(
+    r'cookie|consent|gdpr|banner|comment|disqus|sidebar|sponsor|\bads?\b|advert|promo|popup|modal|newsletter|'
+    r'subscribe|share|social|related|recommend|footer|masthead|breadcrumb|pagination|menu|\bnav', re.I
+)
+LIKELY = re.compile(r'article|content|entry|main|post|story|text|body|description|blog', re.I)
+
+# Paragraphs shorter than this add nothing to their container's score
+MIN_PARAGRAPH_CHARS = 25
+# Siblings of the best block scoring this share of it are part of the body too
+SIBLING_SHARE = 0.2
+# Blocks elsewhere scoring this share of the best block are part of the body
+# too, so the body becomes their closest common ancestor (a question and its
+# answers, say)
+CLOSE_SHARE = 0.75
+# Blocks inside the body that are mostly link text are dropped from it
+MAX_LINK_DENSITY = 0.5
+MIN_LINE_CHARS = 4
+
+_SPACE = re.compile(r'\s+')
+
+def clean_text(text):
+    if not text: return ""
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
+    lines = [line.strip() for line in text.split('\n')]
+    lines = [line for line in lines if line and len(line) > 3]
+    return '\n'.join(lines).strip()
+
+def _names(element):
+    classes = element.get('class') or ()
+    if isinstance(classes, str):
+        classes = (classes,)
+    return ' '.join(classes) + ' ' + (element.get('id') or '')
+
+def _unlikely(element):
+    if element.name in ('body', 'article', 'main'):
+        return False
+    names = _names(element)
+    return bool(UNLIKELY.search(names)) and not LIKELY.search(names)
+
+def _class_weight(element):
+    names = _names(element)
+    return (25 if LIKELY.search(names) else 0) - (25 if UNLIKELY.search(names) else 0)
+
+def _score_blocks(root):
+    """
+    Walks the tree once, bottom-up, without recursion (pages nest thousands
+    deep). Boilerplate subtrees are skipped. Each paragraph, or div with no
+    block children, scores for its parent in full and its grandparent by
+    half, as in Readability.
+
+    Returns (stats, candidates): text and link-text lengths for every
+    element visited, and every candidate container with its score, keyed
+    by id().
+    """
+    from bs4 import NavigableString
+
+    stats = {}
+    scores = {}
+    candidates = {}
+    # Per open element: the element, its child iterator, its text, link text
+    # and comma counts so far, and whether it has block children
+    stack = [[root, iter(root.contents), 0, 0, 0, False]]
+    while stack:
+        frame = stack[-1]
+        node = next(frame[1], None)
+        if node is not None:
+            if isinstance(node, NavigableString):
+                if type(node) is NavigableString:
+                    frame[2] += len(node.strip())
+                    frame[4] += node.count(',')
+            elif node.name not in SKIP_TAGS and not _unlikely(node):
+                stack.append([node, iter(node.contents), 0, 0, 0, False])
+            continue
+
+        stack.pop()
+        element, _, text, links, commas, has_blocks = frame
+        if element.name == 'a':
+            links = text
+        stats[id(element)] = (text, links)
+        if stack:
+            stack[-1][2] += text
+            stack[-1][3] += links
+            stack[-1][4] += commas
+            stack[-1][5] = stack[-1][5] or element.name in BLOCK_TAGS
+        # A div holding only text and inline elements is a paragraph too
+        paragraph = element.name in PARAGRAPH_TAGS or (element.name == 'div' and not has_blocks)
+        if not paragraph or text < MIN_PARAGRAPH_CHARS:
+            continue
+        # Longer paragraphs with more clauses are likelier to be prose
+        score = 1 + commas + min(text // 100, 3)
+        for parent, share in ((element.parent, 1), (element.parent.parent if element.parent else None, 0.5)):
+            if parent is None or parent.name is None or parent.name == '[document]':
+                continue
+            key = id(parent)
+            if key not in candidates:
+                candidates[key] = parent
+                scores[key] = TAG_WEIGHTS.get(parent.name, 0) + _class_weight(parent)
+            scores[key] += score * share
+    return stats, {key: (candidates[key], score) for key, score in scores.items()}
+
+def _text_of(element, stats):
+    """
+    The text of ``element`` as paragraphs, leaving out boilerplate subtrees
+    and link lists.
+    """
+    from bs4 import NavigableString
+
+    paragraphs = []
+    current = []
+    stack = [iter(element.contents)]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            continue
+        if isinstance(node, NavigableString):
+            if type(node) is NavigableString:
+                current.append(str(node))
+            continue
+        if node.name in SKIP_TAGS or id(node) not in stats:
+            continue
+        text, links = stats[id(node)]
+        if text and links / text > MAX_LINK_DENSITY and node.name != 'a':
+            continue
+        if node.name in BLOCK_TAGS:
+            paragraphs.append(''.join(current))
+            current = []
+        elif node.name in CELL_TAGS:
+            current.append(' ')
+        stack.append(iter(node.contents))
+    paragraphs.append(''.join(current))
+
+    lines = (_SPACE.sub(' ', paragraph).strip() for paragraph in paragraphs)
+    return '\n\n'.join(line for line in lines if len(line) >= MIN_LINE_CHARS)
+
+def _common_ancestor(best, others, root):
+    """The closest ancestor of ``best`` that also contains all of ``others``."""
+    path = [best]
+    while path[-1] is not root and path[-1].parent is not None:
+        path.append(path[-1].parent)
+    depth = {id(element): i for i, element in enumerate(path)}
+    highest = 0
+    for element in others:
+        while id(element) not in depth:
+            element = element.parent
+        highest = max(highest, depth[id(element)])
+    return path[highest]
+
+def extract_main_content(soup):
+    """
+    Returns the main body text of a page, as paragraphs separated by blank
+    lines, or an empty string if no block reads like prose.
+
+    Blocks are scored by the prose paragraphs they hold, discounted by their
+    link density, in one pass over the tree; the best block (or the closest
+    ancestor shared with blocks scoring nearly as well) and any siblings
+    that score close to it make up the body. The soup is not modified.
+    """
+    root = soup.body or soup
+    stats, candidates = _score_blocks(root)
+    if not candidates:
+        return ''
+
+    scored = []
+    for element, score in candidates.values():
+        text, links = stats.get(id(element), (0, 0))
+        scored.append((score * (1 - (links / text if text else 0)), element))
+    best_score, best = max(scored, key=lambda item: item[0])
+    close = [element for score, element in scored if element is not best and score >= best_score * CLOSE_SHARE]
+    if close:
+        best = _common_ancestor(best, close, root)
+
+    threshold = max(10, best_score * SIBLING_SHARE)
+    parts = []
+    for sibling in (best.parent.contents if best.parent is not None else [best]):
+        if sibling is best:
+            parts.append(best)
+        elif id(sibling) in candidates and candidates[id(sibling)][1] >= threshold:
+            parts.append(sibling)
+    return '\n\n'.join(text for text in (_text_of(part, stats) for part in parts) if text)
+
+def extract_by_selectors(soup):
+    """
+    The earlier extractor: text of the first matching content selectors,
+    then of every paragraph. Used when no block reads like prose, and as the
+    baseline in bench/extraction.py. Strips boilerplate from the soup.
+    """
+    content_parts = []
+
+    # Remove unwanted elements
+    for element in soup(['script', 'style', 'nav', 'header', 'footer', 'aside', 'menu']):
+        element.decompose()
+
+    # Extract from main content areas
+    selectors = ['main', 'article', '.main-content', '#main-content', '.content', '#content', '.post-content']
+    for selector in selectors:
+        elements = soup.select(selector)
+        for element in elements:
+            text = clean_text(element.get_text())
+            if len(text) > 100:
+                content_parts.append(text)
+                if len('\n'.join(content_parts)) > 3000: break
+        if len('\n'.join(content_parts)) > 3000: break
+
+    # Fallback to paragraphs
+    if len('\n'.join(content_parts)) < 800:
+        paragraphs = soup.find_all('p')
+        for p in paragraphs:
+            p_text = clean_text(p.get_text())
+            if len(p_text) > 30:
+                content_parts.append(p_text)
+                if len('\n'.join(content_parts)) > 4000: break
+
+    return '\n\n'.join(content_parts)
+
+if __name__ == "__main__":
+    import sys
+    from bs4 import BeautifulSoup
+
+    with open(sys.argv[1], encoding='utf-8') as f:
+        print(extract_main_content(BeautifulSoup(f.read(), 'html.parser')))
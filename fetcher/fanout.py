@@ -0,0 +1,161 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from fetcher import (
+    arxiv_scraper, wikipedia, openalex, crossref, pubmed, semantic_scholar, wikidata, websearch, admission, resilience,
+    tracing
+)
+from fetcher.budget import Deadline, COMPLETE, PARTIAL, SKIPPED
+from fetcher.logs import get_logger
+from fetcher.metrics import SOURCE_ERRORS, SOURCE_LATENCY, SOURCE_TIMEOUTS, timed_source
+
+log = get_logger('fanout')
+
+def _host(url):
+    return urlparse(url).hostname
+
+# Each source with the upstream host behind it and how to query it. A source
+# whose host has an open circuit breaker is skipped up front instead of
+# waiting out its timeout.
+API_SOURCES = {
+    "arXiv": (_host(arxiv_scraper.ARXIV_API_URL), lambda query, n: arxiv_scraper.search_arxiv(query, n)),
+    "OpenAlex": (_host(openalex.OPENALEX_API_URL), lambda query, n: openalex.search_openalex(query, n)),
+    "CrossRef": (_host(crossref.CROSSREF_API_URL), lambda query, n: crossref.search_crossref(query, n)),
+    "PubMed": (_host(pubmed.EUTILS_URL), lambda query, n: pubmed.search_pubmed(query, n)),
+    "Semantic Scholar": (_host(semantic_scholar.S2_API_URL), lambda query, n: semantic_scholar.search_semantic_scholar(query, n)),
+    "Wikipedia": (_host(wikipedia.WIKIPEDIA_API_URL), lambda query, n: wikipedia.get_wikipedia_articles([query], n)),
+    "Wikidata": (_host(wikidata.WIKIDATA_API_URL), lambda query, n: wikidata.search_wikidata(query, n)),
+}
+WEB_SOURCE = "Web Search"
+WEB_HOST = websearch.SEARCH_HOST
+
+# Leave the web scraper this long to hand back the pages it has before the
+# fan-out stops waiting for it
+WEB_WRAP_UP_SECONDS = 0.3
+
+# The blocking API fetchers run here so that concurrent requests overlap
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="source")
+
+def skip_reason(host):
+    if resilience.is_open(host):
+        return f"circuit open for {host}"
+    return None
+
+async def _run_web(query, num_results, deadline, page_tasks=None, web_admission=None):
+    start = time.perf_counter()
+    try:
+        with tracing.span('source', source=WEB_SOURCE):
+            async with (web_admission() if web_admission else nullcontext()):
+                report = await websearch.scrape_web(
+                    query, num_results, deadline.reserve(WEB_WRAP_UP_SECONDS), page_tasks
+                )
+    except admission.Overloaded:
+        raise
+    except Exception:
+        SOURCE_ERRORS.labels(WEB_SOURCE).inc()
+        raise
+    SOURCE_LATENCY.labels(WEB_SOURCE).observe(time.perf_counter() - start)
+    statuses = set(report['pages'].values())
+    if not report['results']:
+        status = SKIPPED if SKIPPED in statuses else COMPLETE
+    elif statuses == {COMPLETE}:
+        status = COMPLETE
+    else:
+        status = PARTIAL
+    return report['results'], status, report['pages']
+
+async def _pick(shared_future, query):
+    # Shielded so that abandoning one query does not cancel the shared call
+    results = await asyncio.shield(shared_future)
+    return results.get(query, [])
+
+async def run_sources(
+    query, num_results, deadline=None, include_web=True, shared=None, page_tasks=None, web_admission=None
+):
+    """
+    Queries every source concurrently and collects what finishes in time.
+
+    API fetchers that have not answered by the deadline are abandoned (their
+    threads finish in the background and warm the caches); the web scraper
+    cancels its outstanding pages and returns the ones it has.
+
+    ``shared`` maps a source to a future, started by the caller, that
+    resolves to that source's results for many queries keyed by query; this
+    query's share is taken from it instead of calling the source again.
+    ``page_tasks`` is passed on to websearch.scrape_web. ``web_admission``
+    returns an async context manager the web scraper must enter before it
+    starts (see fetcher.admission); if it sheds the scraper, the web source
+    is skipped while the API sources carry on.
+
+    Returns:
+        A dict with ``results``, ``sources_used``, ``sources_skipped``
+        (source -> reason), ``source_status`` (source -> complete, partial
+        or skipped) and ``pages`` (web URL -> completion state).
+    """
+    deadline = deadline or Deadline()
+    loop = asyncio.get_running_loop()
+    tasks = {}
+    sources_skipped = {}
+
+    for source, (host, fetch) in API_SOURCES.items():
+        reason = skip_reason(host)
+        if reason:
+            sources_skipped[source] = reason
+        elif shared and source in shared:
+            tasks[source] = asyncio.ensure_future(_pick(shared[source], query))
+        else:
+            tasks[source] = loop.run_in_executor(_executor, tracing.bind(timed_source(source, fetch)), query, num_results)
+
+    if include_web:
+        reason = skip_reason(WEB_HOST)
+        if reason:
+            sources_skipped[WEB_SOURCE] = reason
+        else:
+            tasks[WEB_SOURCE] = asyncio.ensure_future(
+                _run_web(query, num_results, deadline, page_tasks, web_admission)
+            )
+
+    if tasks:
+        _, pending = await asyncio.wait(tasks.values(), timeout=deadline.remaining())
+        for task in pending:
+            task.cancel()
+
+    all_results = []
+    sources_used = []
+    source_status = {source: SKIPPED for source in sources_skipped}
+    pages = {}
+    for source, task in tasks.items():
+        if not task.done() or task.cancelled():
+            sources_skipped[source] = "budget exhausted"
+            SOURCE_TIMEOUTS.labels(source).inc()
+            source_status[source] = SKIPPED
+            continue
+        if isinstance(task.exception(), admission.Overloaded):
+            sources_skipped[source] = f"overloaded: {task.exception().reason}"
+            source_status[source] = SKIPPED
+            continue
+        if task.exception() is not None:
+            log.warning("source failed", source=source, error=repr(task.exception()))
+            sources_skipped[source] = f"error: {task.exception()}"
+            source_status[source] = SKIPPED
+            continue
+
+        if source == WEB_SOURCE:
+            source_results, status, pages = task.result()
+        else:
+            source_results, status = task.result(), COMPLETE
+        source_status[source] = status
+        if source_results:
+            all_results.extend(source_results)
+            sources_used.append(source)
+
+    return {
+        "results": all_results,
+        "sources_used": sources_used,
+        "sources_skipped": sources_skipped,
+        "source_status": source_status,
+        "pages": pages
+    }
@@ -1,11 +1,19 @@
-from googlesearch import search
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
 import re
 import asyncio
 import random
 from urllib.parse import urljoin, urlparse
 
+from fetcher import browser_pool, resilience, tracing, websearch
+from fetcher.budget import Deadline, COMPLETE, PARTIAL, SKIPPED
+from fetcher.logs import get_logger
+from fetcher.metrics import BYTES_DOWNLOADED, PAGES_TRUNCATED, time_stage
+from fetcher.singleflight import AsyncSingleFlight
+
+log = get_logger('image_scraper')
+
+# Concurrent requests that hit the same URL share one scrape
+_page_flight = AsyncSingleFlight('image_scraper.scrape_page')
+
 class ImageScraper:
     def __init__(self):
         self.user_agents = [
@@ -97,35 +105,65 @@ class ImageScraper:
         
         return images
 
-    async def scrape_images_from_page(self, browser, url):
+    async def scrape_images_from_page(self, url, deadline=None):
         """Scrape images from a single page"""
-        page = None
+        with tracing.span('page', url=url):
+            deadline = deadline or Deadline()
+            return await _page_flight.do(url, self._scrape_images_from_page, url, deadline, expires_at=deadline.expires_at)
+
+    async def _scrape_images_from_page(self, url, deadline):
+        # Imported on first use, so the API starts without loading them
+        from bs4 import BeautifulSoup
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+        status = COMPLETE
         try:
-            page = await browser.new_page()
-            await page.set_extra_http_headers({'User-Agent': random.choice(self.user_agents)})
-            
-            # Navigate to page
-            await page.goto(url, timeout=30000, wait_until='domcontentloaded')
-            await asyncio.sleep(2)
-            
-            # Scroll to load lazy images
-            try:
-                for i in range(3):
-                    await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                    await asyncio.sleep(1)
-            except:
-                pass
-            
-            # Get page content
-            html_content = await page.content()
-            soup = BeautifulSoup(html_content, 'html.parser')
+            async with browser_pool.get_pool().page() as page:
+                await page.set_extra_http_headers({'User-Agent': random.choice(self.user_agents)})
+                
+                # Navigate to page
+                with time_stage('images', 'navigate'):
+                    async with resilience.guard_for_url(url).acall(wait=deadline.timeout(10)):
+                        try:
+                            await page.goto(url, timeout=deadline.timeout_ms(30), wait_until='domcontentloaded')
+                        except PlaywrightTimeoutError:
+                            if not deadline.expired():
+                                raise
+                            status = PARTIAL
+                
+                with time_stage('images', 'wait'):
+                    await asyncio.sleep(deadline.timeout(2))
+                
+                # Scroll to load lazy images, as far as the budget allows
+                with time_stage('images', 'scroll'):
+                    try:
+                        for i in range(3):
+                            if deadline.timeout(1) < 1:
+                                status = PARTIAL
+                                break
+                            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                            await asyncio.sleep(1)
+                    except:
+                        pass
+                
+                # Get page content
+                html_content, html_chars, truncated = await browser_pool.page_html(page)
+            BYTES_DOWNLOADED.labels('page').inc(len(html_content.encode('utf-8')))
+            if truncated:
+                PAGES_TRUNCATED.labels('images').inc()
+                log.info("page truncated", url=url, html_chars=html_chars, kept=len(html_content))
+                status = PARTIAL
             
-            # Extract page title
-            title_element = soup.find('title')
-            page_title = title_element.get_text().strip() if title_element else "No title"
+            with time_stage('images', 'parse'):
+                soup = BeautifulSoup(html_content, 'html.parser')
             
-            # Extract images
-            images = self.extract_images_from_soup(soup, url)
+            with time_stage('images', 'extract'):
+                # Extract page title
+                title_element = soup.find('title')
+                page_title = title_element.get_text().strip() if title_element else "No title"
+                
+                # Extract images
+                images = self.extract_images_from_soup(soup, url)
             
             # Remove duplicates
             unique_images = []
@@ -135,62 +173,63 @@ class ImageScraper:
                     seen_urls.add(img['url'])
                     unique_images.append(img)
             
-            await page.close()
-            
             result = {
                 'page_url': url,
                 'page_title': page_title,
                 'images_found': len(unique_images),
-                'images': unique_images[:50]  # Limit to 50 images per page
+                'images': unique_images[:50],  # Limit to 50 images per page
+                'fetch_status': status
             }
             
-            print(f"  ✅ {url} - Found {len(unique_images)} images")
+            log.info("page scraped", url=url, images=len(unique_images), status=status)
             return result
             
         except Exception as e:
-            print(f"  ❌ {url}: {e}")
-            if page:
-                try:
-                    await page.close()
-                except:
-                    pass
+            log.warning("page failed", url=url, error=repr(e))
             return None
 
-async def search_and_scrape_images(query, num_results=3):
+async def search_and_scrape_images(query, num_results=3, deadline=None):
     """
     Search for images across web pages
     """
+    deadline = deadline or Deadline()
     scraper = ImageScraper()
     scraped_results = []
+    pages = {}
     
-    print(f"🖼️ Image search: '{query}'")
+    log.info("image search started", query=query)
     
     try:
         # Get URLs from Google search
-        urls_to_scrape = list(search(query, num_results=num_results))
-        print(f"Found {len(urls_to_scrape)} URLs to scrape for images")
+        with tracing.span('search_engine'):
+            urls_to_scrape = await asyncio.wait_for(
+                asyncio.to_thread(websearch.find_urls, query, num_results), timeout=deadline.remaining()
+            )
+        log.info("urls found", query=query, urls=len(urls_to_scrape))
         
     except Exception as e:
-        print(f"Search error: {e}")
-        return []
+        log.warning("search failed", query=query, error=repr(e))
+        urls_to_scrape = []
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu']
-        )
-        
-        for i, url in enumerate(urls_to_scrape):
-            print(f"Scraping images {i+1}/{len(urls_to_scrape)}")
-            result = await scraper.scrape_images_from_page(browser, url)
-            if result:
-                scraped_results.append(result)
-            
-            # Rate limiting
-            if i < len(urls_to_scrape) - 1:
-                await asyncio.sleep(1)
-        
-        await browser.close()
+    tasks = {url: asyncio.ensure_future(scraper.scrape_images_from_page(url, deadline)) for url in urls_to_scrape}
+    if tasks:
+        try:
+            _, pending = await asyncio.wait(tasks.values(), timeout=deadline.remaining())
+        except asyncio.CancelledError:
+            pending = [task for task in tasks.values() if not task.done()]
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    for url, task in tasks.items():
+        result = None if task.cancelled() else task.result()
+        if result:
+            scraped_results.append(result)
+            pages[url] = result['fetch_status']
+        else:
+            pages[url] = SKIPPED
     
     # Flatten all images into a single list with source info
     all_images = []
@@ -205,12 +244,13 @@ async def search_and_scrape_images(query, num_results=3):
                 'image_type': img['type']
             })
     
-    print(f"✅ Total images found: {len(all_images)}")
+    log.info("image search finished", query=query, pages=len(scraped_results), images=len(all_images))
     
     return {
         'query': query,
         'total_images': len(all_images),
         'pages_scraped': len(scraped_results),
         'page_results': scraped_results,
-        'all_images': all_images[:100]  # Limit to 100 total images
+        'all_images': all_images[:100],  # Limit to 100 total images
+        'pages': pages
     }
\ No newline at end of file
@@ -0,0 +1,445 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from fetcher import logs
+from fetcher.logs import get_logger
+from fetcher.metrics import JOB_LATENCY, JOB_WAIT, JOBS_QUEUED, JOBS_RUNNING
+
+log = get_logger('jobs')
+
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(tempfile.gettempdir(), "deepresearch_jobs.sqlite3"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+# Finished jobs and their results are deleted after this long
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+PURGE_INTERVAL_SECONDS = 600
+
+# Several API workers may share the database. A worker claims a job by
+# writing itself as its owner and renews the claim every HEARTBEAT_SECONDS
+# while the job runs; a running job whose claim is older than LEASE_SECONDS
+# belongs to a worker that died, and is queued again by whichever worker
+# notices first. The heartbeat also tells an owner that its job was
+# cancelled through another worker.
+HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "2"))
+LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "30"))
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+class JobStore:
+    """
+    Persists jobs and their results in SQLite.
+
+    One connection is shared behind a lock; callers on the event loop go
+    through ``asyncio.to_thread`` so large results do not block it.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    heartbeat_at REAL
+                )
+            """)
+            columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (('owner', 'TEXT'), ('heartbeat_at', 'REAL')):
+                if column not in columns:
+                    # Databases written before jobs had owners
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def insert(self, job):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, type, params, priority, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job['id'], job['type'], json.dumps(job['params']), job['priority'], job['status'], job['created_at'])
+            )
+
+    def update(self, job_id, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'], ensure_ascii=False)
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def claim(self, job_id, owner, now):
+        """Marks a queued job as running for ``owner``. Returns False if it is not queued any more."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, started_at = ?, heartbeat_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, owner, now, now, job_id, QUEUED)
+            ).rowcount == 1
+
+    def finish(self, job_id, owner, status, finished_at, result=None, error=None):
+        """
+        Records the outcome of a job ``owner`` is running. Returns False,
+        writing nothing, if the job was cancelled or taken over meanwhile.
+        """
+        encoded = json.dumps(result, ensure_ascii=False) if result is not None else None
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? "
+                "WHERE id = ? AND status = ? AND owner = ?",
+                (status, finished_at, encoded, error, job_id, RUNNING, owner)
+            ).rowcount == 1
+
+    def cancel(self, job_id, finished_at):
+        """Marks a queued or running job as cancelled. Returns False if it had finished or does not exist."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+                (CANCELLED, finished_at, job_id, QUEUED, RUNNING)
+            ).rowcount == 1
+
+    def heartbeat(self, owner, job_ids, now):
+        """
+        Renews ``owner``'s claim on the jobs it is running. Returns those of
+        them that are no longer running under its claim (cancelled elsewhere,
+        or taken over after a missed lease).
+        """
+        if not job_ids:
+            return []
+        marks = ', '.join('?' * len(job_ids))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = ? AND id IN ({marks})",
+                (now, owner, RUNNING, *job_ids)
+            )
+            held = {row['id'] for row in self._conn.execute(
+                f"SELECT id FROM jobs WHERE owner = ? AND status = ? AND id IN ({marks})", (owner, RUNNING, *job_ids)
+            )}
+        return [job_id for job_id in job_ids if job_id not in held]
+
+    def requeue_expired(self, lease_before):
+        """Queues again the running jobs whose owner stopped renewing its claim. Returns them."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (RUNNING, lease_before)
+            ).fetchall()
+            requeued = []
+            for row in rows:
+                if self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL WHERE id = ? AND status = ? "
+                    "AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                    (QUEUED, row['id'], RUNNING, lease_before)
+                ).rowcount:
+                    requeued.append(dict(_to_job(row), status=QUEUED))
+        return requeued
+
+    def release(self, owner):
+        """Queues again the jobs ``owner`` is running, for another worker or the next start."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL WHERE owner = ? AND status = ?",
+                (QUEUED, owner, RUNNING)
+            ).rowcount
+
+    def get(self, job_id, with_result=True):
+        columns = '*' if with_result else 'id, type, params, priority, status, created_at, started_at, finished_at, error'
+        with self._lock:
+            row = self._conn.execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _to_job(row) if row else None
+
+    def queued(self):
+        """Queued jobs, oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+        return [_to_job(row) for row in rows]
+
+    def purge(self, finished_before):
+        with self._lock:
+            return self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (finished_before,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def _to_job(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    if job.get('result') is not None:
+        job['result'] = json.loads(job['result'])
+    return job
+
+class JobQueue:
+    """
+    Runs submitted jobs on a fixed number of workers, highest priority first
+    and in submission order within a priority.
+
+    Job types are registered with an async handler taking (params, progress)
+    and returning a JSON-serialisable result; ``progress`` publishes an
+    intermediate update to subscribers.
+
+    Workers of several processes can share one database: each job runs on
+    the worker that claims it, and queued jobs are picked up by any of them.
+    Jobs a stopped worker was running are queued again, and those of a
+    worker that died once its lease runs out. The store is opened by
+    ``start`` rather than on construction, so importing the API does not
+    touch the database.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, workers=JOB_WORKERS, max_queued=1000, retention_seconds=JOB_RETENTION_SECONDS):
+        self.path = path
+        self.store = None
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+        self.handlers = {}
+        self._queue = None
+        self._tasks = []
+        self._running = {}
+        self._stopping = False
+        # Identifies this process's claims on jobs in the shared store
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._subscribers = {}
+        self._seq = itertools.count()
+
+    def register(self, job_type, handler):
+        self.handlers[job_type] = handler
+
+    async def start(self):
+        self.store = await asyncio.to_thread(JobStore, self.path)
+        self._stopping = False
+        self._queue = asyncio.PriorityQueue()
+        for job in await asyncio.to_thread(self.store.requeue_expired, time.time() - LEASE_SECONDS):
+            log.info("job resumed", job_id=job['id'], type=job['type'], was=RUNNING)
+        # Jobs another live worker has queued as well are claimed by one of us only
+        for job in await asyncio.to_thread(self.store.queued):
+            self._enqueue(job)
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._purge_periodically()))
+        self._tasks.append(asyncio.ensure_future(self._heartbeat_periodically()))
+
+    async def stop(self):
+        self._stopping = True
+        for task in (*self._tasks, *self._running.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._running.values(), return_exceptions=True)
+        self._tasks = []
+        # Interrupted jobs go back to the queue for the other workers or the next start
+        released = await asyncio.to_thread(self.store.release, self.owner)
+        if released:
+            log.info("running jobs released", jobs=released)
+        self.store.close()
+        JOBS_QUEUED.set(0)
+        JOBS_RUNNING.set(0)
+
+    async def submit(self, job_type, params, priority=0):
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        if self._queue.qsize() >= self.max_queued:
+            raise QueueFull(f"{self._queue.qsize()} jobs are already queued")
+        job = {
+            'id': uuid.uuid4().hex,
+            'type': job_type,
+            'params': params,
+            'priority': priority,
+            'status': QUEUED,
+            'created_at': time.time(),
+        }
+        await asyncio.to_thread(self.store.insert, job)
+        self._enqueue(job)
+        log.info("job submitted", job_id=job['id'], type=job_type, priority=priority)
+        return job
+
+    async def get(self, job_id, with_result=True):
+        return await asyncio.to_thread(self.store.get, job_id, with_result)
+
+    async def cancel(self, job_id):
+        """
+        Cancels a queued or running job. Returns False if it had already
+        finished or does not exist.
+
+        The job is marked cancelled in the store, so no worker claims it
+        afterwards; a worker of another process running it sees the mark at
+        its next heartbeat and stops it.
+        """
+        job = await self.get(job_id, with_result=False)
+        if job is None or not await asyncio.to_thread(self.store.cancel, job_id, time.time()):
+            return False
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        self._finished(job, CANCELLED)
+        return True
+
+    async def subscribe(self, job_id, heartbeat=None):
+        """
+        Yields events for a job until it finishes: its current state first,
+        then every state change and progress update. With ``heartbeat``,
+        None is yielded after that many seconds without an event, so a
+        stream can keep its connection alive.
+        """
+        updates = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(updates)
+        try:
+            job = await self.get(job_id, with_result=False)
+            if job is None:
+                return
+            yield {'status': job['status']}
+            if job['status'] in FINISHED:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(updates.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # A job run by another process's worker only reaches this
+                    # one through the store
+                    job = await self.get(job_id, with_result=False)
+                    if job is not None and job['status'] in FINISHED:
+                        yield {'status': job['status'], 'error': job['error']} if job['error'] else {'status': job['status']}
+                        return
+                    yield None
+                    continue
+                yield event
+                if event['status'] in FINISHED:
+                    return
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            subscribers.discard(updates)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'running': len(self._running),
+            'workers': self.workers,
+            'max_queued': self.max_queued,
+        }
+
+    def _enqueue(self, job):
+        self._queue.put_nowait((-job['priority'], next(self._seq), job))
+        JOBS_QUEUED.inc()
+
+    def _publish(self, job_id, event):
+        for updates in self._subscribers.get(job_id, ()):
+            updates.put_nowait(event)
+
+    async def _work(self):
+        while True:
+            _, _, job = await self._queue.get()
+            JOBS_QUEUED.dec()
+            try:
+                started_at = time.time()
+                # Cancelled, or claimed by another worker, since it was queued
+                if not await asyncio.to_thread(self.store.claim, job['id'], self.owner, started_at):
+                    continue
+                task = self._running[job['id']] = asyncio.ensure_future(self._run(job, started_at))
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # One bad job must not take a worker out of the pool
+                log.exception("job worker error", job_id=job['id'], type=job['type'])
+
+    async def _run(self, job, started_at):
+        job_id, job_type = job['id'], job['type']
+        # The job's log lines carry its ID as their request ID
+        logs.request_id.set(job_id)
+        JOBS_RUNNING.inc()
+        try:
+            JOB_WAIT.labels(job_type).observe(started_at - job['created_at'])
+            self._publish(job_id, {'status': RUNNING})
+            log.info("job started", job_id=job_id, type=job_type)
+
+            def progress(update):
+                self._publish(job_id, {'status': RUNNING, 'progress': update})
+
+            result = await self.handlers[job_type](job['params'], progress)
+        except asyncio.CancelledError:
+            if self._stopping:
+                raise
+            # cancel() has already marked the job and told subscribers
+        except Exception as e:
+            log.exception("job failed", job_id=job_id, type=job_type)
+            await self._finish(job, FAILED, error=f"{type(e).__name__}: {e}")
+        else:
+            try:
+                await self._finish(job, SUCCEEDED, result=result)
+            except Exception as e:
+                # An unserialisable result, or a failed write
+                log.exception("job result not stored", job_id=job_id, type=job_type)
+                await self._finish(job, FAILED, error=f"Result not stored: {type(e).__name__}: {e}")
+        finally:
+            self._running.pop(job_id, None)
+            JOBS_RUNNING.dec()
+
+    async def _finish(self, job, status, result=None, error=None):
+        finished_at = time.time()
+        stored = await asyncio.to_thread(
+            self.store.finish, job['id'], self.owner, status, finished_at, result=result, error=error
+        )
+        if not stored:
+            # Cancelled, or taken over, while it ran: the store keeps that outcome
+            log.info("job outcome dropped", job_id=job['id'], type=job['type'], status=status)
+            return
+        self._finished(job, status, error)
+
+    def _finished(self, job, status, error=None):
+        JOB_LATENCY.labels(job['type'], status).observe(time.time() - job['created_at'])
+        self._publish(job['id'], {'status': status, 'error': error} if error else {'status': status})
+        log.info("job finished", job_id=job['id'], type=job['type'], status=status)
+
+    async def _heartbeat_periodically(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            try:
+                now = time.time()
+                lost = await asyncio.to_thread(self.store.heartbeat, self.owner, list(self._running), now)
+                for job_id in lost:
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        log.info("job stopped: cancelled or taken over elsewhere", job_id=job_id)
+                        task.cancel()
+                        # Subscribers here learn the outcome the store holds
+                        job = await asyncio.to_thread(self.store.get, job_id, False)
+                        if job is not None and job['status'] in FINISHED:
+                            self._publish(job_id, {'status': job['status']})
+                for job in await asyncio.to_thread(self.store.requeue_expired, now - LEASE_SECONDS):
+                    log.info("job resumed", job_id=job['id'], type=job['type'], was=RUNNING)
+                    self._enqueue(job)
+            except Exception:
+                log.exception("job heartbeat failed")
+
+    async def _purge_periodically(self):
+        while True:
+            removed = await asyncio.to_thread(self.store.purge, time.time() - self.retention_seconds)
+            if removed:
+                log.info("expired jobs purged", jobs=removed)
+            await asyncio.sleep(PURGE_INTERVAL_SECONDS)
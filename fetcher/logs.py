@@ -0,0 +1,57 @@
+import json
+import logging
+import os
+import sys
+import time
+from contextvars import ContextVar
+
+# Set per API request (or per cleaner run) so every log line can be tied back to it
+request_id = ContextVar('request_id', default=None)
+
+_RESERVED = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', None),
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    Lets callers pass fields as keyword arguments,
+    e.g. ``log.info('page scraped', url=url, chars=1200)``,
+    and stamps each record with the current request ID.
+    """
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in _RESERVED}
+        kwargs['extra'] = {'fields': fields, 'request_id': request_id.get()}
+        return msg, kwargs
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(f'deepresearch.{name}'), {})
+
+def configure(level=None):
+    """
+    Sends all deepresearch logs to stderr as JSON lines. Safe to call more than once.
+    """
+    logger = logging.getLogger('deepresearch')
+    logger.setLevel(level or os.environ.get('LOG_LEVEL', 'INFO').upper())
+    if not any(isinstance(handler.formatter, JsonFormatter) for handler in logger.handlers):
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+    logger.propagate = False
+
+def new_request_id():
+    return f"{int(time.time() * 1000):x}-{os.urandom(3).hex()}"
@@ -0,0 +1,135 @@
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+
+# Chromium's process names vary by build and platform
+CHROMIUM_NAMES = ('chrome', 'chromium', 'headless_shell')
+# How often memory is sampled while requests are running
+SAMPLE_SECONDS = float(os.environ.get("MEMORY_SAMPLE_SECONDS", "0.25"))
+
+# Memory is read from /proc, so it is only measured on Linux
+ENABLED = platform.system() == 'Linux'
+
+_active = set()
+_lock = threading.Lock()
+_sampler = None
+
+def rss_mb(pid='self'):
+    """Resident memory of a process in MB, or 0 if it has exited."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def _process_tree():
+    # Parent of every process, and children of every parent
+    parents, children = {}, {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, so split after its closing paren
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents[int(entry)] = ppid
+        children.setdefault(ppid, []).append(int(entry))
+    return parents, children
+
+def _descendants(pid, children):
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+def _is_chromium(pid):
+    try:
+        with open(f'/proc/{pid}/comm') as f:
+            name = f.read().strip().lower()
+    except OSError:
+        return False
+    return any(chromium in name for chromium in CHROMIUM_NAMES)
+
+def chromium_browsers():
+    """
+    RSS in MB of each Chromium this process launched, keyed by the PID of
+    its browser process and summed over its renderers and helpers (shared
+    pages are counted once per process). Empty where /proc is unavailable.
+    """
+    if not ENABLED:
+        return {}
+    parents, children = _process_tree()
+    chromium = {pid for pid in _descendants(os.getpid(), children) if _is_chromium(pid)}
+    # A browser process is a Chromium process whose parent is not one
+    roots = [pid for pid in chromium if parents.get(pid) not in chromium]
+    return {root: rss_mb(root) + sum(rss_mb(pid) for pid in _descendants(root, children)) for root in roots}
+
+class Usage:
+    """Peak memory of the worker while one request ran."""
+
+    def __init__(self):
+        self.start_rss_mb = rss_mb() if ENABLED else None
+        self.peak_rss_mb = self.start_rss_mb
+        self.peak_chromium_rss_mb = None
+
+    def update(self, app_rss, chromium_rss):
+        self.peak_rss_mb = max(self.peak_rss_mb, app_rss)
+        self.peak_chromium_rss_mb = max(self.peak_chromium_rss_mb or 0.0, chromium_rss)
+
+    def as_dict(self):
+        def rounded(value):
+            return round(value, 1) if value is not None else None
+        return {
+            'start_rss_mb': rounded(self.start_rss_mb),
+            'peak_rss_mb': rounded(self.peak_rss_mb),
+            'peak_chromium_rss_mb': rounded(self.peak_chromium_rss_mb),
+        }
+
+def _sample():
+    global _sampler
+    while True:
+        with _lock:
+            if not _active:
+                _sampler = None
+                return
+            usages = list(_active)
+        app_rss = rss_mb()
+        chromium_rss = sum(chromium_browsers().values())
+        for usage in usages:
+            usage.update(app_rss, chromium_rss)
+        time.sleep(SAMPLE_SECONDS)
+
+@contextmanager
+def track():
+    """
+    Yields a Usage holding the peak RSS of this process and of its Chromium
+    processes while the body runs. One background thread samples /proc for
+    every tracked request, and only while there is one. Memory is shared by
+    concurrent requests, so a request's peak includes theirs: it is what the
+    worker needed while the request ran, not what the request alone used.
+    """
+    global _sampler
+    usage = Usage()
+    if not ENABLED:
+        yield usage
+        return
+    with _lock:
+        _active.add(usage)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample, name='memory-sampler', daemon=True)
+            _sampler.start()
+    try:
+        yield usage
+    finally:
+        with _lock:
+            _active.discard(usage)
+        usage.peak_rss_mb = max(usage.peak_rss_mb, rss_mb())
@@ -0,0 +1,185 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from fetcher import tracing
+
+# Source fetches and page loads range from tens of milliseconds (cache hits)
+# to the 30 s navigation timeout
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 12, 20, 30, 60)
+
+SOURCE_LATENCY = Histogram(
+    'deepresearch_source_latency_seconds', 'Time spent fetching results from each source',
+    ['source'], buckets=LATENCY_BUCKETS
+)
+SOURCE_ERRORS = Counter(
+    'deepresearch_source_errors_total', 'Source fetches that raised an error', ['source']
+)
+SOURCE_TIMEOUTS = Counter(
+    'deepresearch_source_timeouts_total', 'Source fetches abandoned because the request budget ran out', ['source']
+)
+SCRAPE_STAGE_LATENCY = Histogram(
+    'deepresearch_scrape_stage_seconds', 'Time spent in each stage of scraping a page',
+    ['scraper', 'stage'], buckets=LATENCY_BUCKETS
+)
+ENDPOINT_LATENCY = Histogram(
+    'deepresearch_endpoint_latency_seconds', 'End-to-end latency of each API endpoint',
+    ['endpoint', 'status'], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_ERRORS = Counter(
+    'deepresearch_upstream_errors_total', 'Failed upstream HTTP requests by host and kind',
+    ['host', 'kind']
+)
+BYTES_DOWNLOADED = Counter(
+    'deepresearch_bytes_downloaded_total', 'Response bytes received from upstreams', ['kind']
+)
+DUPLICATE_PAGES = Counter(
+    'deepresearch_duplicate_pages_total', 'Pages dropped as duplicates of an earlier result, by how they were spotted',
+    ['reason']
+)
+PDF_DOCUMENTS = Counter(
+    'deepresearch_pdf_documents_total', 'PDFs requested for full text, by outcome', ['outcome']
+)
+CRAWL_LINKS = Counter(
+    'deepresearch_crawl_links_total', 'Links found while crawling, by what became of them', ['outcome']
+)
+PAGES_TRUNCATED = Counter(
+    'deepresearch_pages_truncated_total', 'Scraped pages whose HTML was cut at the size cap', ['scraper']
+)
+# Worker memory ranges from a bare API process to one driving a busy Chromium
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 6144, 8192))
+REQUEST_PEAK_RSS = Histogram(
+    'deepresearch_request_peak_rss_bytes', 'Peak resident memory of the worker and of its Chromium while each request ran',
+    ['endpoint', 'process'], buckets=MEMORY_BUCKETS
+)
+ADMISSION_WAIT = Histogram(
+    'deepresearch_admission_wait_seconds', 'Time requests wait for an admission slot', ['pool'], buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    'deepresearch_admission_rejected_total', 'Requests shed with 503 by admission control', ['pool', 'reason']
+)
+
+# Jobs wait and run for much longer than a single request
+JOB_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+JOBS_QUEUED = Gauge('deepresearch_jobs_queued', 'Jobs waiting for a worker')
+JOBS_RUNNING = Gauge('deepresearch_jobs_running', 'Jobs being run by a worker')
+JOB_WAIT = Histogram(
+    'deepresearch_job_wait_seconds', 'Time jobs spend queued before a worker picks them up',
+    ['type'], buckets=JOB_BUCKETS
+)
+JOB_LATENCY = Histogram(
+    'deepresearch_job_latency_seconds', 'Time from submitting a job to its completion',
+    ['type', 'status'], buckets=JOB_BUCKETS
+)
+
+@contextmanager
+def time_stage(scraper, stage):
+    """
+    Records how long the body takes as one stage of a page scrape, and as a
+    span of the current request's trace.
+    """
+    start = time.perf_counter()
+    try:
+        with tracing.span(stage):
+            yield
+    finally:
+        SCRAPE_STAGE_LATENCY.labels(scraper, stage).observe(time.perf_counter() - start)
+
+def timed_source(source, fetch):
+    """
+    Wraps a source fetcher so every call records its latency and errors, and
+    appears as a span in the current request's trace.
+    """
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with tracing.span('source', source=source):
+                return fetch(*args, **kwargs)
+        except Exception:
+            SOURCE_ERRORS.labels(source).inc()
+            raise
+        finally:
+            SOURCE_LATENCY.labels(source).observe(time.perf_counter() - start)
+    return wrapper
+
+_BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+class _RuntimeCollector:
+    """
+    Reads state owned by other modules (browser pool, caches, coalescing,
+    breakers) at scrape time instead of mirroring it into gauges.
+    """
+
+    def describe(self):
+        # Keeps the registry from calling collect() at import time
+        return []
+
+    def collect(self):
+        # Imported here because these modules record into the metrics above
+        from fetcher import admission, browser_pool, cache, resilience, singleflight
+
+        pool = browser_pool.pool_stats() or {
+            'pages_in_use': 0, 'max_pages': browser_pool.MAX_PAGES, 'browser_launches': 0, 'browser_recycles': 0,
+            'browser_rss_mb': None,
+        }
+        in_use = GaugeMetricFamily('deepresearch_browser_pages_in_use', 'Browser pages currently open')
+        in_use.add_metric([], pool['pages_in_use'])
+        yield in_use
+        capacity = GaugeMetricFamily('deepresearch_browser_pages_max', 'Browser page slots in the pool')
+        capacity.add_metric([], pool['max_pages'])
+        yield capacity
+        launches = CounterMetricFamily('deepresearch_browser_launches', 'Chromium launches by the shared pool')
+        launches.add_metric([], pool['browser_launches'])
+        yield launches
+        recycles = CounterMetricFamily('deepresearch_browser_recycles', 'Chromium instances replaced for outgrowing their memory limit')
+        recycles.add_metric([], pool['browser_recycles'])
+        yield recycles
+        if pool['browser_rss_mb'] is not None:
+            browser_rss = GaugeMetricFamily('deepresearch_browser_rss_bytes', 'Resident memory of the shared Chromium, when last read')
+            browser_rss.add_metric([], pool['browser_rss_mb'] * 1024 * 1024)
+            yield browser_rss
+
+        hits = CounterMetricFamily('deepresearch_cache_hits', 'Cache hits', labels=['cache'])
+        misses = CounterMetricFamily('deepresearch_cache_misses', 'Cache misses', labels=['cache'])
+        sizes = GaugeMetricFamily('deepresearch_cache_entries', 'Entries held by each cache', labels=['cache'])
+        for name, stats in cache.cache_stats().items():
+            hits.add_metric([name], stats['hits'])
+            misses.add_metric([name], stats['misses'])
+            sizes.add_metric([name], stats['size'])
+        yield hits
+        yield misses
+        yield sizes
+
+        calls = CounterMetricFamily('deepresearch_coalesced_calls', 'Calls executed per coalescing group', labels=['group'])
+        waiters = CounterMetricFamily('deepresearch_coalesced_waiters', 'Callers that shared an in-flight call', labels=['group'])
+        for name, stats in singleflight.stats().items():
+            calls.add_metric([name], stats['calls'])
+            waiters.add_metric([name], stats['coalesced_waiters'])
+        yield calls
+        yield waiters
+
+        breaker = GaugeMetricFamily(
+            'deepresearch_circuit_state', 'Circuit breaker state per host (0 closed, 1 half-open, 2 open)', labels=['host']
+        )
+        # Hosts without a policy share one series holding the worst of their states
+        states = {}
+        for host, state in resilience.upstream_states().items():
+            label = resilience.metric_host(host)
+            states[label] = max(states.get(label, 0), _BREAKER_STATES[state['state']])
+        for label, value in states.items():
+            breaker.add_metric([label], value)
+        yield breaker
+
+        active = GaugeMetricFamily('deepresearch_admission_active', 'Requests holding an admission slot', labels=['pool'])
+        queued = GaugeMetricFamily('deepresearch_admission_queued', 'Requests waiting for an admission slot', labels=['pool', 'lane'])
+        for name, stats in admission.stats().items():
+            active.add_metric([name], stats['active'])
+            for lane, count in stats['queued'].items():
+                queued.add_metric([name, lane], count)
+        yield active
+        yield queued
+
+REGISTRY.register(_RuntimeCollector())
@@ -1,73 +1,133 @@
-import pyalex
 import json
+import os
 
+from fetcher import content_store, resilience
+from fetcher.singleflight import coalesced
+
+OPENALEX_API_URL = os.environ.get("OPENALEX_API_URL", "https://api.openalex.org")
+# Identifies us for OpenAlex's 'polite' pool of API clients
+MAILTO = "transformtrails@gmail.com"
+
+# Only the fields results are built from; full Work objects are mostly
+# locations, references, related works and yearly counts
+SELECT_FIELDS = ','.join([
+    'id', 'doi', 'title', 'publication_year', 'cited_by_count', 'type', 'authorships',
+    'abstract_inverted_index', 'concepts', 'primary_location',
+])
+# Largest page OpenAlex serves; more results are fetched with a cursor
+MAX_PER_PAGE = 200
+
+def invert_abstract(inverted_index):
+    """
+    Rebuilds an abstract from OpenAlex's inverted index (word -> positions)
+    by placing each word at its positions, with no sort.
+    """
+    if not inverted_index:
+        return ""
+    # Positions normally run from 0 with no gaps, so their count is the length
+    words = [None] * sum(map(len, inverted_index.values()))
+    try:
+        for word, positions in inverted_index.items():
+            for position in positions:
+                words[position] = word
+    except IndexError:
+        # The index skips positions: size the list by the highest one
+        words = [None] * (1 + max(position for positions in inverted_index.values() for position in positions))
+        for word, positions in inverted_index.items():
+            for position in positions:
+                words[position] = word
+    if None in words:
+        # Skipped positions would otherwise leave double spaces
+        return ' '.join(filter(None, words))
+    return ' '.join(words)
+
+def search_works(query, max_results=5, timeout=10):
+    """
+    Returns the raw Work objects (selected fields only) best matching a
+    query, following cursors when more than one page is needed.
+    """
+    params = {
+        'search': query,
+        'select': SELECT_FIELDS,
+        'per_page': min(max_results, MAX_PER_PAGE),
+        'mailto': MAILTO,
+    }
+    if max_results > MAX_PER_PAGE:
+        params['cursor'] = '*'
+    works = []
+    while len(works) < max_results:
+        response = resilience.get(f"{OPENALEX_API_URL}/works", params=params, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        works.extend(data.get('results', []))
+        cursor = data.get('meta', {}).get('next_cursor')
+        if 'cursor' not in params or not cursor or not data.get('results'):
+            break
+        params['cursor'] = cursor
+    return works[:max_results]
+
+def _to_result(work):
+    """
+    Normalizes an OpenAlex Work to the common result schema.
+    """
+    abstract = invert_abstract(work.get('abstract_inverted_index'))
+
+    # Format authors as a string
+    authors_list = [author['author'].get('display_name') for author in work.get('authorships') or [] if author.get('author')]
+    authors_str = ', '.join(name for name in authors_list if name) or 'Unknown'
+
+    # Try to get content from multiple sources
+    content = ""
+    if abstract:
+        content = abstract.replace('\n', ' ').strip()
+    else:
+        # Try to get content from other fields if abstract is not available
+        concepts = work.get('concepts') or []
+        if concepts:
+            concept_names = [concept.get('display_name', '') for concept in concepts[:5]]
+            content = f"Research concepts: {', '.join(concept_names)}. "
+
+        # Add journal/venue information
+        venue = (work.get('primary_location') or {}).get('source') or {}
+        if venue.get('display_name'):
+            content += f"Published in: {venue.get('display_name')}. "
+
+        # Add type information
+        work_type = work.get('type', '')
+        if work_type:
+            content += f"Type: {work_type.replace('https://openalex.org/types/', '')}. "
+
+        # If still no content, use title as content
+        if not content:
+            content = work.get('title') or 'No information available'
+
+    # Get URL from DOI or OpenAlex ID
+    url = work.get('doi') if work.get('doi') else work.get('id')
+
+    return content_store.attach({
+        'url': url,
+        'title': work.get('title') or 'No title available',
+        'author': authors_str,
+        'content': content,
+        'summary': content_store.snippet(content),  # Using abstract as summary
+        'published_date': str(work.get('publication_year') or 'Unknown'),
+        'source': 'OpenAlex',
+        'doi': work.get('doi'),
+        'cited_by_count': work.get('cited_by_count', 0),
+        'openalex_id': work.get('id')
+    }, content)
+
+@coalesced
 def search_openalex(query, max_results=5):
     """
     Searches OpenAlex for a given query and returns the results.
     """
-    results_data = []
-    # Good practice to provide an email for the 'polite' pool of API clients
-    pyalex.config.email = "transformtrails@gmail.com"
     try:
-        works = pyalex.Works().search(query).get(per_page=max_results)
-        
-        for work in works:
-            # The abstract is inverted index format, so we reconstruct it.
-            abstract = ""
-            if work.get('abstract_inverted_index'):
-                abstract = pyalex.invert_abstract(work['abstract_inverted_index'])
-
-            # Format authors as a string
-            authors_list = [author.get('author', {}).get('display_name') for author in work.get('authorships', []) if author.get('author')]
-            authors_str = ', '.join(authors_list) if authors_list else 'Unknown'
-            
-            # Try to get content from multiple sources
-            content = ""
-            if abstract:
-                content = abstract.replace('\n', ' ').strip()
-            else:
-                # Try to get content from other fields if abstract is not available
-                concepts = work.get('concepts', [])
-                if concepts:
-                    concept_names = [concept.get('display_name', '') for concept in concepts[:5]]
-                    content = f"Research concepts: {', '.join(concept_names)}. "
-                
-                # Add journal/venue information
-                venue = work.get('primary_location', {}).get('source', {})
-                if venue and venue.get('display_name'):
-                    content += f"Published in: {venue.get('display_name')}. "
-                
-                # Add type information
-                work_type = work.get('type', '')
-                if work_type:
-                    content += f"Type: {work_type.replace('https://openalex.org/types/', '')}. "
-                
-                # If still no content, use title as content
-                if not content:
-                    content = work.get('title', 'No information available')
-            
-            if len(content) > 1500:
-                content = content[:1500] + "..."
-            
-            # Get URL from DOI or OpenAlex ID
-            url = work.get('doi') if work.get('doi') else work.get('id')
-            
-            results_data.append({
-                'url': url,
-                'title': work.get('title', 'No title available'),
-                'author': authors_str,
-                'content': content,
-                'summary': content,  # Using abstract as summary
-                'published_date': str(work.get('publication_year', 'Unknown')),
-                'source': 'OpenAlex',
-                'doi': work.get('doi'),
-                'cited_by_count': work.get('cited_by_count', 0),
-                'openalex_id': work.get('id')
-            })
+        works = search_works(query, max_results)
     except Exception as e:
         print(f"An error occurred while searching OpenAlex: {e}")
         return []
-    return results_data
+    return [_to_result(work) for work in works]
 
 if __name__ == "__main__":
     search_query = "transformer architecture"
@@ -80,4 +140,4 @@ if __name__ == "__main__":
         print(f"Saved {len(scraped_works)} results to {filename}")
 
         for work in scraped_works:
-            print(f"\nTitle: {work['title']}\nAuthors: {', '.join(work['authors'])}\nYear: {work['publication_year']}") 
\ No newline at end of file
+            print(f"\nTitle: {work['title']}\nAuthors: {work['author']}\nYear: {work['published_date']}") 
\ No newline at end of file
@@ -0,0 +1,191 @@
+import math
+import os
+import re
+from collections import Counter
+
+from fetcher import content_store
+from fetcher.logs import get_logger
+
+log = get_logger('passages')
+
+# Inline text a result carries when focused on a query; the rest is served
+# by /content
+BUDGET_CHARS = int(os.environ.get("PASSAGE_BUDGET_CHARS", "1500"))
+# Paragraphs are merged up to MIN_PASSAGE_CHARS and split at sentences above
+# MAX_PASSAGE_CHARS, so passages are comparable in length
+MIN_PASSAGE_CHARS = 200
+MAX_PASSAGE_CHARS = 600
+
+# BM25 parameters, as in Lucene
+K1 = 1.2
+B = 0.75
+
+ELLIPSIS = "\n\n...\n\n"
+
+# A line without its surrounding whitespace
+_PARAGRAPH = re.compile(r'\S(?:[^\n]*\S)?')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_WORD = re.compile(r'\w+')
+
+def terms(text):
+    """Lower-cased words of three or more letters, with plural s removed."""
+    words = []
+    for word in _WORD.findall(text.lower()):
+        if len(word) < 3:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+def _sentence_spans(start, end, text):
+    # Packs the sentences of an over-long paragraph into passages, cutting a
+    # single sentence longer than a passage where the limit falls
+    sentences = []
+    cut = start
+    for match in _SENTENCE_END.finditer(text, start, end):
+        sentences.append((cut, match.start()))
+        cut = match.end()
+    sentences.append((cut, end))
+
+    spans = []
+    for sentence_start, sentence_end in sentences:
+        while sentence_end - sentence_start > MAX_PASSAGE_CHARS:
+            spans.append((sentence_start, sentence_start + MAX_PASSAGE_CHARS))
+            sentence_start += MAX_PASSAGE_CHARS
+        if spans and sentence_end - spans[-1][0] <= MAX_PASSAGE_CHARS:
+            spans[-1] = (spans[-1][0], sentence_end)
+        else:
+            spans.append((sentence_start, sentence_end))
+    return spans
+
+def split(text):
+    """
+    Splits text into passages of roughly paragraph size. Returns (start, end)
+    offsets into ``text``, so a passage can be read in context from /content.
+    """
+    passages = []
+    for match in _PARAGRAPH.finditer(text):
+        start, end = match.span()
+        if passages and passages[-1][1] - passages[-1][0] < MIN_PASSAGE_CHARS \
+                and end - passages[-1][0] <= MAX_PASSAGE_CHARS:
+            # Short paragraphs (headings, list items) join the one before
+            passages[-1] = (passages[-1][0], end)
+        elif end - start > MAX_PASSAGE_CHARS:
+            passages.extend(_sentence_spans(start, end, text))
+        else:
+            passages.append((start, end))
+    return passages
+
+def rank(query, text, spans):
+    """BM25 score of each passage for the query, with term rarity measured within the document."""
+    query_terms = set(terms(query))
+    counts = [Counter(terms(text[start:end])) for start, end in spans]
+    if not query_terms or not counts:
+        return [0.0] * len(spans)
+    lengths = [sum(count.values()) for count in counts]
+    average = sum(lengths) / len(lengths) or 1
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for count in counts if term in count)
+        idf[term] = math.log(1 + (len(counts) - df + 0.5) / (df + 0.5))
+    scores = []
+    for count, length in zip(counts, lengths):
+        score = 0.0
+        for term in query_terms:
+            tf = count.get(term)
+            if tf:
+                score += idf[term] * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average))
+        scores.append(score)
+    return scores
+
+def select(query, text, budget=BUDGET_CHARS):
+    """
+    Returns the passages of ``text`` that best match ``query`` and fit in
+    ``budget`` characters, in document order, as dicts of ``offset``,
+    ``length`` and ``score``. Passages that match no query term are only
+    returned, from the start of the text, when none matches.
+    """
+    spans = split(text)
+    scores = rank(query, text, spans)
+    ranked = sorted(range(len(spans)), key=lambda i: (-scores[i], i))
+    if ranked and scores[ranked[0]] > 0:
+        # Passages that share no term with the query are left out, even if
+        # the budget has room for them
+        ranked = [i for i in ranked if scores[i] > 0]
+    chosen = []
+    used = 0
+    for index in ranked:
+        start, end = spans[index]
+        if used + end - start > budget:
+            continue
+        chosen.append(index)
+        used += end - start
+        if budget - used < MIN_PASSAGE_CHARS:
+            break
+    return [
+        {'offset': spans[i][0], 'length': spans[i][1] - spans[i][0], 'score': round(scores[i], 3)}
+        for i in sorted(chosen)
+    ]
+
+def excerpt(text, passages):
+    """Joins selected passages, marking the text left out between them."""
+    parts = []
+    end = 0
+    for passage in passages:
+        if parts:
+            gap = text[end:passage['offset']]
+            parts.append(gap if not gap.strip() else ELLIPSIS)
+        parts.append(text[passage['offset']:passage['offset'] + passage['length']])
+        end = passage['offset'] + passage['length']
+    return ''.join(parts)
+
+def focus_text(result, query, text, budget=BUDGET_CHARS):
+    """
+    Replaces the result's inline content with the passages of its full
+    ``text`` that best answer ``query``, recording their offsets in
+    ``passages``. Texts that fit the budget are inlined whole.
+    """
+    if len(text) <= budget:
+        result['content'] = text
+        result['passages'] = [{'offset': 0, 'length': len(text), 'score': None}]
+        return result
+    passages = select(query, text, budget)
+    if not passages:
+        # A single passage longer than the budget: fall back to the snippet
+        return result
+    result['content'] = excerpt(text, passages)
+    result['passages'] = passages
+    return result
+
+def focus(result, query, budget=BUDGET_CHARS):
+    """
+    Focuses a result whose full text is in the content store on ``query``.
+    Results without stored text keep their snippet.
+    """
+    handle = result.get('content_handle')
+    if not handle:
+        return result
+    try:
+        text = content_store.load(handle)
+    except Exception as e:
+        log.warning("full text unavailable", handle=handle, error=repr(e))
+        return result
+    return focus_text(result, query, text, budget) if text else result
+
+def focus_all(results, query, budget=BUDGET_CHARS):
+    for result in results:
+        focus(result, query, budget)
+    return results
+
+if __name__ == "__main__":
+    document = "\n".join([
+        "Heat pumps move heat rather than generating it, which is why they are efficient.",
+        "History. The first heat pump was built in the 1850s by Peter von Rittinger for salt works. " * 3,
+        "In cold climates, modern heat pumps keep working well below freezing, though their "
+        "coefficient of performance falls as the outdoor temperature drops. " * 3,
+        "Installation costs vary with the size of the house and the ductwork already present. " * 3,
+    ])
+    selected = select("heat pump performance in cold weather", document, budget=500)
+    print(selected)
+    print(excerpt(document, selected))
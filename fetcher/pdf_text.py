@@ -0,0 +1,279 @@
+import concurrent.futures
+import hashlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import threading
+
+from fetcher import content_store, passages, resilience, tracing, unpaywall
+from fetcher.budget import Deadline
+from fetcher.cache import TTLCache
+from fetcher.logs import get_logger
+from fetcher.metrics import BYTES_DOWNLOADED, PDF_DOCUMENTS
+from fetcher.singleflight import SingleFlight
+
+# pypdf is optional; without it results keep their abstracts. It is only
+# imported by the parser processes.
+HAVE_PYPDF = importlib.util.find_spec('pypdf') is not None
+
+log = get_logger('pdf_text')
+
+# Larger files are abandoned mid-download
+MAX_PDF_BYTES = int(os.environ.get("PDF_MAX_BYTES", str(20 * 1024 * 1024)))
+# Only this many pages are parsed; the rest of the paper is references and
+# appendices more often than not
+MAX_PDF_PAGES = int(os.environ.get("PDF_MAX_PAGES", "30"))
+# Parser processes; parsing is CPU-bound, so more than the cores is no gain
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Papers downloaded per request at most, and at once
+MAX_PAPERS = 5
+DOWNLOAD_WORKERS = 4
+
+CHUNK_BYTES = 64 * 1024
+PARSE_TIMEOUT_SECONDS = 30
+
+# PDF SHA-256 -> extracted text's content handle and page counts. The text
+# itself lives in the content store, so a paper is parsed once however many
+# URLs it is served from.
+_parsed = TTLCache('pdf_text.parsed', maxsize=5000, ttl=content_store.CONTENT_RETENTION_SECONDS)
+# PDF URL -> SHA-256 of what it served, so a known URL is not downloaded again
+_urls = TTLCache('pdf_text.urls', maxsize=5000, ttl=24 * 3600)
+_flight = SingleFlight('pdf_text')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+class PdfTooLarge(Exception):
+    """Raised when a PDF is, or announces itself as, larger than MAX_PDF_BYTES."""
+
+class NotPdf(Exception):
+    """Raised when a PDF link serves something else, such as a login page."""
+
+def _extract(data, max_pages):
+    """
+    Runs in a parser process: the text of the first ``max_pages`` pages.
+    Returns (text, pages read, total pages).
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    texts = []
+    for page in reader.pages[:max_pages]:
+        try:
+            texts.append(page.extract_text() or '')
+        except Exception:
+            # One malformed page does not lose the rest of the paper
+            texts.append('')
+    text = '\n\n'.join(text.strip() for text in texts if text.strip())
+    return text, min(total, max_pages), total
+
+def get_pool():
+    """Returns the parser process pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned rather than forked: the API process holds threads and
+            # an event loop that must not be copied into the workers
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+def _recycle(pool):
+    """
+    Replaces a pool whose worker is stuck on a parse: its processes are
+    killed, parses still running in them fail, and the next parse starts a
+    new pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _watch(pool, future):
+    # Abandoning the wait does not stop the parse: a parse still running
+    # after PARSE_TIMEOUT_SECONDS would hold its worker for good, so the
+    # pool is recycled
+    def check():
+        if future.done():
+            return
+        if not future.running():
+            # Still queued behind other parses; its time starts once it runs
+            _watch(pool, future)
+            return
+        PDF_DOCUMENTS.labels('killed').inc()
+        log.warning("pdf parse over time, parser processes recycled", timeout_s=PARSE_TIMEOUT_SECONDS)
+        _recycle(pool)
+
+    timer = threading.Timer(PARSE_TIMEOUT_SECONDS, check)
+    timer.daemon = True
+    timer.start()
+    future.add_done_callback(lambda _: timer.cancel())
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def download(url, timeout=20):
+    """
+    Streams a PDF into memory, giving up as soon as it passes MAX_PDF_BYTES.
+    """
+    response = resilience.get(url, timeout=timeout, stream=True, headers={'Accept': 'application/pdf'})
+    try:
+        response.raise_for_status()
+        if int(response.headers.get('Content-Length') or 0) > MAX_PDF_BYTES:
+            raise PdfTooLarge(f"{url} is {response.headers['Content-Length']} bytes")
+        data = bytearray()
+        for chunk in response.iter_content(CHUNK_BYTES):
+            data += chunk
+            if len(data) > MAX_PDF_BYTES:
+                raise PdfTooLarge(f"{url} is over {MAX_PDF_BYTES} bytes")
+    finally:
+        response.close()
+    BYTES_DOWNLOADED.labels('pdf').inc(len(data))
+    if not data.startswith(b'%PDF'):
+        raise NotPdf(f"{url} served {response.headers.get('Content-Type', 'no content type')}")
+    return bytes(data)
+
+def _load(digest):
+    # A cached parse whose text has since expired from the store is redone
+    entry = _parsed.get(digest)
+    if entry is None:
+        return None
+    text = content_store.get_store().get(entry['content_handle'])
+    return dict(entry, text=text) if text is not None else None
+
+def _fetch_text(url, deadline):
+    digest = _urls.get(url)
+    if digest is not None:
+        cached = _load(digest)
+        if cached is not None:
+            PDF_DOCUMENTS.labels('cached').inc()
+            return cached
+
+    with tracing.span('pdf_download', url=url):
+        data = download(url, timeout=deadline.timeout(20))
+    digest = hashlib.sha256(data).hexdigest()
+    _urls.set(url, digest)
+    cached = _load(digest)
+    if cached is not None:
+        PDF_DOCUMENTS.labels('cached').inc()
+        return cached
+
+    with tracing.span('pdf_parse', bytes=len(data)):
+        pool = get_pool()
+        future = pool.submit(_extract, data, MAX_PDF_PAGES)
+        _watch(pool, future)
+        text, pages, total_pages = future.result(timeout=deadline.timeout(PARSE_TIMEOUT_SECONDS))
+    if not text:
+        # Scanned papers have no text layer
+        PDF_DOCUMENTS.labels('no_text').inc()
+        return None
+    entry = {
+        'content_handle': content_store.get_store().put(text, 'PDF'),
+        'pages': pages,
+        'total_pages': total_pages,
+    }
+    _parsed.set(digest, entry)
+    PDF_DOCUMENTS.labels('parsed').inc()
+    log.info("pdf parsed", url=url, bytes=len(data), pages=pages, total_pages=total_pages, chars=len(text))
+    return dict(entry, text=text)
+
+def fetch_text(url, deadline=None):
+    """
+    Returns the text of a PDF as a dict of ``text``, ``content_handle``,
+    ``pages`` (parsed) and ``total_pages``, or None if it has no text layer.
+    Raises on download or parse failures.
+    """
+    deadline = deadline or Deadline()
+    # Only share a download and parse that is given at least this caller's time
+    return _flight.do(url, _fetch_text, url, deadline, expires_at=deadline.expires_at)
+
+def pdf_url_for(item):
+    """
+    The PDF link of a result: its own ``pdf_url``, or failing that the best
+    open-access copy Unpaywall knows of for its DOI.
+    """
+    if item.get('pdf_url'):
+        return item['pdf_url']
+    if item.get('doi'):
+        oa_version = unpaywall.find_unpaywall_version(item['doi'])
+        location = (oa_version or {}).get('best_oa_location') or {}
+        return location.get('url_for_pdf')
+    return None
+
+def _fetch_for(item, deadline):
+    url = pdf_url_for(item)
+    if not url:
+        return None, None
+    try:
+        return url, fetch_text(url, deadline)
+    except PdfTooLarge as e:
+        PDF_DOCUMENTS.labels('too_large').inc()
+        log.info("pdf skipped", url=url, reason=str(e))
+    except NotPdf as e:
+        PDF_DOCUMENTS.labels('not_pdf').inc()
+        log.info("pdf skipped", url=url, reason=str(e))
+    except concurrent.futures.TimeoutError:
+        PDF_DOCUMENTS.labels('timeout').inc()
+        log.warning("pdf parse timed out", url=url)
+    except Exception as e:
+        PDF_DOCUMENTS.labels('failed').inc()
+        log.warning("pdf failed", url=url, error=repr(e))
+    return url, None
+
+def enhance_results_with_full_text(results, query, deadline=None, max_papers=MAX_PAPERS):
+    """
+    Replaces the abstracts of up to ``max_papers`` papers with the text of
+    their PDFs, from ``pdf_url`` or an open-access copy found by DOI.
+
+    A paper's ``content`` becomes the passages of the full text that best
+    answer ``query``, its ``content_handle`` and ``content_length`` refer to
+    the full text, and ``full_text`` records the PDF and the pages parsed.
+    The abstract stays in ``summary``. Papers whose PDF is missing, too
+    large, unparseable or not ready by the deadline keep their abstract.
+    """
+    deadline = deadline or Deadline()
+    candidates = [item for item in results if item.get('pdf_url') or item.get('doi')][:max_papers]
+    if not HAVE_PYPDF or not candidates or deadline.expired():
+        return results
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+    futures = {executor.submit(tracing.bind(_fetch_for), item, deadline): item for item in candidates}
+    done, not_done = concurrent.futures.wait(futures, timeout=deadline.remaining())
+    for future in not_done:
+        future.cancel()
+    executor.shutdown(wait=False)
+
+    for future in done:
+        item = futures[future]
+        url, document = future.result()
+        if document is None:
+            continue
+        text = document['text']
+        item['content_handle'] = document['content_handle']
+        item['content_length'] = len(text)
+        item['content'] = content_store.snippet(text)
+        passages.focus_text(item, query, text)
+        item['full_text'] = {
+            'pdf_url': url,
+            'pages': document['pages'],
+            'total_pages': document['total_pages'],
+            'truncated': document['pages'] < document['total_pages'],
+        }
+    if not_done:
+        log.info("pdf stage out of time", pending=len(not_done))
+    return results
+
+if __name__ == "__main__":
+    document = fetch_text("https://arxiv.org/pdf/1706.03762")
+    print(document['pages'], document['total_pages'], len(document['text']))
+    print(document['text'][:500])
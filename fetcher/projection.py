@@ -0,0 +1,105 @@
+def parse_fields(spec):
+    """
+    Parses a ``fields`` parameter such as ``query,results.title,results.url``
+    into a tree of the selected keys, where None selects a whole value.
+
+    Returns None (everything) for an empty spec.
+    """
+    tree = {}
+    for path in (spec or '').split(','):
+        parts = [part for part in path.strip().split('.') if part]
+        if not parts:
+            continue
+        node = tree
+        for part in parts[:-1]:
+            if part in node and node[part] is None:
+                # An ancestor is already selected in full
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = None
+    return tree or None
+
+def project(value, tree):
+    """
+    Keeps only the selected keys of ``value``. Lists are projected item by
+    item, so ``results.title`` selects the title of every result; keys that
+    are not present are skipped.
+    """
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+def _derived(summary, content):
+    # Summaries are truncated (and on Wikipedia, re-spaced) copies of the content
+    if summary.endswith('...'):
+        summary = summary[:-3]
+    summary = ' '.join(summary.split())
+    return ' '.join(content[:len(summary) * 2].split()).startswith(summary)
+
+def _flat_prices(prices):
+    current = prices.get('current_price')
+    flat = [current] if current else []
+    return flat + [price for price in prices.get('all_prices', []) if price != current]
+
+def compact_result(result):
+    """
+    Drops what a search result repeats: a summary that is a prefix of the
+    content, null fields, and the prices dict (flattened to a list with the
+    current price first).
+    """
+    content = result.get('content') or ''
+    compacted = {}
+    for key, value in result.items():
+        if value is None:
+            continue
+        if key == 'summary' and isinstance(value, str) and _derived(value, content):
+            continue
+        if key == 'prices' and isinstance(value, dict):
+            value = _flat_prices(value)
+            if not value:
+                continue
+        compacted[key] = value
+    return compacted
+
+def _compact_image(image):
+    return {key: value for key, value in image.items() if value not in ('', None)}
+
+def compact(response):
+    """
+    Compacts an endpoint response in place of the full one:
+
+    - search results go through compact_result (batch lines recursively)
+    - image responses drop ``all_images``, which repeats every image in
+      ``page_results``, and the empty alt text and titles of each image
+    """
+    compacted = {key: value for key, value in response.items() if value is not None}
+    if isinstance(compacted.get('results'), list):
+        compacted['results'] = [
+            compact(item) if 'results' in item else compact_result(item)
+            for item in compacted['results'] if isinstance(item, dict)
+        ]
+    if 'page_results' in compacted:
+        compacted.pop('all_images', None)
+        compacted['page_results'] = [
+            dict(page, images=[_compact_image(image) for image in page.get('images', [])])
+            for page in compacted['page_results']
+        ]
+    return compacted
+
+def shape(response, fields=None, compact_mode=False, keep=()):
+    """
+    Applies compact mode, then the ``fields`` projection, to a response.
+    Keys in ``keep`` (e.g. debug timings) survive any projection.
+    """
+    if compact_mode:
+        response = compact(response)
+    tree = parse_fields(fields) if isinstance(fields, str) else fields
+    if tree is not None:
+        tree = dict(tree, **{key: None for key in keep if key in response})
+        response = project(response, tree)
+    return response
@@ -1,100 +1,224 @@
-from Bio import Entrez
 import json
+import os
+import xml.etree.ElementTree as ET
 
+from fetcher import content_store, resilience
+from fetcher.cache import TTLCache
+from fetcher.ratelimit import TokenBucket
+from fetcher.singleflight import coalesced
+
+EUTILS_URL = os.environ.get("EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+# Always tell NCBI who you are
+EMAIL = "transformtrails@gmail.com"
+TOOL = "DeepResearcher"
+API_KEY = os.environ.get("NCBI_API_KEY")
+
+# NCBI allows 3 requests/second without an API key and 10 with one
+_bucket = TokenBucket(rate=10 if API_KEY else 3)
+
+# Records fetched per efetch page from the history server
+EFETCH_PAGE_SIZE = 100
+
+_search_cache = TTLCache('pubmed.search', maxsize=1000, ttl=1800)
+_record_cache = TTLCache('pubmed.records', maxsize=5000, ttl=24 * 3600)
+
+def _eutils_get(endpoint, params, stream=False, timeout=10):
+    params = dict(params, db='pubmed', tool=TOOL, email=EMAIL)
+    if API_KEY:
+        params['api_key'] = API_KEY
+    if not _bucket.acquire(timeout=timeout):
+        raise TimeoutError("Timed out waiting for the NCBI rate limiter")
+    response = resilience.get(f"{EUTILS_URL}/{endpoint}", params=params, stream=stream, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+def _esearch(query, max_results):
+    """
+    Runs esearch on the history server.
+
+    Returns:
+        A tuple of (PMID list, WebEnv, query_key).
+    """
+    cache_key = (query, max_results)
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    data = _eutils_get('esearch.fcgi', {
+        'term': query,
+        'retmax': max_results,
+        'usehistory': 'y',
+        'retmode': 'json',
+    }).json()
+    result = data.get('esearchresult', {})
+    found = (result.get('idlist', []), result.get('webenv'), result.get('querykey'))
+    _search_cache.set(cache_key, found)
+    return found
+
+def _text(element):
+    """Returns the full text of an element, including inline markup like <i>."""
+    return ''.join(element.itertext()).strip() if element is not None else ''
+
+def _parse_article(article_elem):
+    """
+    Converts a <PubmedArticle> element into the common result format.
+    """
+    citation = article_elem.find('MedlineCitation')
+    article = citation.find('Article') if citation is not None else None
+    if article is None:
+        return None
+
+    pmid = _text(citation.find('PMID')) or 'N/A'
+
+    authors = []
+    for author in article.findall('AuthorList/Author'):
+        name = f"{_text(author.find('ForeName'))} {_text(author.find('LastName'))}".strip()
+        if not name:
+            name = _text(author.find('CollectiveName'))
+        if name:
+            authors.append(name)
+    authors_str = ', '.join(authors) if authors else 'Unknown'
+
+    # Structured abstracts come as several labelled sections
+    abstract_parts = []
+    for part in article.findall('Abstract/AbstractText'):
+        text = _text(part)
+        label = part.get('Label')
+        if text:
+            abstract_parts.append(f"{label}: {text}" if label else text)
+    abstract = ' '.join(abstract_parts) if abstract_parts else 'No abstract available'
+    abstract = abstract.replace('\n', ' ').strip()
+
+    doi_info = None
+    for eloc in article.findall('ELocationID'):
+        if eloc.get('EIdType') == 'doi':
+            doi_info = _text(eloc)
+            break
+    if not doi_info:
+        for article_id in article_elem.findall('PubmedData/ArticleIdList/ArticleId'):
+            if article_id.get('IdType') == 'doi':
+                doi_info = _text(article_id)
+                break
+
+    url = f"https://doi.org/{doi_info}" if doi_info else f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+
+    pub_date = article.find('Journal/JournalIssue/PubDate')
+    year = 'Unknown'
+    if pub_date is not None:
+        year = _text(pub_date.find('Year')) or _text(pub_date.find('MedlineDate')) or 'Unknown'
+
+    return content_store.attach({
+        'url': url,
+        'title': _text(article.find('ArticleTitle')) or 'No title available',
+        'author': authors_str,
+        'content': abstract,
+        'summary': content_store.snippet(abstract),
+        'published_date': str(year),
+        'source': 'PubMed',
+        'journal': _text(article.find('Journal/Title')) or 'Unknown',
+        'pmid': pmid,
+        'doi': doi_info
+    }, abstract)
+
+def _iter_efetch(params):
+    """
+    Streams an efetch response and yields parsed articles one at a time.
+
+    Each <PubmedArticle> element is cleared as soon as it is parsed, so memory
+    stays flat regardless of how many records the page holds.
+    """
+    response = _eutils_get('efetch.fcgi', dict(params, rettype='abstract', retmode='xml'), stream=True)
+    try:
+        response.raw.decode_content = True
+        for _, elem in ET.iterparse(response.raw, events=('end',)):
+            if elem.tag != 'PubmedArticle':
+                continue
+            record = _parse_article(elem)
+            elem.clear()
+            if record:
+                yield record
+    finally:
+        response.close()
+
+def _fetch_records(id_list, webenv, query_key):
+    """
+    Fetches the given PMIDs, skipping any already in the record cache.
+    """
+    records = _record_cache.get_many(id_list)
+    missing = [pmid for pmid in id_list if pmid not in records]
+    if not missing:
+        return records
+
+    if webenv and query_key and len(missing) == len(id_list):
+        # Page through the stored result set instead of re-sending the IDs
+        for retstart in range(0, len(id_list), EFETCH_PAGE_SIZE):
+            page = _iter_efetch({
+                'WebEnv': webenv,
+                'query_key': query_key,
+                'retstart': retstart,
+                'retmax': min(EFETCH_PAGE_SIZE, len(id_list) - retstart),
+            })
+            for record in page:
+                records[record['pmid']] = record
+    else:
+        for start in range(0, len(missing), EFETCH_PAGE_SIZE):
+            for record in _iter_efetch({'id': ','.join(missing[start:start + EFETCH_PAGE_SIZE])}):
+                records[record['pmid']] = record
+
+    _record_cache.set_many({pmid: records[pmid] for pmid in missing if pmid in records})
+    return records
+
+@coalesced
 def search_pubmed(query, max_results=5):
     """
     Searches PubMed for a given query and returns the results.
     """
-    # Always tell NCBI who you are
-    Entrez.email = "transformtrails@gmail.com" 
-    
-    results_data = []
     try:
-        # Search PubMed for article IDs
-        handle = Entrez.esearch(db="pubmed", term=query, retmax=max_results)
-        record = Entrez.read(handle)
-        handle.close()
-        
-        id_list = record["IdList"]
+        id_list, webenv, query_key = _esearch(query, max_results)
         if not id_list:
             return []
-            
-        # Fetch the full records for the IDs
-        handle = Entrez.efetch(db="pubmed", id=id_list, rettype="medline", retmode="xml")
-        records = Entrez.read(handle)
-        handle.close()
-        
-        for record in records.get('PubmedArticle', []):
-            article = record.get('MedlineCitation', {}).get('Article', {})
-            authors_list = article.get('AuthorList', [])
-            authors = [f"{author.get('ForeName', '')} {author.get('LastName', '')}".strip() for author in authors_list]
-            
-            # Format authors as string
-            authors_str = ', '.join(authors) if authors else 'Unknown'
-            
-            # Get abstract and clean it
-            abstract_parts = article.get('Abstract', {}).get('AbstractText', [])
-            abstract = 'No abstract available'
-            if abstract_parts:
-                try:
-                    # Handle both string and dict elements
-                    text_parts = []
-                    for part in abstract_parts:
-                        if isinstance(part, str):
-                            text_parts.append(part)
-                        elif hasattr(part, 'get'):
-                            # It's a dict-like object, try to get text content
-                            text_parts.append(str(part))
-                        else:
-                            # Convert to string as fallback
-                            text_parts.append(str(part))
-                    abstract = ' '.join(text_parts)
-                except Exception as e:
-                    print(f"Error processing abstract: {e}")
-                    abstract = 'Abstract processing error'
-            
-            abstract = abstract.replace('\n', ' ').strip()
-            if len(abstract) > 1200:
-                abstract = abstract[:1200] + "..."
-            
-            # Get DOI and create URL
-            doi_info = None
-            elocation_ids = article.get('ELocationID', [])
-            for eloc in elocation_ids:
-                if eloc.get('@EIdType') == 'doi':
-                    doi_info = eloc.get('#text')
-                    break
-            
-            pmid = record.get('MedlineCitation', {}).get('PMID', 'N/A')
-            url = f"https://doi.org/{doi_info}" if doi_info else f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-            
-            # Get publication year
-            pub_date = article.get('Journal', {}).get('JournalIssue', {}).get('PubDate', {})
-            year = pub_date.get('Year') or pub_date.get('MedlineDate', 'Unknown')
-            
-            results_data.append({
-                'url': url,
-                'title': article.get('ArticleTitle', 'No title available'),
-                'author': authors_str,
-                'content': abstract,
-                'summary': abstract,
-                'published_date': str(year),
-                'source': 'PubMed',
-                'journal': article.get('Journal', {}).get('Title', 'Unknown'),
-                'pmid': str(pmid),
-                'doi': doi_info
-            })
+
+        records = _fetch_records(id_list, webenv, query_key)
+        # Keep esearch's relevance order
+        return [dict(records[pmid]) for pmid in id_list if pmid in records]
 
     except Exception as e:
         print(f"An error occurred while searching PubMed: {e}")
         return []
-    
-    return results_data
+
+def search_pubmed_many(queries, max_results=5):
+    """
+    Searches PubMed for several queries, fetching the records of all of them
+    with shared efetch requests.
+
+    Returns:
+        A dict mapping each query to its list of results.
+    """
+    ids_by_query = {}
+    for query in queries:
+        try:
+            ids_by_query[query] = _esearch(query, max_results)[0]
+        except Exception as e:
+            print(f"An error occurred while searching PubMed for '{query}': {e}")
+            ids_by_query[query] = []
+
+    all_ids = list(dict.fromkeys(pmid for ids in ids_by_query.values() for pmid in ids))
+    try:
+        # Several result sets cannot share one history-server query, so fetch by ID
+        records = _fetch_records(all_ids, None, None) if all_ids else {}
+    except Exception as e:
+        print(f"An error occurred while fetching PubMed records: {e}")
+        records = {}
+
+    return {
+        query: [dict(records[pmid]) for pmid in ids if pmid in records]
+        for query, ids in ids_by_query.items()
+    }
 
 if __name__ == "__main__":
     search_query = "crispr gene editing"
     scraped_articles = search_pubmed(search_query, max_results=5)
-    
+
     if scraped_articles:
         filename = "pubmed_results.json"
         with open(filename, 'w', encoding='utf-8') as f:
@@ -102,4 +226,4 @@ if __name__ == "__main__":
         print(f"Saved {len(scraped_articles)} results to {filename}")
 
         for article in scraped_articles:
-            print(f"\nTitle: {article['title']}\nJournal: {article['journal']}\nYear: {article['publication_year']}") 
\ No newline at end of file
+            print(f"\nTitle: {article['title']}\nJournal: {article['journal']}\nYear: {article['published_date']}")
@@ -0,0 +1,119 @@
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Longest pause a Retry-After header can impose; a bogus or hostile value
+# must not stall the limiter for hours
+MAX_RETRY_AFTER_SECONDS = 60
+
+def parse_retry_after(value, limit=MAX_RETRY_AFTER_SECONDS):
+    """
+    Seconds to wait from a Retry-After header, given either as a number of
+    seconds or as an HTTP-date, capped at ``limit``. None if it is missing
+    or cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        seconds = (when - datetime.now(timezone.utc)).total_seconds()
+    if math.isnan(seconds):
+        return None
+    return min(max(0.0, seconds), float(limit))
+
+class TokenBucket:
+    """
+    A thread-safe token bucket.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``;
+    each upstream request takes one token and waits if none are left.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if they are available right now, without waiting."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Block until tokens are available.
+
+        Returns:
+            True once the tokens were taken, False if ``timeout`` seconds
+            passed first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    A token bucket that backs off when the upstream answers 429.
+
+    Each throttle halves the refill rate (down to ``min_rate``) and can pause
+    the bucket for the server's Retry-After; each success recovers a tenth
+    of the base rate until the original rate is reached again.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=None):
+        super().__init__(rate, capacity)
+        self.base_rate = self.rate
+        self.min_rate = float(min_rate if min_rate is not None else self.rate / 16)
+
+    def penalize(self, retry_after=None):
+        """
+        Backs off after a 429. ``retry_after`` is the raw Retry-After header;
+        when it is missing or unparseable only the rate is halved.
+        """
+        delay = parse_retry_after(retry_after)
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            if delay:
+                # Push the refill clock forward so no tokens accrue until then
+                self._updated = time.monotonic() + delay
+
+    def reward(self):
+        with self._lock:
+            if self.rate < self.base_rate:
+                self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
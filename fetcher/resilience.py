@@ -0,0 +1,369 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fetcher.metrics import BYTES_DOWNLOADED, UPSTREAM_ERRORS
+from fetcher.ratelimit import TokenBucket
+
+# Per-host request rate (req/s) and concurrency caps. Hosts not listed here
+# get DEFAULT_POLICY; the limits are deliberately a little under each
+# upstream's published guidance so that bursts do not trip their throttles.
+HOST_POLICIES = {
+    'export.arxiv.org': {'rate': 0.34, 'concurrency': 1},  # arXiv asks for one request every 3 s
+    'api.crossref.org': {'rate': 10, 'concurrency': 5},
+    'api.openalex.org': {'rate': 10, 'concurrency': 5},
+    'eutils.ncbi.nlm.nih.gov': {'rate': 10, 'concurrency': 3},
+    'api.semanticscholar.org': {'rate': 5, 'concurrency': 2},
+    'www.wikidata.org': {'rate': 10, 'concurrency': 4},
+    'query.wikidata.org': {'rate': 2, 'concurrency': 2},
+    'en.wikipedia.org': {'rate': 10, 'concurrency': 4},
+    'api.unpaywall.org': {'rate': 10, 'concurrency': 4},
+    'www.google.com': {'rate': 1, 'concurrency': 2},
+}
+DEFAULT_POLICY = {'rate': 5, 'concurrency': 4}
+
+# Hosts outside HOST_POLICIES (mostly scraped sites) keep a guard only while
+# they are among the most recently used, and share the 'other' metric label
+MAX_OTHER_HOSTS = int(os.environ.get("UPSTREAM_MAX_HOSTS", "1000"))
+OTHER_HOSTS = 'other'
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream that cannot take the request now."""
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+class HostBusyError(UpstreamUnavailable):
+    pass
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures for one host and fails fast once it trips.
+
+    After ``failure_threshold`` failures in a row the breaker opens and every
+    call is rejected for ``reset_timeout`` seconds. It then goes half-open and
+    lets a single probe through: success closes it, failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.total_failures = 0
+        self.total_rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        """Whether calls would be rejected right now (does not start a probe)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.total_rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def record_abandoned(self):
+        """
+        The call ended without an outcome (e.g. it was cancelled): it does not
+        count either way, but a half-open probe is freed for the next caller.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'total_failures': self.total_failures,
+                'total_rejected': self.total_rejected,
+                'retry_in': round(retry_in, 1) if retry_in is not None else None,
+            }
+
+class HostGuard:
+    """
+    Rate limit, concurrency cap and circuit breaker for a single host.
+    """
+
+    def __init__(self, host, rate, concurrency):
+        self.host = host
+        self.bucket = TokenBucket(rate, capacity=max(1, concurrency))
+        self.breaker = CircuitBreaker()
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self._slots = threading.Condition()
+
+    def _take_slot(self):
+        with self._slots:
+            if self.in_flight < self.concurrency:
+                self.in_flight += 1
+                return True
+            return False
+
+    def _release_slot(self):
+        with self._slots:
+            self.in_flight -= 1
+            self._slots.notify()
+
+    def _check_breaker(self):
+        """Claims a call from the breaker once a slot and a token are held."""
+        if not self.breaker.allow():
+            self._release_slot()
+            raise CircuitOpenError(f"Circuit open for {self.host}")
+
+    def _enter(self, wait):
+        # Fail fast before queueing behind other callers of a tripped host
+        if self.breaker.is_open():
+            raise CircuitOpenError(f"Circuit open for {self.host}")
+        deadline = time.monotonic() + wait
+        with self._slots:
+            while self.in_flight >= self.concurrency:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._slots.wait(remaining):
+                    raise HostBusyError(f"Too many concurrent requests to {self.host}")
+            self.in_flight += 1
+        if not self.bucket.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._release_slot()
+            raise HostBusyError(f"Rate limit for {self.host} exceeded")
+        self._check_breaker()
+
+    async def _aenter(self, wait):
+        if self.breaker.is_open():
+            raise CircuitOpenError(f"Circuit open for {self.host}")
+        deadline = time.monotonic() + wait
+        # Poll rather than block so the event loop keeps running
+        while not self._take_slot():
+            if time.monotonic() >= deadline:
+                raise HostBusyError(f"Too many concurrent requests to {self.host}")
+            await asyncio.sleep(0.05)
+        while not self.bucket.try_acquire():
+            if time.monotonic() >= deadline:
+                self._release_slot()
+                raise HostBusyError(f"Rate limit for {self.host} exceeded")
+            await asyncio.sleep(min(0.25, 1 / self.bucket.rate))
+        self._check_breaker()
+
+    @contextmanager
+    def call(self, wait=10):
+        """
+        Guards a blocking call to this host.
+
+        Raises CircuitOpenError or HostBusyError without calling the host when
+        it is tripped or saturated. Exceptions from the body count as failures;
+        cancellation does not count, but frees a half-open probe.
+        """
+        self._enter(wait)
+        try:
+            yield
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled or interrupted: says nothing about the host
+            self.breaker.record_abandoned()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            self._release_slot()
+
+    @asynccontextmanager
+    async def acall(self, wait=10):
+        """Async variant of call() for coroutine-based clients such as Playwright."""
+        await self._aenter(wait)
+        try:
+            yield
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled or interrupted: says nothing about the host
+            self.breaker.record_abandoned()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            self._release_slot()
+
+    def snapshot(self):
+        state = self.breaker.snapshot()
+        state.update({
+            'in_flight': self.in_flight,
+            'max_concurrency': self.concurrency,
+            'rate_limit': self.bucket.rate,
+        })
+        return state
+
+_guards = {}
+# Least recently used first
+_other_guards = OrderedDict()
+_guards_lock = threading.Lock()
+
+def _evict_idle_guards():
+    # Caller holds _guards_lock. Guards with calls in flight are kept, and so
+    # is the newest, so the guard just handed out stays shared.
+    for host in list(_other_guards)[:-1]:
+        if len(_other_guards) <= MAX_OTHER_HOSTS:
+            return
+        if _other_guards[host].in_flight == 0:
+            del _other_guards[host]
+
+def guard(host):
+    """Returns the shared HostGuard for a host, creating it on first use."""
+    host = host.lower()
+    with _guards_lock:
+        host_guard = _guards.get(host)
+        if host_guard is not None:
+            return host_guard
+        host_guard = _other_guards.get(host)
+        if host_guard is not None:
+            _other_guards.move_to_end(host)
+            return host_guard
+        policy = HOST_POLICIES.get(host)
+        if policy is not None:
+            host_guard = _guards[host] = HostGuard(host, policy['rate'], policy['concurrency'])
+        else:
+            host_guard = _other_guards[host] = HostGuard(host, DEFAULT_POLICY['rate'], DEFAULT_POLICY['concurrency'])
+            _evict_idle_guards()
+        return host_guard
+
+def guard_for_url(url):
+    return guard(urlparse(url).hostname or '')
+
+def metric_host(host):
+    """Metric label for a host: itself if it has a policy, else OTHER_HOSTS."""
+    return host if host in HOST_POLICIES else OTHER_HOSTS
+
+def is_open(host):
+    host = host.lower()
+    host_guard = _guards.get(host) or _other_guards.get(host)
+    return host_guard is not None and host_guard.breaker.is_open()
+
+def upstream_states(others=None):
+    """
+    Breaker and limiter state for every host with a policy and for the
+    ``others`` most recently used hosts without one (all tracked if None).
+    """
+    with _guards_lock:
+        guards = list(_guards.values())
+        recent = list(_other_guards.values())
+    if others is not None:
+        recent = recent[-others:] if others > 0 else []
+    return {
+        host_guard.host: host_guard.snapshot()
+        for host_guard in sorted(guards, key=lambda g: g.host) + sorted(recent, key=lambda g: g.host)
+    }
+
+def other_host_count():
+    """Hosts without a policy that currently have a guard."""
+    with _guards_lock:
+        return len(_other_guards)
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+_session = _build_session()
+
+def request(method, url, timeout=10, wait=None, **kwargs):
+    """
+    Sends a request through the shared session and the host's guard.
+
+    429 and 5xx responses raise requests.HTTPError and count against the
+    host's breaker; other status codes are returned to the caller as-is.
+    """
+    host_guard = guard_for_url(url)
+    try:
+        with host_guard.call(wait=timeout if wait is None else wait):
+            response = _session.request(method, url, timeout=timeout, **kwargs)
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(metric_host(host_guard.host), _error_kind(e)).inc()
+        raise
+
+    if kwargs.get('stream'):
+        BYTES_DOWNLOADED.labels('api').inc(int(response.headers.get('Content-Length') or 0))
+    else:
+        BYTES_DOWNLOADED.labels('api').inc(len(response.content))
+    return response
+
+def warm_connection(url, timeout=5):
+    """
+    Opens a connection to the host of ``url`` in the shared session's pool,
+    so the first real request skips the TCP and TLS handshakes. The HEAD
+    request it sends bypasses the host's guard and does not count against
+    its breaker. Returns whether the host answered.
+    """
+    try:
+        _session.head(url, timeout=timeout, allow_redirects=False).close()
+    except requests.RequestException:
+        return False
+    return True
+
+def _error_kind(error):
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(error, HostBusyError):
+        return 'busy'
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return 'throttled' if error.response.status_code == 429 else 'http_5xx'
+    return 'error'
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
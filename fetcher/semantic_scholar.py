@@ -1,29 +1,162 @@
-import semanticscholar
 import json
+import os
 
+import requests
+
+from fetcher import content_store, resilience
+from fetcher.cache import TTLCache
+from fetcher.ratelimit import AdaptiveTokenBucket
+from fetcher.singleflight import coalesced
+
+S2_API_URL = os.environ.get("S2_API_URL", "https://api.semanticscholar.org/graph/v1")
+API_KEY = os.environ.get("S2_API_KEY")
+
+PAPER_FIELDS = ','.join([
+    'paperId', 'title', 'abstract', 'tldr', 'year', 'publicationDate', 'authors',
+    'venue', 'url', 'externalIds', 'citationCount', 'openAccessPdf',
+])
+
+# The batch endpoint hydrates up to 500 papers per request
+MAX_IDS_PER_BATCH = 500
+
+# Keyed clients get a dedicated 1 req/s; the shared anonymous pool is tighter
+_bucket = AdaptiveTokenBucket(rate=1.0 if API_KEY else 0.5, capacity=2)
+
+_headers = {'x-api-key': API_KEY} if API_KEY else {}
+
+_search_cache = TTLCache('semantic_scholar.search', maxsize=1000, ttl=1800)
+_paper_cache = TTLCache('semantic_scholar.papers', maxsize=5000, ttl=24 * 3600)
+
+def _request(method, path, timeout=5, **kwargs):
+    """
+    Sends a rate-limited request, adapting the limiter to 429 responses.
+    """
+    if not _bucket.acquire(timeout=timeout):
+        raise TimeoutError("Timed out waiting for the Semantic Scholar rate limiter")
+    try:
+        response = resilience.request(method, f"{S2_API_URL}{path}", headers=_headers, timeout=timeout, **kwargs)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 429:
+            _bucket.penalize(e.response.headers.get('Retry-After'))
+        raise
+    _bucket.reward()
+    response.raise_for_status()
+    return response.json()
+
+def _search_ids(query, limit):
+    cache_key = (query, limit)
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    data = _request('GET', '/paper/search', params={'query': query, 'limit': limit, 'fields': 'paperId'})
+    ids = [item['paperId'] for item in data.get('data', []) if item.get('paperId')]
+    _search_cache.set(cache_key, ids)
+    return ids
+
+def get_papers(ids):
+    """
+    Hydrates papers by ID with the batch endpoint, serving cached ones locally.
+
+    IDs may be Semantic Scholar paper IDs or prefixed external IDs such as
+    ``DOI:10.1038/nature12373`` or ``ARXIV:2106.15928``.
+
+    Returns:
+        A dict mapping each requested ID to its raw paper JSON.
+    """
+    ids = list(dict.fromkeys(ids))
+    papers = _paper_cache.get_many(ids)
+
+    missing = [paper_id for paper_id in ids if paper_id not in papers]
+    for start in range(0, len(missing), MAX_IDS_PER_BATCH):
+        batch = missing[start:start + MAX_IDS_PER_BATCH]
+        data = _request('POST', '/paper/batch', params={'fields': PAPER_FIELDS}, json={'ids': batch})
+        # The batch endpoint answers positionally, with null for unknown IDs
+        for paper_id, paper in zip(batch, data):
+            if paper:
+                papers[paper_id] = paper
+                _paper_cache.set(paper_id, paper)
+
+    return papers
+
+def _to_result(paper):
+    """
+    Normalizes a Semantic Scholar paper to the common result schema.
+    """
+    authors = [author.get('name') for author in paper.get('authors') or [] if author.get('name')]
+    authors_str = ', '.join(authors) if authors else 'Unknown'
+
+    content = (paper.get('abstract') or '').replace('\n', ' ').strip()
+    if not content and paper.get('tldr'):
+        content = paper['tldr'].get('text') or ''
+    if not content:
+        content_parts = []
+        if paper.get('venue'):
+            content_parts.append(f"Published in: {paper['venue']}")
+        if paper.get('citationCount'):
+            content_parts.append(f"Cited by: {paper['citationCount']} papers")
+        content = '. '.join(content_parts) if content_parts else f"Research paper: {paper.get('title')}"
+
+    doi = (paper.get('externalIds') or {}).get('DOI')
+    published = paper.get('publicationDate') or paper.get('year')
+
+    return content_store.attach({
+        'url': f"https://doi.org/{doi}" if doi else paper.get('url'),
+        'title': paper.get('title') or 'No title available',
+        'author': authors_str,
+        'content': content,
+        'summary': content_store.snippet(content),
+        'published_date': str(published) if published else 'Unknown',
+        'source': 'Semantic Scholar',
+        'doi': doi,
+        'venue': paper.get('venue') or 'Unknown',
+        'cited_by_count': paper.get('citationCount') or 0,
+        'pdf_url': (paper.get('openAccessPdf') or {}).get('url'),
+        'paper_id': paper.get('paperId')
+    }, content)
+
+@coalesced
 def search_semantic_scholar(query, limit=5):
     """
     Searches Semantic Scholar for a given query and returns the results.
     """
-    papers_data = []
-    sch = semanticscholar.SemanticScholar(timeout=20)
     try:
-        results = sch.search_paper(query, limit=limit)
-        for item in results:
-            papers_data.append({
-                'source': 'Semantic Scholar',
-                'title': item.title,
-                'authors': [author['name'] for author in item.authors],
-                'year': item.year,
-                'abstract': item.abstract,
-                'url': item.url,
-                'paperId': item.paperId,
-                'venue': item.venue
-            })
+        ids = _search_ids(query, limit)
+        if not ids:
+            return []
+        papers = get_papers(ids)
+        return [_to_result(papers[paper_id]) for paper_id in ids if paper_id in papers]
     except Exception as e:
         print(f"An error occurred while searching Semantic Scholar: {e}")
         return []
-    return papers_data
+
+def search_semantic_scholar_many(queries, limit=5):
+    """
+    Searches Semantic Scholar for several queries, hydrating the papers of
+    all of them with shared batch requests.
+
+    Returns:
+        A dict mapping each query to its list of results.
+    """
+    ids_by_query = {}
+    for query in queries:
+        try:
+            ids_by_query[query] = _search_ids(query, limit)
+        except Exception as e:
+            print(f"An error occurred while searching Semantic Scholar for '{query}': {e}")
+            ids_by_query[query] = []
+
+    all_ids = [paper_id for ids in ids_by_query.values() for paper_id in ids]
+    try:
+        papers = get_papers(all_ids) if all_ids else {}
+    except Exception as e:
+        print(f"An error occurred while fetching Semantic Scholar papers: {e}")
+        papers = {}
+
+    return {
+        query: [_to_result(papers[paper_id]) for paper_id in ids if paper_id in papers]
+        for query, ids in ids_by_query.items()
+    }
 
 if __name__ == "__main__":
     search_query = "large language models"
@@ -36,4 +169,4 @@ if __name__ == "__main__":
         print(f"Saved {len(scraped_papers)} results to {filename}")
 
         for paper in scraped_papers:
-            print(f"\nTitle: {paper['title']}\nAuthors: {', '.join(paper['authors'])}\nYear: {paper['year']}") 
\ No newline at end of file
+            print(f"\nTitle: {paper['title']}\nAuthors: {paper['author']}\nYear: {paper['published_date']}")
@@ -0,0 +1,161 @@
+import asyncio
+import copy
+import functools
+import threading
+
+def _outlasts(flight_expires_at, expires_at):
+    # None is no deadline, which outlasts every other
+    return flight_expires_at is None or (expires_at is not None and flight_expires_at >= expires_at)
+
+class _Call:
+    def __init__(self, expires_at=None):
+        self.expires_at = expires_at
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class _Stats:
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+
+    def snapshot(self):
+        return {'calls': self.calls, 'coalesced_waiters': self.coalesced}
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+def _stats_for(name):
+    with _stats_lock:
+        return _stats.setdefault(name, _Stats())
+
+def stats():
+    """Executed calls and coalesced waiters for every flight group, by name."""
+    with _stats_lock:
+        return {name: group.snapshot() for name, group in sorted(_stats.items())}
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls from different threads into one.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and receive the same result (or exception).
+    Every caller gets its own deep copy, so mutating a result is safe.
+
+    With ``expires_at`` (a time.monotonic() deadline, None for none) a caller
+    only joins a call that runs at least as long as it may wait; otherwise
+    it starts its own, which later callers join instead.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = _stats_for(name)
+
+    def do(self, key, fn, *args, expires_at=None, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None or not _outlasts(call.expires_at, expires_at)
+            if leader:
+                call = self._calls[key] = _Call(expires_at)
+                self._stats.calls += 1
+            else:
+                call.waiters += 1
+                self._stats.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+class _Flight:
+    def __init__(self, task, expires_at=None):
+        self.task = task
+        self.expires_at = expires_at
+        self.waiters = 0
+
+class AsyncSingleFlight:
+    """
+    Collapses concurrent identical coroutine calls into one shared task.
+
+    The task is shielded from its waiters, so a client that disconnects
+    (cancelling its own await) does not cancel the work for everyone else.
+    Only when the last waiter is cancelled is the task itself cancelled.
+    ``expires_at`` works as for SingleFlight.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._stats = _stats_for(name)
+
+    async def do(self, key, coro_fn, *args, expires_at=None, **kwargs):
+        flight = self._flights.get(key)
+        if flight is not None and flight.task.get_loop() is not asyncio.get_running_loop():
+            flight = None
+        if flight is not None and not _outlasts(flight.expires_at, expires_at):
+            flight = None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(coro_fn(*args, **kwargs)), expires_at)
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda finished: self._forget(key, finished))
+            self._stats.calls += 1
+        else:
+            self._stats.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+        return copy.deepcopy(result)
+
+    def in_flight(self, key):
+        """Whether a call for ``key`` is running that a new caller would join."""
+        flight = self._flights.get(key)
+        return flight is not None and flight.task.get_loop() is asyncio.get_running_loop() and not flight.task.done()
+
+    def _forget(self, key, task):
+        flight = self._flights.get(key)
+        if flight is not None and flight.task is task:
+            del self._flights[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+def coalesced(fn):
+    """
+    Decorator applying a SingleFlight keyed on the call's arguments.
+    """
+    flight = SingleFlight(f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}")
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return flight.do((_freeze(args), _freeze(kwargs)), fn, *args, **kwargs)
+
+    return wrapper
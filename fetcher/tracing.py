@@ -0,0 +1,141 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+# The span new child spans attach to; None when the request is not being traced
+_current_span = ContextVar('current_span', default=None)
+
+class Span:
+    """One timed step of a request; children are the steps it ran."""
+
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    def to_dict(self, origin):
+        entry = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 1),
+            # None for work still running when the response was built (e.g. an abandoned source)
+            'duration_ms': None if self.end is None else round((self.end - self.start) * 1000, 1),
+        }
+        entry.update(self.attrs)
+        if self.children:
+            children = sorted(list(self.children), key=lambda child: child.start)
+            entry['children'] = [child.to_dict(origin) for child in children]
+        return entry
+
+@contextmanager
+def trace(name, **attrs):
+    """
+    Records the spans opened inside the block into a tree rooted at ``name``.
+
+    Yields the root span; call ``to_dict()`` on it once the block has exited.
+    """
+    root = Span(name, attrs)
+    token = _current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.end = time.perf_counter()
+        _current_span.reset(token)
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times the block as a child of the current span. Does nothing when the
+    current request is not being traced.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+def timings(root):
+    return root.to_dict(root.start)
+
+def bind(fn):
+    """
+    Wraps fn to run in the caller's context, so that spans and the request ID
+    follow work handed to a thread pool.
+    """
+    return functools.partial(copy_context().run, fn)
+
+class SamplingProfiler:
+    """
+    Samples the Python stack of every thread at a fixed interval.
+
+    Output is in collapsed-stack format (``frame;frame;frame count`` per
+    line), which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[';'.join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+# Sampling sees every thread, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+
+@contextmanager
+def profile(interval=0.005):
+    """
+    Profiles the block, yielding the profiler, or None if another request is
+    already being profiled.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _profile_lock.release()
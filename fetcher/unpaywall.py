@@ -1,6 +1,8 @@
 import requests
 import json
 
+from fetcher import resilience
+
 def find_unpaywall_version(doi):
     """
     Finds a free-to-read version of a paper using its DOI via Unpaywall.
@@ -17,7 +19,7 @@ def find_unpaywall_version(doi):
     
     result_data = None
     try:
-        response = requests.get(url, timeout=20)
+        response = resilience.get(url, timeout=20)
         response.raise_for_status()
         data = response.json()
         
@@ -33,7 +35,7 @@ def find_unpaywall_version(doi):
         else:
             print(f"--- No open access version found for DOI: {doi} ---")
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, resilience.UpstreamUnavailable) as e:
         print(f"An error occurred while checking Unpaywall for DOI {doi}: {e}")
         return None
         
@@ -0,0 +1,115 @@
+import asyncio
+import importlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from fetcher import (
+    arxiv_scraper, browser_pool, crossref, openalex, pubmed, resilience, semantic_scholar, wikidata, wikipedia
+)
+from fetcher.logs import get_logger
+
+log = get_logger('warmup')
+
+# Comma-separated steps run in the background once the API is up, so that
+# the first requests do not pay for them: 'imports' loads the libraries the
+# scrapers import on first use, 'browser' launches the shared Chromium and
+# 'http' opens pooled connections to the academic APIs. 'all' runs them all.
+PREWARM = os.environ.get("PREWARM", "")
+STEPS = ('imports', 'browser', 'http')
+
+# Libraries the fetchers import on first use rather than at startup
+LAZY_IMPORTS = ('bs4', 'playwright.async_api', 'googlesearch', 'arxiv', 'SPARQLWrapper')
+
+CONNECT_TIMEOUT = 5
+
+# Step -> {'state': 'running' | 'done' | 'failed', 'duration_ms', 'error'}
+_steps = {}
+_task = None
+
+def parse_steps(value):
+    steps = {step.strip() for step in value.split(',') if step.strip()}
+    if 'all' in steps:
+        return list(STEPS)
+    unknown = steps - set(STEPS)
+    if unknown:
+        raise ValueError(f"Unknown PREWARM steps: {', '.join(sorted(unknown))}")
+    return [step for step in STEPS if step in steps]
+
+def _import_all():
+    for name in LAZY_IMPORTS:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            log.warning("warm-up import failed", module=name, error=repr(e))
+
+async def _browser():
+    # Loaded off the event loop first; launching would import it on the loop
+    await asyncio.to_thread(importlib.import_module, 'playwright.async_api')
+    await browser_pool.get_pool().browser()
+
+def api_urls():
+    """Root URL of each academic API host the research fan-out calls."""
+    urls = [
+        arxiv_scraper.ARXIV_API_URL, openalex.OPENALEX_API_URL, crossref.CROSSREF_API_URL, pubmed.EUTILS_URL,
+        semantic_scholar.S2_API_URL, wikipedia.WIKIPEDIA_API_URL, wikidata.WIKIDATA_API_URL,
+    ]
+    roots = {f"{urlsplit(url).scheme}://{urlsplit(url).netloc}/" for url in urls}
+    return sorted(roots)
+
+def _connect_all():
+    urls = api_urls()
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        opened = sum(executor.map(lambda url: resilience.warm_connection(url, CONNECT_TIMEOUT), urls))
+    if opened < len(urls):
+        log.info("some connections not warmed", opened=opened, hosts=len(urls))
+
+async def _run_step(step):
+    _steps[step] = {'state': 'running'}
+    start = time.perf_counter()
+    try:
+        if step == 'imports':
+            await asyncio.to_thread(_import_all)
+        elif step == 'browser':
+            await _browser()
+        elif step == 'http':
+            await asyncio.to_thread(_connect_all)
+    except Exception as e:
+        # A failed step only means the first request pays for it instead
+        _steps[step] = {'state': 'failed', 'error': repr(e)}
+        log.warning("warm-up step failed", step=step, error=repr(e))
+    else:
+        _steps[step] = {'state': 'done'}
+    _steps[step]['duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    log.info("warm-up step finished", step=step, **_steps[step])
+
+async def _run(steps):
+    await asyncio.gather(*(_run_step(step) for step in steps))
+
+def start(steps=None):
+    """
+    Starts the warm-up steps (by default those in PREWARM) in the background
+    of the running event loop. Returns at once.
+    """
+    global _task
+    steps = parse_steps(PREWARM) if steps is None else steps
+    for step in steps:
+        _steps[step] = {'state': 'pending'}
+    if steps:
+        _task = asyncio.get_running_loop().create_task(_run(steps))
+
+async def stop():
+    global _task
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None
+
+def status():
+    """Whether every warm-up step has finished, failed or not, and each step's state."""
+    ready = all(step['state'] in ('done', 'failed') for step in _steps.values())
+    return {'ready': ready, 'steps': dict(_steps)}
@@ -1,9 +1,33 @@
-from googlesearch import search
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
 import re
 import asyncio
+import math
+import os
 import random
+from collections import deque
+from urllib.parse import urldefrag, urljoin, urlparse
+
+from fetcher import browser_pool, content_store, dedup, extraction, passages, resilience, tracing
+from fetcher.budget import Deadline, COMPLETE, PARTIAL, SKIPPED
+from fetcher.logs import get_logger
+from fetcher.metrics import BYTES_DOWNLOADED, PAGES_TRUNCATED, time_stage
+from fetcher.singleflight import AsyncSingleFlight, coalesced
+
+log = get_logger('websearch')
+
+# When set, result URLs come from this JSON search service instead of Google
+# (the load-test harness in bench/ points it at a local stand-in)
+SEARCH_API_URL = os.environ.get("SEARCH_API_URL")
+SEARCH_HOST = urlparse(SEARCH_API_URL).hostname if SEARCH_API_URL else 'www.google.com'
+
+# Concurrent requests that hit the same URL share one scrape
+_page_flight = AsyncSingleFlight('websearch.scrape_page')
+
+# Links kept per page for crawling; navigation-heavy pages can have thousands
+MAX_LINKS_PER_PAGE = 300
+
+# Extra search results requested, as a share of num_results, to refill the
+# slots of pages dropped as duplicates
+OVERFETCH_RATIO = 0.5
 
 class AdvancedWebScraper:
     def __init__(self):
@@ -74,78 +98,113 @@ class AdvancedWebScraper:
             if cleaned and any(char.isdigit() for char in cleaned):
                 cleaned_prices.append(cleaned)
         
-        prices['all_prices'] = list(set(cleaned_prices))[:5]
+        # Keep page order so the same page always yields the same prices
+        prices['all_prices'] = list(dict.fromkeys(cleaned_prices))[:5]
         if not prices['current_price'] and prices['all_prices']:
             prices['current_price'] = prices['all_prices'][0]
         
         return prices
 
     def clean_text(self, text):
-        if not text: return ""
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
-        lines = [line.strip() for line in text.split('\n')]
-        lines = [line for line in lines if line and len(line) > 3]
-        return '\n'.join(lines).strip()
+        return extraction.clean_text(text)
 
     async def extract_vast_content(self, soup):
-        content_parts = []
-        
-        # Remove unwanted elements
-        for element in soup(['script', 'style', 'nav', 'header', 'footer', 'aside', 'menu']):
-            element.decompose()
-        
-        # Extract from main content areas
-        selectors = ['main', 'article', '.main-content', '#main-content', '.content', '#content', '.post-content']
-        for selector in selectors:
-            elements = soup.select(selector)
-            for element in elements:
-                text = self.clean_text(element.get_text())
-                if len(text) > 100:
-                    content_parts.append(text)
-                    if len('\n'.join(content_parts)) > 3000: break
-            if len('\n'.join(content_parts)) > 3000: break
-        
-        # Fallback to paragraphs
-        if len('\n'.join(content_parts)) < 800:
-            paragraphs = soup.find_all('p')
-            for p in paragraphs:
-                p_text = self.clean_text(p.get_text())
-                if len(p_text) > 30:
-                    content_parts.append(p_text)
-                    if len('\n'.join(content_parts)) > 4000: break
-        
-        final_content = '\n\n'.join(content_parts)
-        if len(final_content) > 5000:
-            final_content = final_content[:5000] + "... [content truncated]"
-        
-        return final_content if final_content else "No substantial content found."
+        # Pages without prose blocks (listings, tables) fall back to the content selectors
+        content = extraction.extract_main_content(soup) or extraction.extract_by_selectors(soup)
+        return content if content else "No substantial content found."
+
+    def extract_links(self, soup, base_url):
+        """
+        Returns the page's http(s) links as (absolute URL, link text) pairs,
+        without fragments and in page order.
+        """
+        links = []
+        for anchor in soup.find_all('a', href=True):
+            url = urldefrag(urljoin(base_url, anchor['href'].strip())).url
+            if urlparse(url).scheme in ('http', 'https'):
+                links.append((url, self.clean_text(anchor.get_text(' '))))
+                if len(links) >= MAX_LINKS_PER_PAGE:
+                    break
+        return links
+
+    def extract_canonical(self, soup, base_url):
+        link = soup.find('link', rel='canonical', href=True)
+        return urljoin(base_url, link['href'].strip()) if link else None
+
+    async def scrape_single_page(self, url, deadline=None):
+        result, _ = await self.scrape_page_with_links(url, deadline)
+        return result
 
-    async def scrape_single_page(self, browser, url):
-        page = None
+    async def scrape_page_with_links(self, url, deadline=None):
+        """
+        Scrapes a page and also returns its outgoing links, for crawling.
+        Returns (result, links); the result is None if the page failed.
+        """
+        with tracing.span('page', url=url):
+            deadline = deadline or Deadline()
+            # A scrape cut short by its budget is only shared with callers whose budget ends no later
+            return await _page_flight.do(url, self._scrape_single_page, url, deadline, expires_at=deadline.expires_at)
+
+    async def _scrape_single_page(self, url, deadline):
+        # Imported on first use, so the API starts without loading them
+        from bs4 import BeautifulSoup
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+        status = COMPLETE
         try:
-            page = await browser.new_page()
-            await page.set_extra_http_headers({'User-Agent': random.choice(self.user_agents)})
-            await page.goto(url, timeout=30000, wait_until='domcontentloaded')
-            await asyncio.sleep(2)
-            
-            # Handle cookie banners
-            try:
-                for selector in ['button[id*="accept"]', 'button[class*="accept"]', '.cookie-accept']:
+            async with browser_pool.get_pool().page() as page:
+                await page.set_extra_http_headers({'User-Agent': random.choice(self.user_agents)})
+                with time_stage('web', 'navigate'):
+                    async with resilience.guard_for_url(url).acall(wait=deadline.timeout(10)):
+                        try:
+                            await page.goto(url, timeout=deadline.timeout_ms(30), wait_until='domcontentloaded')
+                        except PlaywrightTimeoutError:
+                            if not deadline.expired():
+                                raise
+                            # Out of budget mid-load: keep whatever has rendered so far
+                            status = PARTIAL
+                
+                with time_stage('web', 'wait'):
+                    settle_time = deadline.timeout(2)
+                    if settle_time < 2:
+                        status = PARTIAL
+                    await asyncio.sleep(settle_time)
+                
+                # Handle cookie banners
+                with time_stage('web', 'cookies'):
                     try:
-                        await page.click(selector, timeout=2000)
-                        break
-                    except: continue
-            except: pass
+                        for selector in ['button[id*="accept"]', 'button[class*="accept"]', '.cookie-accept']:
+                            if deadline.expired():
+                                break
+                            try:
+                                await page.click(selector, timeout=deadline.timeout_ms(2))
+                                break
+                            except: continue
+                    except: pass
+                
+                html_content, html_chars, truncated = await browser_pool.page_html(page)
+            BYTES_DOWNLOADED.labels('page').inc(len(html_content.encode('utf-8')))
+            if truncated:
+                PAGES_TRUNCATED.labels('web').inc()
+                log.info("page truncated", url=url, html_chars=html_chars, kept=len(html_content))
+                status = PARTIAL
             
-            html_content = await page.content()
-            soup = BeautifulSoup(html_content, 'html.parser')
+            with time_stage('web', 'parse'):
+                soup = BeautifulSoup(html_content, 'html.parser')
             
             title_element = soup.find('title')
             title = self.clean_text(title_element.get_text()) if title_element else "No title found"
             
-            prices = self.extract_prices(soup, url)
-            content = await self.extract_vast_content(soup)
+            with time_stage('web', 'links'):
+                # Before content extraction, which strips navigation from the soup
+                links = self.extract_links(soup, url)
+                canonical = self.extract_canonical(soup, url)
+            with time_stage('web', 'prices'):
+                prices = self.extract_prices(soup, url)
+            with time_stage('web', 'content'):
+                content = await self.extract_vast_content(soup)
+            # Fingerprinted before price lines are added, as mirrors may show other prices
+            fingerprint = await asyncio.to_thread(dedup.fingerprint, content)
             
             # Add price info to content
             if prices['current_price'] or prices['all_prices']:
@@ -165,47 +224,142 @@ class AdvancedWebScraper:
                 'published_date': 'Unknown',
                 'source': 'Web Search (Playwright)',
                 'site_type': self.detect_site_type(url),
-                'prices': prices
+                'prices': prices,
+                'canonical_url': canonical,
+                'fingerprint': fingerprint,
+                'fetch_status': status
             }
+            await asyncio.to_thread(content_store.attach, result, content)
             
-            await page.close()
-            print(f"  ✅ {url} ({len(content)} chars, {len(prices['all_prices'])} prices)")
-            return result
+            log.info("page scraped", url=url, chars=len(content), prices=len(prices['all_prices']), status=status)
+            return result, links
             
         except Exception as e:
-            print(f"  ❌ {url}: {e}")
-            if page:
-                try: await page.close()
-                except: pass
-            return None
+            log.warning("page failed", url=url, error=repr(e))
+            return None, []
 
-async def search_and_scrape_web(query, num_results=3):
+@coalesced
+def find_urls(query, num_results):
+    """
+    Returns result URLs for a query from Google search.
+    """
+    if SEARCH_API_URL:
+        response = resilience.get(SEARCH_API_URL, params={'q': query, 'num': num_results}, timeout=10)
+        return response.json()['urls'][:num_results]
+    from googlesearch import search
+
+    with resilience.guard(SEARCH_HOST).call():
+        return list(search(query, num_results=num_results))
+
+async def scrape_web(query, num_results=3, deadline=None, page_tasks=None):
+    """
+    Searches the web and scrapes the result pages concurrently.
+
+    More results than ``num_results`` are requested from the search engine.
+    Pages that duplicate an earlier one (same canonical URL or near-identical
+    content) are dropped and the next search result is loaded in their place.
+
+    Pages still loading when the deadline passes are cancelled and reported
+    as skipped; pages cut short by it are returned and marked partial.
+
+    ``page_tasks`` is a dict of URL to scrape task shared between calls, so a
+    page found by several queries is loaded once. Its owner cancels whatever
+    is left in it; this call only waits on those tasks.
+
+    Each result's ``content`` holds the passages of the page that best match
+    the query, with their offsets in ``passages``.
+
+    Returns:
+        A dict with the scraped ``results`` (in search order), ``pages``,
+        mapping the URL of every result or skipped page to its completion
+        state, and ``duplicates``, the pages dropped with the URL each
+        duplicates.
+    """
+    deadline = deadline or Deadline()
     scraper = AdvancedWebScraper()
-    scraped_results = []
     
-    print(f"🔍 Web search: '{query}'")
+    log.info("web search started", query=query)
     
     try:
-        urls_to_scrape = list(search(query, num_results=num_results))
-        print(f"Found {len(urls_to_scrape)} URLs")
+        with tracing.span('search_engine'):
+            urls_found = await asyncio.wait_for(
+                asyncio.to_thread(find_urls, query, num_results + math.ceil(num_results * OVERFETCH_RATIO)),
+                timeout=deadline.remaining()
+            )
+        log.info("urls found", query=query, urls=len(urls_found))
     except Exception as e:
-        print(f"Search error: {e}")
-        return []
+        log.warning("search failed", query=query, error=repr(e))
+        return {'results': [], 'pages': {}, 'duplicates': []}
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-dev-shm-usage'])
-        
-        for i, url in enumerate(urls_to_scrape):
-            print(f"Scraping {i+1}/{len(urls_to_scrape)}")
-            result = await scraper.scrape_single_page(browser, url)
-            if result: scraped_results.append(result)
-            if i < len(urls_to_scrape) - 1: await asyncio.sleep(1)
-        
-        await browser.close()
+    # Mirrors, AMP and mobile copies are dropped before they are loaded
+    dedup_state = dedup.Deduplicator()
+    candidates = deque(url for url in urls_found if dedup_state.check_url(url) is None)
+
+    shared = page_tasks is not None
+    if not shared:
+        page_tasks = {}
+    tasks = {}
+    waiting = {}
+
+    def start_next():
+        url = candidates.popleft()
+        if url not in page_tasks:
+            page_tasks[url] = asyncio.ensure_future(scraper.scrape_single_page(url, deadline))
+        tasks[url] = page_tasks[url]
+        waiting[tasks[url]] = url
+
+    for _ in range(min(num_results, len(candidates))):
+        start_next()
+
+    kept = {}
+    pages = {}
+    try:
+        while waiting:
+            done, _ = await asyncio.wait(waiting, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                url = waiting.pop(task)
+                result = task.result() if not task.cancelled() else None
+                if not result:
+                    pages[url] = SKIPPED
+                elif dedup_state.check_result(url, result) is None:
+                    kept[url] = result
+                    pages[url] = result['fetch_status']
+                elif candidates and not deadline.expired():
+                    # The duplicate's slot goes to the next search result
+                    start_next()
+    except asyncio.CancelledError:
+        if not shared:
+            for task in waiting:
+                task.cancel()
+        raise
+    if not shared:
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+    for url in waiting.values():
+        pages[url] = SKIPPED
+
+    scraped_results = []
+    for url in tasks:
+        if url in kept:
+            # Shared pages are returned to several queries, so each gets its own copy
+            scraped_results.append(dict(kept[url]) if shared else kept[url])
+    # Each result inlines the passages that best answer this query
+    with tracing.span('passages'):
+        await asyncio.to_thread(passages.focus_all, scraped_results, query)
     
-    print(f"✅ Scraped {len(scraped_results)} pages")
-    return scraped_results
+    log.info(
+        "web search finished", query=query, scraped=len(scraped_results), loaded=len(pages),
+        duplicates=len(dedup_state.duplicates)
+    )
+    return {'results': scraped_results, 'pages': pages, 'duplicates': dedup_state.duplicates}
+
+async def search_and_scrape_web(query, num_results=3, deadline=None):
+    report = await scrape_web(query, num_results, deadline)
+    return report['results']
 
 # Async version
-async def search_and_scrape_web_async(query, num_results=3):
-    return await search_and_scrape_web(query, num_results)
\ No newline at end of file
+async def search_and_scrape_web_async(query, num_results=3, deadline=None):
+    return await search_and_scrape_web(query, num_results, deadline)
\ No newline at end of file
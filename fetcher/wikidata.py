@@ -1,103 +1,279 @@
-from SPARQLWrapper import SPARQLWrapper, JSON
 import json
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import os
 
+from fetcher import resilience
+from fetcher.cache import TTLCache
+from fetcher.singleflight import coalesced
+
+WIKIDATA_API_URL = os.environ.get("WIKIDATA_API_URL", "https://www.wikidata.org/w/api.php")
+WIKIDATA_SPARQL_URL = os.environ.get("WIKIDATA_SPARQL_URL", "https://query.wikidata.org/sparql")
+USER_AGENT = 'FetcherBot/1.0 (mailto:transformtrails@gmail.com)'
+
+# wbgetentities accepts at most 50 IDs per request
+MAX_IDS_PER_REQUEST = 50
+
+# Claims worth surfacing in search results, keyed by property ID
+KEY_PROPERTIES = {
+    'P31': 'instance of',
+    'P279': 'subclass of',
+    'P106': 'occupation',
+    'P27': 'country of citizenship',
+    'P17': 'country',
+    'P131': 'located in',
+    'P569': 'date of birth',
+    'P570': 'date of death',
+    'P571': 'inception',
+    'P577': 'publication date',
+    'P856': 'official website',
+}
+
+# Entities and labels change rarely, so a long TTL is fine
+_entity_cache = TTLCache('wikidata.entities', maxsize=5000, ttl=6 * 3600)
+_search_cache = TTLCache('wikidata.search', maxsize=1000, ttl=3600)
+
+def _api_get(params, timeout=5):
+    params = dict(params, format='json')
+    response = resilience.get(WIKIDATA_API_URL, params=params, headers={'User-Agent': USER_AGENT}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def search_entity_ids(entity_name, limit=5, language='en'):
+    """
+    Returns matching item IDs from the lightweight wbsearchentities API.
+    """
+    cache_key = (entity_name.strip().lower(), limit, language)
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    data = _api_get({
+        'action': 'wbsearchentities',
+        'search': entity_name,
+        'language': language,
+        'uselang': language,
+        'type': 'item',
+        'limit': min(limit, MAX_IDS_PER_REQUEST),
+    })
+    ids = [hit['id'] for hit in data.get('search', []) if hit.get('id')]
+    _search_cache.set(cache_key, ids)
+    return ids
+
+def get_entities(ids, language='en', props='labels|descriptions|claims|sitelinks'):
+    """
+    Fetches entities by ID, batching up to 50 IDs per wbgetentities call.
+
+    Entities already in the cache are served without a request.
+
+    Returns:
+        A dict mapping entity ID to the raw entity JSON.
+    """
+    ids = list(dict.fromkeys(ids))
+    cache_keys = {entity_id: (entity_id, language, props) for entity_id in ids}
+    cached = _entity_cache.get_many(cache_keys.values())
+    entities = {entity_id: cached[key] for entity_id, key in cache_keys.items() if key in cached}
+
+    missing = [entity_id for entity_id in ids if entity_id not in entities]
+    for start in range(0, len(missing), MAX_IDS_PER_REQUEST):
+        batch = missing[start:start + MAX_IDS_PER_REQUEST]
+        data = _api_get({
+            'action': 'wbgetentities',
+            'ids': '|'.join(batch),
+            'languages': language,
+            'props': props,
+            'sitefilter': f'{language}wiki',
+        })
+        for entity_id, entity in data.get('entities', {}).items():
+            if 'missing' in entity:
+                continue
+            entities[entity_id] = entity
+            _entity_cache.set(cache_keys.get(entity_id, (entity_id, language, props)), entity)
+
+    return entities
+
+def get_labels(ids, language='en'):
+    """
+    Returns a dict mapping entity IDs to their labels, batched and cached.
+    """
+    entities = get_entities(ids, language=language, props='labels')
+    return {
+        entity_id: entity.get('labels', {}).get(language, {}).get('value', entity_id)
+        for entity_id, entity in entities.items()
+    }
+
+def _claim_value(snak):
+    """
+    Returns a (kind, value) pair for a claim's main snak.
+    """
+    datavalue = snak.get('datavalue')
+    if not datavalue:
+        return None, None
+    value = datavalue.get('value')
+    value_type = datavalue.get('type')
+    if value_type == 'wikibase-entityid':
+        return 'entity', value.get('id')
+    if value_type == 'time':
+        # "+1952-03-11T00:00:00Z" -> "1952-03-11"
+        return 'literal', value.get('time', '').lstrip('+').split('T')[0]
+    if value_type == 'monolingualtext':
+        return 'literal', value.get('text')
+    if value_type == 'quantity':
+        return 'literal', value.get('amount', '').lstrip('+')
+    if value_type == 'globecoordinate':
+        return 'literal', f"{value.get('latitude')}, {value.get('longitude')}"
+    if isinstance(value, str):
+        return 'literal', value
+    return None, None
+
+def _extract_key_claims(entity, max_values=3):
+    claims = {}
+    for prop_id in KEY_PROPERTIES:
+        values = []
+        for statement in entity.get('claims', {}).get(prop_id, []):
+            if statement.get('rank') == 'deprecated':
+                continue
+            kind, value = _claim_value(statement.get('mainsnak', {}))
+            if value:
+                values.append((kind, value))
+            if len(values) >= max_values:
+                break
+        if values:
+            claims[prop_id] = values
+    return claims
+
+def _to_result(entity_id, entity, claims, labels):
+    label = entity.get('labels', {}).get('en', {}).get('value')
+    description = entity.get('descriptions', {}).get('en', {}).get('value', '')
+
+    # Filter out low-quality results
+    if not label or not description or len(description) < 10:
+        return None
+
+    key_claims = {}
+    for prop_id, values in claims.items():
+        key_claims[KEY_PROPERTIES[prop_id]] = [
+            labels.get(value, value) if kind == 'entity' else value
+            for kind, value in values
+        ]
+
+    content = description
+    if key_claims:
+        facts = '. '.join(f"{name.capitalize()}: {', '.join(values)}" for name, values in key_claims.items())
+        content = f"{description}. {facts}"
+
+    wiki_title = entity.get('sitelinks', {}).get('enwiki', {}).get('title')
+    item_url = f"http://www.wikidata.org/entity/{entity_id}"
+
+    return {
+        'url': item_url,
+        'title': label,
+        'author': 'Wikidata Contributors',
+        'content': content,
+        'summary': description,
+        'published_date': 'Updated continuously',
+        'source': 'Wikidata',
+        'wikidata_id': item_url,
+        'claims': key_claims,
+        'wikipedia_title': wiki_title
+    }
+
+def search_wikidata_many(entity_names, limit=5):
+    """
+    Searches Wikidata for several entity names at once.
+
+    Each name costs one wbsearchentities call; the matched items of every
+    name are then hydrated together, so entities shared between names are
+    fetched once.
+
+    Returns:
+        A dict mapping each name to its list of results.
+    """
+    ids_by_name = {}
+    for name in entity_names:
+        try:
+            print(f"Querying Wikidata for: {name}")
+            ids_by_name[name] = search_entity_ids(name, limit)
+        except Exception as e:
+            print(f"An error occurred during Wikidata lookup for '{name}': {e}")
+            ids_by_name[name] = []
+
+    all_ids = list(dict.fromkeys(entity_id for ids in ids_by_name.values() for entity_id in ids))
+    if not all_ids:
+        return {name: [] for name in entity_names}
+
+    try:
+        entities = get_entities(all_ids)
+        claims_by_id = {entity_id: _extract_key_claims(entity) for entity_id, entity in entities.items()}
+
+        # Resolve the labels of every entity referenced by a claim in one pass
+        referenced_ids = {
+            value for claims in claims_by_id.values()
+            for values in claims.values()
+            for kind, value in values if kind == 'entity'
+        }
+        labels = get_labels(referenced_ids) if referenced_ids else {}
+    except Exception as e:
+        print(f"An error occurred during Wikidata lookup: {e}")
+        return {name: [] for name in entity_names}
+
+    results_by_name = {}
+    for name in entity_names:
+        results_data = []
+        for entity_id in ids_by_name.get(name, []):
+            entity = entities.get(entity_id)
+            if not entity:
+                continue
+            result = _to_result(entity_id, entity, claims_by_id.get(entity_id, {}), labels)
+            if result:
+                results_data.append(result)
+        results_by_name[name] = results_data
+    return results_by_name
+
+@coalesced
 def search_wikidata(entity_name, limit=5):
     """
-    Searches Wikidata for entities with a given name using its SPARQL endpoint.
-    """
-    # Configure requests session with timeout and retry strategy
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=2,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    
-    sparql = SPARQLWrapper("https://query.wikidata.org/sparql",
-                           agent='FetcherBot/1.0 (mailto:transformtrails@gmail.com)')
-    
-    # This query uses the MediaWiki API service to search for entities.
-    query = f"""
-    SELECT ?item ?itemLabel ?itemDescription WHERE {{
-      SERVICE wikibase:mwapi {{
-        bd:serviceParam wikibase:api "EntitySearch".
-        bd:serviceParam wikibase:endpoint "www.wikidata.org".
-        bd:serviceParam mwapi:search "{entity_name}".
-        bd:serviceParam mwapi:language "en".
-        ?item wikibase:apiOutputItem mwapi:item.
-      }}
-      ?item wdt:P31 ?type. # To ensure it's an instance of something.
-      SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
-    }}
-    LIMIT {limit}
+    Searches Wikidata for entities with a given name.
+
+    Uses wbsearchentities to find matching items, then a single batched
+    wbgetentities call to hydrate labels, descriptions and key claims.
+    """
+    return search_wikidata_many([entity_name], limit)[entity_name]
+
+def sparql_literal(value):
+    """
+    Escapes a Python string for use as a SPARQL string literal.
     """
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+    return f'"{escaped}"'
 
+def run_sparql_query(query, timeout=10):
+    """
+    Runs a structured SPARQL query against the Wikidata query service.
+
+    Reserved for structured questions (joins, filters over properties); plain
+    name lookups should go through search_wikidata. Interpolate user input
+    only via sparql_literal.
+
+    Returns:
+        A list of dicts mapping each bound variable to its value.
+    """
+    from SPARQLWrapper import SPARQLWrapper, JSON
+
+    sparql = SPARQLWrapper(WIKIDATA_SPARQL_URL, agent=USER_AGENT)
     sparql.setQuery(query)
     sparql.setReturnFormat(JSON)
-    sparql.setTimeout(5)  # Further reduced timeout to 5 seconds
+    sparql.setTimeout(timeout)
 
-    results_data = []
     try:
-        print(f"Querying Wikidata for: {entity_name}")
-        results = sparql.query().convert()
-
-        for result in results["results"]["bindings"]:
-            item_id = result.get('item', {}).get('value', '')
-            label = result.get('itemLabel', {}).get('value', 'No label')
-            description = result.get('itemDescription', {}).get('value', 'No description available')
-            
-            # Filter out low-quality results
-            if (label == 'No label' or 
-                label.startswith('Q') and label[1:].isdigit() or  # Skip Q-numbers without proper labels
-                description == 'No description available' or
-                len(description) < 10):
-                continue
-            
-            results_data.append({
-                'url': item_id,
-                'title': label,
-                'author': 'Wikidata Contributors',
-                'content': description,
-                'summary': description,
-                'published_date': 'Updated continuously',
-                'source': 'Wikidata',
-                'wikidata_id': item_id
-            })
-
+        with resilience.guard_for_url(WIKIDATA_SPARQL_URL).call(wait=timeout):
+            results = sparql.query().convert()
     except Exception as e:
         print(f"An error occurred during Wikidata SPARQL query: {e}")
-        # Try a simpler fallback query if the main one fails
-        try:
-            print("Trying simplified Wikidata query...")
-            simple_query = f"""
-            SELECT ?item ?itemLabel WHERE {{
-              ?item rdfs:label "{entity_name}"@en .
-              SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
-            }}
-            LIMIT {limit}
-            """
-            sparql.setQuery(simple_query)
-            sparql.setTimeout(5)  # Even shorter timeout for fallback
-            results = sparql.query().convert()
-            
-            for result in results["results"]["bindings"]:
-                results_data.append({
-                    'source': 'Wikidata (Fallback)',
-                    'id': result.get('item', {}).get('value'),
-                    'label': result.get('itemLabel', {}).get('value'),
-                    'description': 'No description available'
-                })
-        except Exception as fallback_e:
-            print(f"Fallback Wikidata query also failed: {fallback_e}")
-            return []
-
-    return results_data
+        return []
+
+    return [
+        {name: binding.get('value') for name, binding in row.items()}
+        for row in results.get('results', {}).get('bindings', [])
+    ]
 
 if __name__ == "__main__":
     search_query = "Douglas Adams"
@@ -110,4 +286,4 @@ if __name__ == "__main__":
         print(f"Saved {len(scraped_entities)} results to {filename}")
 
         for entity in scraped_entities:
-            print(f"\nLabel: {entity['label']}\nDescription: {entity['description']}\nID: {entity['id']}") 
\ No newline at end of file
+            print(f"\nLabel: {entity['title']}\nDescription: {entity['summary']}\nID: {entity['wikidata_id']}")
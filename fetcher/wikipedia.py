@@ -1,48 +1,214 @@
-import wikipediaapi
 import json
+import os
 
-def get_wikipedia_articles(queries):
+from fetcher import content_store, passages, resilience
+from fetcher.cache import TTLCache
+from fetcher.singleflight import coalesced
+
+WIKIPEDIA_API_URL = os.environ.get("WIKIPEDIA_API_URL", "https://en.wikipedia.org/w/api.php")
+USER_AGENT = 'MyCoolBot/1.0 (https://example.com/bot; transformtrails@gmail.com)'
+
+# The extracts module only returns intro extracts for up to 20 pages at once
+MAX_TITLES_PER_REQUEST = 20
+
+_extract_cache = TTLCache('wikipedia.extracts', maxsize=2000, ttl=3600)
+_full_text_cache = TTLCache('wikipedia.full_text', maxsize=200, ttl=3600)
+
+def _api_get(params, timeout=8):
+    params = dict(params, action='query', format='json', formatversion=2)
+    response = resilience.get(WIKIPEDIA_API_URL, params=params, headers={'User-Agent': USER_AGENT}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def search_titles(query, limit=3):
+    """
+    Returns the titles of the best matching articles for a free-text query.
+    """
+    data = _api_get({
+        'list': 'search',
+        'srsearch': query,
+        'srlimit': limit,
+        'srprop': '',
+        'srwhat': 'text',
+    })
+    return [hit['title'] for hit in data.get('query', {}).get('search', [])]
+
+def get_extracts(titles):
+    """
+    Fetches the plain-text lead section and URL for several titles at once.
+
+    Returns:
+        A dict mapping each requested title to its page data.
+    """
+    titles = list(dict.fromkeys(titles))
+    pages = _extract_cache.get_many(titles)
+
+    missing = [title for title in titles if title not in pages]
+    for start in range(0, len(missing), MAX_TITLES_PER_REQUEST):
+        batch = missing[start:start + MAX_TITLES_PER_REQUEST]
+        data = _api_get({
+            'titles': '|'.join(batch),
+            'prop': 'extracts|info',
+            'exintro': 1,
+            'explaintext': 1,
+            'exlimit': len(batch),
+            'inprop': 'url',
+            'redirects': 1,
+        })
+        query = data.get('query', {})
+
+        # Map normalized/redirected titles back to the ones we asked for
+        aliases = {}
+        for mapping in query.get('normalized', []) + query.get('redirects', []):
+            aliases[mapping['to']] = aliases.get(mapping['from'], mapping['from'])
+
+        for page in query.get('pages', []):
+            if page.get('missing') or page.get('invalid'):
+                continue
+            page_data = {
+                'pageid': page.get('pageid'),
+                'title': page.get('title'),
+                'url': page.get('fullurl'),
+                'extract': page.get('extract', ''),
+            }
+            requested = aliases.get(page['title'], page['title'])
+            pages[requested] = page_data
+            _extract_cache.set(requested, page_data)
+
+    return pages
+
+def get_full_text(pageid):
+    """
+    Fetches the complete plain-text body of an article by page ID.
+    """
+    text = _full_text_cache.get(pageid)
+    if text is not None:
+        return text
+
+    data = _api_get({
+        'pageids': pageid,
+        'prop': 'extracts',
+        'explaintext': 1,
+    })
+    pages = data.get('query', {}).get('pages', [])
+    text = pages[0].get('extract', '') if pages else ''
+    text = text.replace('\n\n', '\n').strip()
+    _full_text_cache.set(pageid, text)
+    return text
+
+def load_content(handle):
+    """
+    Resolves a ``content_handle`` from a Wikipedia result to the article's
+    full text, or None if the handle is not one.
+    """
+    prefix, _, pageid = handle.partition(':')
+    if prefix != 'wikipedia' or not pageid.isascii() or not pageid.isdigit():
+        return None
+    return get_full_text(int(pageid))
+
+content_store.register_loader('wikipedia', load_content)
+
+def _to_article(page, query):
+    content = page['extract'].replace('\n\n', '\n').strip()
+    if not content:
+        return None
+
+    # The lead section is only a preview; the handle loads the whole article.
+    # It is the article's start, so passage offsets hold for the full text.
+    article = {
+        'url': page['url'],
+        'title': page['title'],
+        'author': 'Wikipedia Contributors',
+        'content': content_store.snippet(content),
+        'summary': content_store.snippet(content.replace('\n', ' ')),
+        'published_date': 'Updated continuously',
+        'source': 'Wikipedia',
+        'content_handle': f"wikipedia:{page['pageid']}"
+    }
+    return passages.focus_text(article, query, content)
+
+def get_articles_by_query(queries, max_results=3):
+    """
+    Fetches Wikipedia articles for several queries, keeping them apart.
+
+    Each query costs one search request, and the lead sections of all matched
+    titles are fetched together. Each article's content is the passages of
+    its lead section that best answer the query.
+
+    Returns:
+        A dict mapping each query to its list of articles.
+    """
+    titles_by_query = {}
+    for query in queries:
+        try:
+            titles = search_titles(query, max_results)
+        except Exception as e:
+            print(f"An error occurred while searching Wikipedia for '{query}': {e}")
+            continue
+        if not titles:
+            print(f"No Wikipedia articles found for '{query}'.")
+        titles_by_query[query] = titles
+
+    all_titles = [title for titles in titles_by_query.values() for title in titles]
+    if not all_titles:
+        return {query: [] for query in queries}
+
+    try:
+        pages = get_extracts(all_titles)
+    except Exception as e:
+        print(f"An error occurred while fetching Wikipedia extracts: {e}")
+        return {query: [] for query in queries}
+
+    articles_by_query = {}
+    for query in queries:
+        articles = []
+        seen = set()
+        for title in titles_by_query.get(query, []):
+            page = pages.get(title)
+            if not page or page['pageid'] in seen:
+                continue
+            seen.add(page['pageid'])
+            article = _to_article(page, query)
+            if article:
+                articles.append(article)
+        articles_by_query[query] = articles
+    return articles_by_query
+
+@coalesced
+def get_wikipedia_articles(queries, max_results=3):
     """
     Fetches Wikipedia articles and returns their data.
 
+    Each query costs one search request, and the lead sections of all matched
+    titles are fetched together. Each article's content is the passages of
+    its lead section that best answer its query; use the result's
+    ``content_handle`` with load_content for the full text.
+
     Args:
         queries (list): A list of search terms for Wikipedia articles.
-        
+        max_results (int): Maximum number of articles per query.
+
     Returns:
         A list of dictionaries, each representing an article.
     """
-    wiki_wiki = wikipediaapi.Wikipedia(
-        user_agent='MyCoolBot/1.0 (https://example.com/bot; transformtrails@gmail.com)',
-        language='en',
-        timeout=8
-    )
-    
     articles = []
-    for query in queries:
-        page = wiki_wiki.page(query)
-
-        if not page.exists():
-            print(f"Wikipedia page '{query}' not found.")
-            continue
-            
-        # Clean and truncate content
-        content = page.text.replace('\n\n', '\n').strip()
-        if len(content) > 3000:
-            content = content[:3000] + "..."
-        
-        # Clean and truncate summary
-        summary = page.summary.replace('\n', ' ').strip()
-        if len(summary) > 800:
-            summary = summary[:800] + "..."
-        
-        articles.append({
-            'url': page.fullurl,
-            'title': page.title,
-            'author': 'Wikipedia Contributors',
-            'content': content,
-            'summary': summary,
-            'published_date': 'Updated continuously',
-            'source': 'Wikipedia'
-        })
-            
+    seen = set()
+    for query_articles in get_articles_by_query(queries, max_results).values():
+        for article in query_articles:
+            if article['content_handle'] not in seen:
+                seen.add(article['content_handle'])
+                articles.append(article)
     return articles
+
+if __name__ == "__main__":
+    search_query = "transformer neural network"
+    found_articles = get_wikipedia_articles([search_query])
+
+    if found_articles:
+        filename = "wikipedia_results.json"
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(found_articles, f, ensure_ascii=False, indent=4)
+        print(f"Saved {len(found_articles)} results to {filename}")
+
+        for article in found_articles:
+            print(f"\nTitle: {article['title']}\nURL: {article['url']}\nSummary: {article['summary'][:200]}")